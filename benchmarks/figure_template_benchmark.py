@@ -0,0 +1,54 @@
+""" Benchmarks drawing the open/closed trade graphs from their precompiled templates, against drawing a Plotly figure
+    and calling to_json() on every call as was done before.
+
+    Run from the root of the repository: python -m benchmarks.figure_template_benchmark """
+
+import timeit
+import types
+import numpy as np
+import pandas as pd
+from src.data_validators import date_validator
+from src.trades import graph_composer
+
+
+def create_closed_trade(num_days=60, seed=0):
+    """ Creates a closed trade holding a few months of historical data. """
+    rng = np.random.default_rng(seed)
+    dates = pd.DatetimeIndex(pd.bdate_range(end="2021-03-01", periods=num_days), name="date")
+    historical_data = pd.DataFrame({"close": 100 + np.cumsum(rng.normal(0, 1, num_days))}, index=dates)
+    return types.SimpleNamespace(buy_date=dates[-20], sell_date=dates[-1], buy_price=historical_data['close'][-20],
+                                 sell_price=historical_data['close'][-1], historical_data=historical_data)
+
+
+def previous_open_trade_graph(trade):
+    """ Draws the open trade graph with Plotly, as was done before the templates. """
+    fig, cp_percent = graph_composer.draw_open_trade_graph(trade)
+    return graph_composer._draw_open_trade_figure(cp_percent, graph_composer._open_trade_graph_colour(cp_percent))
+
+
+def previous_closed_trade_graph(trade):
+    """ Draws the closed trade graph with Plotly, as was done before the templates. """
+    line_colour = "mediumseagreen" if trade.sell_price > trade.buy_price else "rgb(211,63,73)"
+    trim_date = date_validator.validate_date(trade.buy_date - pd.Timedelta(weeks=2), 1)
+    trimmed_data = trade.historical_data[trim_date:trade.sell_date]
+    return graph_composer._draw_closed_trade_figure(trimmed_data.index, trimmed_data['close'].values,
+                                                    [trade.buy_date, trade.sell_date],
+                                                    [trade.buy_price, trade.sell_price], line_colour)
+
+
+def main():
+    open_trade = types.SimpleNamespace(buy_price=100.0, current_price=101.3, take_profit=102.0, stop_loss=99.0)
+    closed_trade = create_closed_trade()
+    cases = (("open trade graph", open_trade, previous_open_trade_graph, graph_composer.draw_open_trade_graph),
+             ("closed trade graph", closed_trade, previous_closed_trade_graph, graph_composer.draw_closed_trade_graph))
+    for name, trade, previous, templated in cases:
+        runs = 200
+        # Draw once so that the template is compiled before timing.
+        templated(trade)
+        for label, draw in (("previous", previous), ("template", templated)):
+            seconds = timeit.timeit(lambda: draw(trade), number=runs) / runs
+            print(f"{name:<20}  {label:<8}  {seconds * 1e6:10.1f} us per call")
+
+
+if __name__ == "__main__":
+    main()
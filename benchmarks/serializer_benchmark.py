@@ -0,0 +1,92 @@
+""" Benchmarks encoding trades for the data access API with the serializer, against the previous path of deep-copying
+    the trade's fields, converting the dataframe and figure, and encoding the result with the stdlib json module as
+    requests does.
+
+    Run from the root of the repository: python -m benchmarks.serializer_benchmark """
+
+import copy
+import datetime as dt
+import importlib
+import json
+import timeit
+import numpy as np
+import pandas as pd
+from src.strategy.technical_analysis import BaseTechnicalAnalysisModule
+from src.data_handlers import serializer
+from src.trades import graph_composer
+from src.trades.trade import Trade
+from src.trades.figure_model import MARKERS_ROLE, TAKE_PROFIT_ROLE
+
+MA_CONFIG = {"shortTermType": "SMA", "shortTermDayPeriod": 5, "longTermType": "SMA", "longTermDayPeriod": 20}
+BB_CONFIG = {"dayPeriod": 20}
+
+
+def create_strategy():
+    """ Wraps the blank analysis in the Moving Averages and Bollinger Bands modules, as a strategy would. """
+    ma = importlib.import_module("src.strategy.technical_analysis_modules.Moving Averages.wrapper").MovingAverages
+    bb = importlib.import_module("src.strategy.technical_analysis_modules.Bollinger Bands.wrapper").BollingerBands
+    return bb(ma(BaseTechnicalAnalysisModule(), MA_CONFIG), BB_CONFIG)
+
+
+def create_trades(num_trades, num_days=12 * 5, seed=0):
+    """ Creates trades with figures drawn by the analysis modules on flat prices that drop on the last day. """
+    rng = np.random.default_rng(seed)
+    analysis = create_strategy()
+    trades = []
+    while len(trades) < num_trades:
+        closes = rng.normal(100, 2, size=num_days)
+        closes[-21] = rng.uniform(80, 100)
+        closes[-1] = rng.uniform(85, 100)
+        dates = pd.DatetimeIndex(pd.bdate_range(end="2021-03-01", periods=num_days), name="date")
+        df = pd.DataFrame({"open": closes, "high": closes * 1.01, "low": closes * 0.99, "close": closes,
+                           "volume": rng.integers(1e5, 1e6, size=num_days).astype(float), "adj_close": closes},
+                          index=dates)
+        df.attrs['triggered_indicators'] = []
+        df, fig = analysis.analyse_data(df)
+        if not df.attrs['triggered_indicators']:
+            continue
+        buy_price = closes[-1]
+        fig.add_trace(MARKERS_ROLE, "scatter", dict(x=[dates[-1]], y=[buy_price]), mode="markers", name="buysell")
+        fig.add_trace(TAKE_PROFIT_ROLE, "scatter", dict(x=[dates[-2], dates[-1] + dt.timedelta(days=7)],
+                                                        y=[buy_price * 1.02] * 2), mode="lines", name="TP/SL")
+        trade = Trade(backtest_id=1, ticker=f"T{len(trades)}", historical_data=df, buy_date=dates[-1],
+                      buy_price=buy_price, share_qty=10, investment_total=buy_price * 10,
+                      take_profit=buy_price * 1.02, stop_loss=buy_price * 0.99,
+                      triggered_indicators=df.attrs['triggered_indicators'], figure=fig)
+        trade.simpleFigure, trade.figure_pct = graph_composer.draw_open_trade_graph(trade)
+        trades.append(trade)
+    return trades
+
+
+def previous_path(trades):
+    """ Encodes trades as they were before the serializer: a deep copy of every field, the dataframe converted with
+        to_dict, the figure with to_json, and the body encoded by the stdlib json module. """
+    json_trades = []
+    for trade in trades:
+        trade_dict = copy.deepcopy({name: getattr(trade, name) for name, _ in Trade.json_schema})
+        trade_dict['buy_date'] = str(trade_dict["buy_date"])
+        trade_dict['sell_date'] = str(trade_dict["sell_date"])
+        trade_dict['historical_data'].index = trade_dict['historical_data'].index.strftime('%Y-%m-%d %H:%M:%S').copy()
+        trade_dict['historical_data'].reset_index(level="date", inplace=True)
+        trade_dict['historical_data'] = trade_dict['historical_data'].to_dict(orient="list")
+        trade_dict['figure'] = trade_dict['figure'].to_figure().to_json()
+        json_trades.append(trade_dict)
+    return json.dumps({"open_trades": json_trades, "closed_trades": []}).encode('utf-8')
+
+
+def serializer_path(trades):
+    """ Encodes trades with the serializer. """
+    return serializer.dumps({"open_trades": [trade.to_JSON_serializable() for trade in trades], "closed_trades": []})
+
+
+def main():
+    for num_trades in (1, 5, 20):
+        trades = create_trades(num_trades)
+        for name, path in (("previous", previous_path), ("serializer", serializer_path)):
+            runs = 10
+            seconds = timeit.timeit(lambda: path(trades), number=runs) / runs
+            print(f"{num_trades:>3} trades  {name:<10}  {seconds * 1000:8.2f} ms  {len(path(trades)):>9} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+""" Runs a backtest headless, without the data access API or the UI, so that backtests can be batch run on a server and
+    the throughput of the backtest engine can be measured. The settings and strategy configuration are read from local
+    JSON files in the formats used by the API's /backtest_settings and /strategies endpoints, the backtest is run
+    unpaced, and its results are written to local columnar files by a ResultSink.
+
+    py headless.py settings.json strategy.json --output results/run_1
+
+    With --simulations, the backtest is instead run as many simulations with different random trade choices, and the
+    distribution of their results is written to the output directory.
+
+    py headless.py settings.json strategy.json --simulations 500 --seed 1 --output results/run_1
+
+    With --checkpoint-days, the state of the backtest is checkpointed to the output directory every N days, and a
+    backtest that was stopped part way through is carried on from its last checkpoint by running it again with --resume.
+
+    py headless.py settings.json strategy.json --checkpoint-days 20 --output results/run_1 --resume
+
+    With --cache, a backtest with a seed that has already been run with the same settings, strategy and historical data
+    has its results copied from the result cache directory rather than being run again.
+
+    py headless.py settings.json strategy.json --seed 1 --cache result_cache --output results/run_1
+"""
+from src.data_handlers.historical_data_handler import HistoricalDataHandler
+from src.data_handlers.market_data_store import MarketDataStore
+from src.data_handlers.result_sink import ResultSink
+from src.backtest.backtest import Backtest
+from src.backtest.monte_carlo import MonteCarloBacktest
+from src.backtest.result_cache import ResultCache
+import config
+import argparse
+import datetime as dt
+import json
+import logging as log
+
+
+def parse_date(value):
+    """ Parses a date in the settings, either in the format the API sends dates in or as a plain 'YYYY-MM-DD' date.
+
+    :param value: A string holding the date.
+    :return: A datetime object.
+    """
+    try:
+        return dt.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
+    except ValueError:
+        return dt.datetime.strptime(value, '%Y-%m-%d')
+
+
+def load_settings(settings_path, strategy_path):
+    """ Reads the settings of a backtest and its strategy configuration from JSON files.
+
+    :param settings_path: The path of the settings file.
+    :param strategy_path: The path of the strategy configuration file.
+    :return: A dict holding the settings, with the strategy configuration under 'strategy'.
+    """
+    with open(settings_path) as f:
+        settings = json.load(f)
+    with open(strategy_path) as f:
+        settings['strategy'] = json.load(f)
+    settings['startDate'] = parse_date(settings['startDate'])
+    settings['endDate'] = parse_date(settings['endDate'])
+    settings.setdefault('strategyId', settings['strategy'].get('strategyId', 0))
+    return settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a backtest without the data access API.")
+    parser.add_argument("settings", help="JSON file holding the backtest settings.")
+    parser.add_argument("strategy", help="JSON file holding the strategy configuration.")
+    parser.add_argument("--output", default="results", help="Directory to write the results to.")
+    parser.add_argument("--flush-days", type=int, default=50, help="Number of days between results being written.")
+    parser.add_argument("--download", action="store_true", help="Download/update the historical data first.")
+    parser.add_argument("--simulations", type=int, default=None, help="Number of simulations to run together.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random trade choices.")
+    parser.add_argument("--checkpoint-days", type=int, default=None, help="Number of days between checkpoints.")
+    parser.add_argument("--resume", action="store_true", help="Carry on from the last checkpoint in the output.")
+    parser.add_argument("--cache", default=None, help="Directory of the result cache to reuse earlier results from.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level, per-day logging slows the backtest.")
+    return parser.parse_args()
+
+
+# Main code
+if __name__ == '__main__':
+    args = parse_args()
+    config.logging_config()
+    log.getLogger().setLevel(args.log_level)
+    log.getLogger("trade_handler").setLevel(args.log_level)
+
+    settings = load_settings(args.settings, args.strategy)
+    # The tickers can be listed in the settings, otherwise every ticker in the market index is used.
+    hist_data_mgr = HistoricalDataHandler(start_date=dt.datetime(2009, 1, 1), market_index=settings['marketIndex'],
+                                          max_threads=7)
+    tickers = settings.get('tickers') or hist_data_mgr.get_tickers()
+    if args.download:
+        hist_data_mgr.multithreaded_data_download(tickers)
+    # Each ticker's data is read from the database once and held in memory, rather than queried every day.
+    market_data = MarketDataStore(hist_data_mgr)
+
+    if args.simulations:
+        simulations = MonteCarloBacktest(settings, args.simulations, seed=args.seed, market_data=market_data)
+        simulations.run(tickers)
+        simulations.write_results(args.output)
+    else:
+        if args.checkpoint_days:
+            settings['checkpointDays'] = args.checkpoint_days
+        if args.seed is not None:
+            settings['seed'] = args.seed
+        cache = ResultCache(args.cache, hist_data_mgr) if args.cache else None
+        if cache is not None:
+            cache.evict_stale()
+        key = cache.key(settings, tickers) if cache is not None else None
+        if key is None or not cache.fetch(key, args.output):
+            backtest = Backtest(settings, sink=ResultSink(args.output, flush_days=args.flush_days),
+                                market_data=market_data)
+            backtest.start_backtest(tickers, resume=args.resume)
+            backtest.ledger.close()
+            if key is not None and backtest.backtest_date >= settings['endDate']:
+                cache.store(key, args.output)
+    log.info(f"Results written to '{args.output}'")
@@ -1,6 +1,10 @@
 from src.data_handlers.historical_data_handler import HistoricalDataHandler
 from src.data_handlers import request_handler
 from src.backtest.backtest import BacktestController
+from src.backtest.result_cache import ResultCache
+from src.exceptions.custom_exceptions import APIConnectionError
+from src.jobs.broker import SQLiteBroker
+from src.jobs.worker import JobWorker
 import src.deadline_reminder as deadline_reminder
 import config
 import sys
@@ -17,6 +21,7 @@ import os
 sio = socketio.Client()
 config.logging_config()
 backtest_controller = None
+job_worker = None
 
 
 @sio.event
@@ -65,12 +70,23 @@ def get_analysis_modules(req):
 
 def handle_exit(signum, frame):
     """ Called when the application is manually stopped (CTRL+C, PyCharm 'STOP', etc.). """
+    if job_worker is not None:
+        # A worker is not connected to the api, its running job is returned to the queue for another worker.
+        job_worker.stop()
+        worker_thread.join()
+        log.info("Worker shutting down")
+        sys.exit()
+
     if backtest_controller is not None:
         thread = Thread(target=backtest_controller.stop_backtest)
         thread.start()
         thread.join()
 
-    request_handler.patch("/backtest_settings/available", {"backtestOnline": 0})
+    try:
+        request_handler.patch("/backtest_settings/available", {"backtestOnline": 0})
+    except APIConnectionError:
+        log.error("Could not mark the back-end as offline")
+    request_handler.close_session()
     time.sleep(0.5)
     sio.disconnect()
     log.info("Back-end shutting down")
@@ -91,9 +107,27 @@ if __name__ == '__main__':
     tickers = hist_data_mgr.get_tickers()
     hist_data_mgr.multithreaded_data_download(tickers)
 
+    # In worker mode ('py main.py worker jobs.db'), the backtest jobs queued in the job queue file are run headless.
+    # The results of jobs with a seed are cached in the result cache directory ('py main.py worker jobs.db cache_dir'),
+    # whose entries for data changed by the download above are removed.
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        result_cache = ResultCache(sys.argv[3] if len(sys.argv) > 3 else "result_cache", hist_data_mgr)
+        result_cache.evict_stale()
+        job_worker = JobWorker(SQLiteBroker(sys.argv[2] if len(sys.argv) > 2 else "jobs.db"), tickers,
+                               cache=result_cache)
+        worker_thread = Thread(target=job_worker.run)
+        worker_thread.start()
+        while 1:  # Forces main thread to stay alive, so that the signal handler still exists.
+            time.sleep(1)
+
     # Read command line argument to determine what environment URL to hit for the data access api.
     environment = str(sys.argv[1]) if len(sys.argv) == 2 else "prod"
     request_handler.set_environment(sio, environment)
+    # Find out whether each day's updates can be sent to the api together, in one batch request.
+    try:
+        request_handler.check_batch_support()
+    except APIConnectionError as e:
+        log.error(f"Could not check whether batched requests are supported, sending requests separately: {e}")
 
     # Set up backtest controller, which handles all backtest operations (restarts etc.)
     backtest_controller = BacktestController(sio, tickers)
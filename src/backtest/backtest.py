@@ -1,61 +1,194 @@
 import datetime as dt
-from src.exceptions.custom_exceptions import TradeCreationError, TradeAnalysisError
-from src.trades.graph_composer import create_initial_profit_loss_figure
-from src.data_handlers import request_handler
+from src.exceptions.custom_exceptions import TradeCreationError, TradeAnalysisError, APIConnectionError
+from src.trades import graph_composer
+from src.trades.growable_array import GrowableArray
+from src.data_handlers import request_handler, serializer
+from src.data_handlers.publisher import Publisher, LocalPublisher
+from src.data_handlers.socket_stream import SocketStream
+from src.data_handlers.historical_data_handler import HistoricalDataHandler
+from src.data_handlers.market_data_store import MarketDataStore
+from src.backtest.pacing import create_pacing, UICadence, UNTHROTTLED, REAL_TIME
+from src.backtest.control import BacktestControl, ACTIVE
+from src.backtest.checkpoint import Checkpointer
 from src.data_validators import date_validator
 from src.trades.trade_handler import TradeHandler
-from threading import Thread
+from src.trades.ledger import PortfolioLedger
+from threading import Thread, RLock
 import logging
+import os
+import random
 import time
-import copy
 
 logger = logging.getLogger("backtest")
 
+# The number of finished backtests kept by the controller, so that the UI can still request their trade figures.
+MAX_FINISHED_BACKTESTS = 2
 
-class Backtest:
 
-    def __init__(self, settings):
+class Backtest:
+    # The fields sent to the api, and how each one is converted.
+    json_schema = (
+        ("start_date", serializer.date_string),
+        ("_end_date", serializer.date_string),
+        ("backtest_date", serializer.date_string),
+        ("start_balance", None),
+        ("total_balance", None),
+        ("available_balance", None),
+        ("total_profit_loss", None),
+        ("total_profit_loss_pct", None),
+        ("max_cap_pct_per_trade", None),
+        ("tp_limit", None),
+        ("sl_limit", None),
+        ("market_index", None),
+        ("strategy_id", None),
+        ("_is_paused", None),
+        ("total_profit_loss_graph", None),
+        ("state", None),
+        ("backtest_id", None)
+    )
+
+    def __init__(self, settings, socket=None, sink=None, market_data=None):
         """ Constructor that instantiates the backtest object and simultaneously calls upon the backtest
             initialisation endpoint in the data access api.
 
         :param properties: a dict object holding all properties of the backtest.
+        :param socket: The socket connection established for the application, used to stream updates if enabled.
+        :param sink: A ResultSink object to write the results to when the backtest is run headless, without the api.
+        :param market_data: The MarketDataStore shared by the backtests run together, the historical data is read from
+            the database by the backtest itself if not given.
         """
         self.start_date = settings['startDate']
         self._end_date = settings['endDate']
         self.backtest_date = self.start_date
         self.start_balance = settings['startBalance']
-        self.total_balance = self.start_balance
-        self.available_balance = self.start_balance
-        self.total_profit_loss = 0
-        self.total_profit_loss_pct = 0
         self.max_cap_pct_per_trade = settings['capPct']
         self.tp_limit = settings['takeProfit']
         self.sl_limit = settings['stopLoss']
         self.market_index = settings['marketIndex']
         self.strategy_id = settings['strategyId']
-        self._is_paused = request_handler.get("/backtest_settings/is_paused").json().get("isPaused")
-        self.total_profit_loss_graph = create_initial_profit_loss_figure(self.start_date,
-                                                                         self.start_balance)
-        self.state = "active"
+        # The strategy configuration, when it is given with the settings rather than being fetched from the api.
+        self.strategy_config = settings.get('strategy')
+        # The day's trade is picked at random from the potential trades, repeatably if the settings give a seed.
+        self.seed = settings.get('seed')
+        self.rng = random.Random(self.seed)
+        # Where the strategy and trade handler read the historical data from.
+        self.market_data = market_data or HistoricalDataHandler(start_date=self.start_date)
+        # A headless backtest writes its results to the sink rather than sending them to the api, and is not paced.
+        self.sink = sink
+        self.headless = sink is not None
+        # How fast the backtest runs through its days, and how often its state is sent to the UI. Whether the current
+        # day is sent to the UI is held in ui_frame.
+        self.pacing = create_pacing(settings, default=UNTHROTTLED if self.headless else REAL_TIME)
+        self.ui_cadence = UICadence(settings.get('uiFramesPerSecond'))
+        self.ui_frame = True
+        # In fast mode, open trades are not updated in the UI every day and are only processed on their exit dates.
+        self.fast_mode = settings.get('fastMode', False)
+        # With delta updates, open trades are sent to the api as patches holding only what changed each day.
+        self.delta_updates = settings.get('deltaUpdates', False)
+        # With deferred figures, trade figures are not sent with the trades and are only rendered when the UI requests
+        # them, so they are kept for closed trades until the backtest is discarded.
+        self.deferred_figures = settings.get('deferredFigures', False)
+        # Updates are sent to the api through the publisher, from a background thread if async requests are enabled.
+        # With streamed updates they are sent over the socket as binary messages, if the api accepts them. Large request
+        # bodies are gzip compressed if the setting is enabled, which the API must support.
+        if self.headless:
+            self.publisher = LocalPublisher()
+        else:
+            stream = SocketStream(socket) if socket is not None and settings.get('streamUpdates', False) else None
+            self.publisher = Publisher(asynchronous=settings.get('asyncRequests', False), stream=stream,
+                                       compress=settings.get('compressRequests', False))
+        # The balances and positions of the backtest. Trade payloads are only needed when closing trades in fast mode,
+        # so they are kept on disk until then.
+        self.ledger = PortfolioLedger(self.start_balance, payloads_on_disk=self.fast_mode)
+        # Pausing and stopping the backtest from other threads is done through its control.
+        is_paused = False if self.headless else \
+            request_handler.get("/backtest_settings/is_paused").json().get("isPaused")
+        self.control = BacktestControl(paused=is_paused)
+        # The equity curve of the backtest, the profit/loss graph is only drawn from it when it is sent to the api.
+        self.equity_dates = GrowableArray("datetime64[s]")
+        self.equity_balances = GrowableArray(float)
+        self._profit_loss_graph = None
+        self.record_balance()
+
+        if self.headless:
+            self.backtest_id = settings.get('backtestId', 0)
+        else:
+            body = {
+                "start_date": str(self.start_date),
+                "start_balance": self.start_balance,
+                "total_profit_loss_graph": self.total_profit_loss_graph,
+                "strategy_id": self.strategy_id
+            }
+
+            self.backtest_id = request_handler.post("/backtests", body).json()['backtestId']
+
+        # With checkpoints enabled, the state of a headless backtest is saved every checkpointDays days so that it can
+        # be resumed, by default alongside its results. A backtest sent to the api cannot be resumed, as the api keeps
+        # its own record of the backtest and its trades.
+        self.checkpointer = None
+        if self.headless and settings.get('checkpointDays'):
+            directory = settings.get('checkpointPath') or os.path.join(sink.directory, "checkpoint")
+            self.checkpointer = Checkpointer(directory, settings['checkpointDays'])
+
+    @property
+    def state(self):
+        return self.control.state
+
+    @property
+    def _is_paused(self):
+        return self.control.paused
+
+    @property
+    def total_balance(self):
+        return self.ledger.total_balance
+
+    @property
+    def available_balance(self):
+        return self.ledger.available_balance
+
+    @property
+    def total_profit_loss(self):
+        return self.ledger.total_profit_loss
+
+    @property
+    def total_profit_loss_pct(self):
+        return self.ledger.total_profit_loss_pct
+
+    @property
+    def total_profit_loss_graph(self):
+        """ A JSON string holding the profit/loss graph, drawn from the equity curve when it has changed. """
+        if self._profit_loss_graph is None:
+            self._profit_loss_graph = graph_composer.draw_profit_loss_graph(self)
+        return self._profit_loss_graph
+
+    def record_balance(self):
+        """ Adds the total balance on the current backtest date to the equity curve.
 
-        body = {
-            "start_date": str(self.start_date),
-            "start_balance": self.start_balance,
-            "total_profit_loss_graph": self.total_profit_loss_graph,
-            "strategy_id": self.strategy_id
-        }
+        :return: none
+        """
+        self.equity_dates.append(self.backtest_date)
+        self.equity_balances.append(self.total_balance)
+        self._profit_loss_graph = None
 
-        self.backtest_id = request_handler.post("/backtests", body).json()['backtestId']
+    def render_trade_figure(self, trade_id):
+        """ Renders the figure of one of the backtest's trades, when it is requested by the UI.
+
+        :param trade_id: The id of the trade assigned by the api.
+        :return: A JSON string holding the figure, or None if the trade's figure is not held.
+        """
+        figure = self.ledger.find_figure(trade_id)
+        return None if figure is None else serializer.figure_json(figure)
 
     def to_JSON_serializable(self):
-        backtest_dict = copy.deepcopy(self.__dict__)
-        backtest_dict['backtest_date'] = str(backtest_dict["backtest_date"])
-        backtest_dict['start_date'] = str(backtest_dict["start_date"])
-        backtest_dict['_end_date'] = str(backtest_dict["_end_date"])
-        return backtest_dict
+        """ Gets the fields of the backtest that are sent to the api, ready to be encoded by serializer.dumps.
+
+        :return: A dict holding the fields in the json_schema.
+        """
+        return serializer.to_serializable(self)
 
     def increment_date(self):
-        """ Increases the backtest date to the next valid date, and updates the date in the database.
+        """ Increases the backtest date to the next valid date, and updates the date in the database if the day is sent
+            to the UI.
 
         :return: none
         """
@@ -64,49 +197,78 @@ class Backtest:
 
         logger.info(f"---- BACKTEST DATE: {dt.datetime.strftime(self.backtest_date, '%Y-%m-%d')} ----")
 
+        if self.ui_frame:
+            self.publish_date()
+
+    def publish_date(self):
+        """ Updates the backtest date in the database.
+
+        :return: none
+        """
+        # Sent as a string so that it reads the same whether the request is sent on its own or in a batch.
         body = {
-            "backtest_date": self.backtest_date
+            "backtest_date": str(self.backtest_date)
         }
 
-        request_handler.patch(f"/backtests/{self.backtest_id}/date", body)
+        self.publisher.submit("PATCH", f"/backtests/{self.backtest_id}/date", body, coalesce=True)
 
-    def start_backtest(self, tickers):
+    def start_backtest(self, tickers, resume=False):
         """ Holds the logic for the backtest loop:
         1. Increment Date.
         2. Analyse stocks.
         3. Make trade(s) with the stock that has the most confidence.
 
+        :param tickers: A list of company tickers.
+        :param resume: True to carry on from the backtest's last checkpoint, rather than from its start date.
         :return: none
         """
         logger.info("*---------------------- Starting backtest ----------------------*")
         if self.strategy_id is None:
             logger.warning("No strategy selected to run.")
-            self.state = "stopping"
+            self.control.stop()
         else:
             trade_handler = TradeHandler(self, tickers)
+            if resume:
+                if self.checkpointer is None:
+                    raise ValueError("Only a headless backtest with checkpointDays set can be resumed.")
+                self.checkpointer.restore(self, trade_handler)
+            elif self.checkpointer is not None:
+                self.checkpointer.reset()
 
         backtest_start_time = time.time()
+        self.pacing.reset()
 
         last_state = "executing"
-        while self.backtest_date < self._end_date and self.state == "active":
-            if self._is_paused:
+        while self.backtest_date < self._end_date and self.state == ACTIVE:
+            if self.control.paused:
                 # Print the state of the application if it has changed since the last loop.
                 if last_state != "paused":
                     logger.info("Backtest has been paused")
                     last_state = "paused"
-                # Do not do anything if paused.
-                time.sleep(0.3)
+                # Do not do anything until resumed or stopped.
+                self.control.wait_while_paused()
             else:
                 # Print the state of the application if it has changed since the last loop.
                 if last_state != "executing":
                     logger.info("Backtest has been resumed")
                     last_state = "executing"
-
-                loop_start_time = time.time()
+                    self.pacing.reset()
+
+                loop_start_time = time.monotonic()
+                # Stop the backtest if the publisher has failed to send an update.
+                self.publisher.check()
+                # The day's updates are sent together in one request, if the api supports batches.
+                self.publisher.begin_batch()
+                # Only the days that fall on the UI's cadence have their full state sent to the api.
+                self.ui_frame = self.ui_cadence.next_day()
                 self.increment_date()
 
-                if len(trade_handler.open_trades) > 0:
+                if self.fast_mode:
+                    trade_handler.process_scheduled_exits()
+                elif len(trade_handler.open_trades) > 0:
                     trade_handler.analyse_open_trades()
+                else:
+                    self.record_balance()
 
                 # Try to invest in new stocks, move to the next day if nothing good is found or if balance is too low.
                 try:
@@ -118,74 +280,267 @@ class Backtest:
 
                 except (TradeCreationError, TradeAnalysisError) as e:
                     logger.debug(e)
-
-                # Ensure loop is not executing too fast.
-                loop_time_taken = dt.timedelta(seconds=(time.time() - loop_start_time)).total_seconds()
-                while loop_time_taken < 1.5:
-                    loop_time_taken = dt.timedelta(seconds=(time.time() - loop_start_time)).total_seconds()
-                    time.sleep(0.3)
+                self.publisher.end_batch()
+
+                if self.headless:
+                    self.sink.record_day(self, trade_handler.screening_stats, time.monotonic() - loop_start_time)
+                if self.checkpointer is not None:
+                    self.checkpointer.day_finished(self, trade_handler)
+                # Pausing or stopping the backtest cuts the wait short.
+                self.pacing.wait(loop_start_time, sleep=self.control.sleep)
+        if self.strategy_id is not None and not self.ui_frame:
+            # Send the final state of the backtest, as the UI has not been sent its last day.
+            self.ui_frame = True
+            self.publish_date()
+            trade_handler.publish_snapshot()
+        if self.checkpointer is not None and self.strategy_id is not None:
+            # A backtest stopped before its end date is checkpointed on the day it stopped, so that no days are lost.
+            if self.backtest_date < self._end_date:
+                self.checkpointer.checkpoint(self, trade_handler)
+            self.checkpointer.close()
         backtest_time_taken = dt.timedelta(seconds=(time.time() - backtest_start_time)).total_seconds()
-        if self.state == "active":
+        summary = self.ledger.summary()
+        logger.info(f"{summary['num_trades']} trades closed with a win rate of {round(summary['win_rate_pct'], 2)}% "
+                    f"and an average profit/loss of {round(summary['avg_profit_loss_pct'], 2)}%")
+        if self.headless:
+            self.sink.close(self, backtest_time_taken)
+        # Trade figures can still be requested once the backtest has finished, so they are released by the controller.
+        if not self.deferred_figures:
+            self.ledger.close()
+        if self.state == ACTIVE:
             logger.info(f"Backtest completed in {str(dt.timedelta(seconds=backtest_time_taken))}")
-            request_handler.put(f"/backtests/{self.backtest_id}/finalise", {})
+            self.publisher.submit("PUT", f"/backtests/{self.backtest_id}/finalise", {})
         else:
             logger.info(f"Backtest stopped after {str(dt.timedelta(seconds=backtest_time_taken))}")
+        # Send the remaining updates before the backtest is marked as inactive.
+        self.publisher.close()
+        if self.strategy_id is not None:
+            # The trades opened on the last day need their ids for their figures to be found.
+            trade_handler.resolve_trade_ids()
         # Delete self in main thread by setting state flag
-        self.state = "inactive"
+        self.control.finish()
 
 
 class BacktestController:
     def __init__(self, sio, tickers):
         """ Constructor for the backtest controller, automatically starts a new backtest on instantiation and also sets
-            up socket listeners for stop/restart events.
+            up socket listeners for start/stop/restart events. Several backtests can be run at once, each in its own
+            thread, and the events are routed to a backtest by the backtest id they are sent with. The socket listeners
+            do not wait for backtests to stop or start, so that they do not hold up the socket's event thread.
 
         :param sio: The socket connection established for the application.
         :param tickers: Array of tickers
         """
         self.socket = sio
         self.tickers = tickers
-        self.backtest = None
+        # The backtests that are running, keyed by backtest id in the order they were started.
+        self.backtests = {}
+        # The most recently finished backtests, keyed by backtest id in the order they finished. They are kept so that
+        # their trade figures can still be requested, and the ledgers of older ones are closed.
+        self.finished_backtests = {}
+        # The settings each backtest was started with in place of the saved settings, keyed by backtest id.
+        self._overrides = {}
         self.settings = None
+        # The market data is loaded once and shared by every backtest, rather than read by each of them.
+        self.market_data = MarketDataStore()
+        # Held while backtests are being started, replaced or stopped.
+        self._lock = RLock()
 
         @self.socket.on('playpause')
         def toggle_pause(data):
-            """ Toggle the pause state of the backtest. """
-            self.backtest._is_paused = data['isPaused']
+            """ Toggle the pause state of the backtest with the given id, or of every backtest if no id is given. """
+            for backtest in self._find_backtests(data.get('backtestId')):
+                backtest.control.set_paused(data['isPaused'])
+
+        @self.socket.on('startBacktest')
+        def start_backtest(data=None):
+            """ Starts a new backtest alongside the running ones, using any settings given in place of the saved
+                ones. """
+            Thread(target=self._start_backtest, args=(data,), name="start").start()
 
         @self.socket.on('restartBacktest')
-        def restart_backtest():
-            """ Stops the current backtest, removes it from self.backtest, and then starts a new backtest. """
-            self._get_settings()
-            self.stop_backtest()
-            self._start_backtest()
+        def restart_backtest(data=None):
+            """ Stops the backtest with the given id, or every backtest if no id is given, and then starts a new
+                backtest in its place. """
+            backtest_id = (data or {}).get('backtestId')
+            Thread(target=self._replace_backtest, kwargs={"backtest_id": backtest_id}, name="restart").start()
+
+        @self.socket.on('getTradeFigure')
+        def get_trade_figure(trade_id):
+            """ Renders the figure of a trade in one of the backtests, when figures are not sent with the trades. """
+            for backtest in self._find_backtests():
+                figure = backtest.render_trade_figure(trade_id)
+                if figure is not None:
+                    return figure
+            return None
 
         @self.socket.on('stopBacktest')
-        def manual_stop_backtest(strategy_id, msg):
-            """ Stops the current backtest if the strategy in use matches the provided. """
-            if self.backtest.strategy_id == strategy_id:
-                self.stop_backtest()
+        def manual_stop_backtest(strategy_id, msg, backtest_id=None):
+            """ Stops the backtests using the provided strategy, or only the one with the given id if it uses it. """
+            backtests = [backtest for backtest in self._find_backtests(backtest_id)
+                         if backtest.strategy_id == strategy_id]
+            for backtest in backtests:
+                Thread(target=self.stop_backtest, args=(backtest.backtest_id,), name="stop").start()
+            if backtests:
                 logger.info(msg)
 
         self._get_settings()
-        thread = Thread(target=self._start_backtest)
+        thread = Thread(target=self._replace_backtest, kwargs={"get_settings": False})
         thread.start()
 
-    def _start_backtest(self):
-        """ Instantiates a new backtest object using the most recently updated properties, and then runs it. """
-        self.backtest = Backtest(self.settings)
-        self.backtest.start_backtest(self.tickers)
+    @property
+    def backtest(self):
+        """ The most recently started backtest that is running, or the most recently finished one if none are running,
+            or None if there are none. """
+        backtest = next(reversed(list(self.backtests.values())), None)
+        if backtest is None:
+            backtest = next(reversed(list(self.finished_backtests.values())), None)
+        return backtest
+
+    def _find_backtests(self, backtest_id=None):
+        """ Finds the backtest with the given id, or every backtest if no id is given.
 
-    def stop_backtest(self):
-        """ Sets the stopping flag in the backtest so that the thread can safely exit the loop early, then deletes the
-            backtest object from the controller. """
-        self.backtest.state = "stopping" if self.backtest.state == "active" else "inactive"
-        while self.backtest.state != "inactive":
-            time.sleep(0.3)
-        self.backtest = None
+        :param backtest_id: The id of the backtest, or None.
+        :return: A list of Backtest objects.
+        """
+        backtests = list(self.backtests.values()) + list(self.finished_backtests.values())
+        if backtest_id is None:
+            return backtests
+        return [backtest for backtest in backtests if backtest.backtest_id == backtest_id]
+
+    def _start_backtest(self, overrides=None, get_settings=True):
+        """ Starts a new backtest in its own thread, alongside any backtests that are already running.
+
+        :param overrides: A dict of settings to use in place of the saved settings, e.g. a different strategyId.
+        :param get_settings: Whether to get the most up to date settings from the database first.
+        :return: The Backtest object, or None if it could not be started.
+        """
+        with self._lock:
+            try:
+                if get_settings:
+                    self._get_settings()
+                settings = dict(self.settings)
+                settings.update(self._parse_dates(overrides or {}))
+                backtest = Backtest(settings, socket=self.socket, market_data=self.market_data)
+            except APIConnectionError as e:
+                logger.critical(f"Backtest could not be started as the data access API could not be reached: {e}")
+                return None
+            self.backtests[backtest.backtest_id] = backtest
+            self._overrides[backtest.backtest_id] = overrides
+        Thread(target=self._run_backtest, args=(backtest,), name=f"backtest-{backtest.backtest_id}").start()
+        return backtest
+
+    def _replace_backtest(self, get_settings=True, backtest_id=None):
+        """ Stops the backtest with the given id, or every backtest if no id is given, and starts a new one using the
+            most recently updated settings. A replaced backtest keeps the settings it was started with in place of the
+            saved ones.
+
+        :param get_settings: Whether to get the most up to date settings from the database first.
+        :param backtest_id: The id of the backtest to replace, or None to replace every backtest with one.
+        :return: none
+        """
+        with self._lock:
+            try:
+                if get_settings:
+                    self._get_settings()
+            except APIConnectionError as e:
+                logger.critical(f"Backtest could not be started as the data access API could not be reached: {e}")
+                return
+            overrides = self._overrides.get(backtest_id)
+            stopped = self._detach_backtests(backtest_id)
+            self._start_backtest(overrides, get_settings=False)
+        # The replaced backtests are waited for once the lock is released, so that other events are not held up while
+        # they finish the day they are processing.
+        self._close_backtests(stopped)
+
+    def _run_backtest(self, backtest):
+        """ Runs a backtest, which is stopped if the data access API cannot be reached.
+
+        :param backtest: The Backtest object.
+        :return: none
+        """
+        try:
+            backtest.start_backtest(self.tickers)
+        except APIConnectionError as e:
+            logger.critical(f"Backtest stopped as the data access API could not be reached: {e}")
+        finally:
+            backtest.control.finish()
+            self._retire_backtest(backtest)
+
+    def _retire_backtest(self, backtest):
+        """ Moves a backtest that has run to its end date to the finished backtests, closing the ledgers of the oldest
+            finished backtests once more than MAX_FINISHED_BACKTESTS are kept. A backtest that was stopped has already
+            been removed from the controller.
+
+        :param backtest: The Backtest object, once it has finished.
+        :return: none
+        """
+        with self._lock:
+            if self.backtests.get(backtest.backtest_id) is not backtest:
+                return
+            del self.backtests[backtest.backtest_id]
+            self.finished_backtests[backtest.backtest_id] = backtest
+            retired = []
+            while len(self.finished_backtests) > MAX_FINISHED_BACKTESTS:
+                oldest_id = next(iter(self.finished_backtests))
+                retired.append(self.finished_backtests.pop(oldest_id))
+                self._overrides.pop(oldest_id, None)
+        for old_backtest in retired:
+            old_backtest.ledger.close()
+
+    def stop_backtest(self, backtest_id=None):
+        """ Asks the backtest with the given id, or every backtest if no id is given, to stop so that its thread can
+            safely exit the loop early, waits for it to finish the day it is processing, then deletes the backtest
+            object from the controller.
+
+        :param backtest_id: The id of the backtest to stop, or None to stop every backtest.
+        :return: none
+        """
+        with self._lock:
+            backtests = self._detach_backtests(backtest_id)
+        self._close_backtests(backtests)
+
+    def _detach_backtests(self, backtest_id=None):
+        """ Removes the backtest with the given id, or every backtest if no id is given, from the controller and asks
+            the running ones to stop. Must be called with the lock held.
+
+        :param backtest_id: The id of the backtest, or None for every backtest.
+        :return: A list of the removed Backtest objects.
+        """
+        backtests = []
+        for held in (self.backtests, self.finished_backtests):
+            backtest_ids = list(held) if backtest_id is None else [backtest_id]
+            backtests.extend(held.pop(key) for key in backtest_ids if key in held)
+        for backtest in backtests:
+            self._overrides.pop(backtest.backtest_id, None)
+            backtest.control.stop()
+        return backtests
+
+    @staticmethod
+    def _close_backtests(backtests):
+        """ Waits for stopped backtests to finish the day they are processing, then releases their ledgers.
+
+        :param backtests: A list of the Backtest objects, which have been asked to stop.
+        :return: none
+        """
+        # Every backtest is asked to stop before waiting for any of them, so that they stop together.
+        for backtest in backtests:
+            backtest.control.wait_until_inactive()
+            backtest.ledger.close()
 
     def _get_settings(self):
         """ Gets the most up to date settings from the database and saves them to self. """
         settings = request_handler.get("/backtest_settings").json()
-        settings['startDate'] = dt.datetime.strptime(settings['startDate'], '%Y-%m-%dT%H:%M:%S.%fZ')
-        settings['endDate'] = dt.datetime.strptime(settings['endDate'], '%Y-%m-%dT%H:%M:%S.%fZ')
-        self.settings = settings
+        self.settings = self._parse_dates(settings)
+
+    @staticmethod
+    def _parse_dates(settings):
+        """ Parses the start and end dates in settings sent by the api or the UI.
+
+        :param settings: A dict of settings, which may hold 'startDate' and 'endDate' strings.
+        :return: The dict of settings, with the dates as datetime objects.
+        """
+        for key in ('startDate', 'endDate'):
+            if isinstance(settings.get(key), str):
+                settings[key] = dt.datetime.strptime(settings[key], '%Y-%m-%dT%H:%M:%S.%fZ')
+        return settings
@@ -0,0 +1,303 @@
+""" Periodic checkpoints of a running backtest, so that a backtest stopped part way through (by the application shutting
+    down or crashing) can be resumed from the last checkpoint rather than being run again from its start date. A
+    checkpoint holds the full state of the engine: the backtest date, the balances, the closed trades and equity curve,
+    the open trades with their historical data windows and figures, the exit queue of fast mode, the state of the
+    random number generator the day's trade is picked with and, for headless backtests, the state of the result sink.
+    The strategy itself holds no state between days, as its indicators are materialised in the database and the
+    rolling state of each open trade's analysis is held in the trade's window and figure.
+
+    Checkpoints are written incrementally to a directory. The tables that are only ever added to (closed trades, the
+    equity curve and the statistics of each day) are written as numbered .npz parts holding the rows added since the
+    previous checkpoint, and the payloads of each trade are written to their own file only when they have changed. The
+    state is captured in the backtest's thread, and is pickled and written by a background thread while the backtest
+    carries on. Payloads are captured by reference, as a trade's historical data is replaced each day rather than being
+    changed, except for the figures which are updated in place and so are copied. Each checkpoint is committed by
+    atomically replacing state.pkl, which lists the parts and payload files that make it up, so a checkpoint interrupted
+    part way through leaves the previous one intact. """
+
+from src.data_handlers.result_sink import DAY_STATS_DTYPE, _columns
+from src.trades.figure_model import FigureModel
+from src.trades.growable_array import GrowableArray
+from src.trades.ledger import CLOSED_POSITION_DTYPE
+from src.trades.trade import Trade
+import glob
+import logging
+import os
+import pickle
+import shutil
+import threading
+import numpy as np
+
+logger = logging.getLogger("checkpoint")
+
+STATE_FILE = "state.pkl"
+
+
+def has_checkpoint(directory):
+    """ Checks whether a checkpoint has been committed in a directory.
+
+    :param directory: The checkpoint directory.
+    :return: True if the directory holds a checkpoint that can be resumed from.
+    """
+    return os.path.exists(os.path.join(directory, STATE_FILE))
+
+
+def _snapshot(payload):
+    """ Captures a trade's payload as it is now, for it to be pickled after the backtest has moved on. Figures are
+        updated in place, so are copied, and the other payloads are replaced rather than changed.
+
+    :param payload: The payload object.
+    :return: The payload, or a copy of it.
+    """
+    return payload.copy() if isinstance(payload, FigureModel) else payload
+
+
+def _records(columns, dtype):
+    """ Converts the columns of a table back into a structured array.
+
+    :param columns: A dict of arrays, empty if the table has no rows.
+    :param dtype: The dtype of the structured array.
+    :return: A structured array.
+    """
+    records = np.empty(len(next(iter(columns.values()))) if columns else 0, dtype=dtype)
+    for name, values in columns.items():
+        records[name] = values
+    return records
+
+
+def _write_atomic(path, data):
+    """ Writes a file in full or not at all, by writing it to a temporary file that then replaces it.
+
+    :param path: The path of the file.
+    :param data: The bytes to be written.
+    :return: none
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Checkpointer:
+
+    def __init__(self, directory, every_days=20):
+        """ Constructor for the checkpoints of a backtest.
+
+        :param directory: The directory to write the checkpoints to.
+        :param every_days: The number of days between checkpoints.
+        """
+        if every_days < 1:
+            raise ValueError(f"Checkpoints must be at least one day apart, got {every_days}.")
+        self.directory = directory
+        self.every_days = every_days
+        self._days = 0
+        # What has been written by the last committed checkpoint, which the next one only adds to: the number of the
+        # checkpoint, the numbers of rows and parts written of each table, and the file holding each trade's payloads
+        # along with the names of the payloads in it.
+        self._number = 0
+        self._tables = {}
+        self._payload_files = {}
+        # The background thread writing the latest checkpoint.
+        self._writer = None
+
+    def reset(self):
+        """ Removes any previous checkpoints, for a backtest that is being run from its start date.
+
+        :return: none
+        """
+        self.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(os.path.join(self.directory, "payloads"))
+        self._days = 0
+        self._number = 0
+        self._tables = {}
+        self._payload_files = {}
+
+    def day_finished(self, backtest, trade_handler):
+        """ Counts a day of the backtest, writing a checkpoint every every_days days.
+
+        :param backtest: The Backtest object, on the day that has just been processed.
+        :param trade_handler: The backtest's TradeHandler object.
+        :return: none
+        """
+        self._days += 1
+        if self._days % self.every_days == 0:
+            self.checkpoint(backtest, trade_handler)
+
+    def checkpoint(self, backtest, trade_handler):
+        """ Captures the state of the backtest, and starts writing the parts of it that have changed since the last
+            checkpoint in the background.
+
+        :param backtest: The Backtest object, between days.
+        :param trade_handler: The backtest's TradeHandler object.
+        :return: none
+        """
+        # The previous checkpoint is normally long finished, and must be committed before the next adds to it.
+        self.wait()
+        number = self._number + 1
+        ledger = backtest.ledger
+        ledger_state = ledger.checkpoint_state()
+        state = {
+            "number": number,
+            "date": backtest.backtest_date,
+            "random_state": backtest.rng.getstate(),
+            "ledger": ledger_state,
+            "trade_handler": trade_handler.checkpoint_state(),
+            "sink": backtest.sink.checkpoint_state() if backtest.sink is not None else None,
+            "open_trades": [trade.record() for trade in ledger.open_positions.trades],
+            "tables": {},
+            "payload_files": {}
+        }
+
+        # The rows added to each table since the last checkpoint.
+        tables = {
+            "trades": ledger.closed_positions,
+            "equity": {"date": backtest.equity_dates.values, "total_balance": backtest.equity_balances.values}
+        }
+        if backtest.sink is not None:
+            tables["days"] = backtest.sink.days
+        new_parts = {}
+        for table, values in tables.items():
+            columns = _columns(values)
+            num_rows = len(next(iter(columns.values())))
+            written_rows, num_parts = self._tables.get(table, (0, 0))
+            if num_rows > written_rows:
+                new_parts[os.path.join(table, f"part-{num_parts:05d}.npz")] = \
+                    {column: arr[written_rows:].copy() for column, arr in columns.items()}
+                num_parts += 1
+            state["tables"][table] = (num_rows, num_parts)
+
+        # The payloads of the open trades, and the figures of closed trades kept to be rendered on request. The
+        # payloads of open trades change every day unless they are only processed on their exit dates.
+        new_payloads = {}
+        payload_names = {trade.payload_key: Trade.payload_names for trade in ledger.open_positions.trades}
+        payload_names.update({key: ("figure",) for key in ledger_state["closed_figure_keys"].values()})
+        for key, names in payload_names.items():
+            written = self._payload_files.get(key)
+            if written is not None and written[1] == names and (backtest.fast_mode or names == ("figure",)):
+                state["payload_files"][key] = written
+                continue
+            file_name = f"{key}-{number}.pkl"
+            new_payloads[file_name] = {name: _snapshot(ledger.payload_store.get(key, name)) for name in names}
+            state["payload_files"][key] = (file_name, names)
+
+        self._writer = threading.Thread(target=self._write, args=(state, new_parts, new_payloads),
+                                        name="checkpoint_writer")
+        self._writer.start()
+
+    def _write(self, state, new_parts, new_payloads):
+        """ Writes a checkpoint's files and commits it, in the background.
+
+        :param state: The dict holding the state of the backtest, written to state.pkl.
+        :param new_parts: A dict holding the columns of each new table part, keyed by the part's path.
+        :param new_payloads: A dict holding the payloads of each changed trade, keyed by the file name.
+        :return: none
+        """
+        try:
+            for path, columns in new_parts.items():
+                os.makedirs(os.path.dirname(os.path.join(self.directory, path)), exist_ok=True)
+                np.savez(os.path.join(self.directory, path), **columns)
+            for file_name, payloads in new_payloads.items():
+                _write_atomic(os.path.join(self.directory, "payloads", file_name),
+                              pickle.dumps(payloads, protocol=pickle.HIGHEST_PROTOCOL))
+            _write_atomic(os.path.join(self.directory, STATE_FILE),
+                          pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            # The next checkpoint adds to the last one that was committed, so it makes up for this one.
+            logger.exception(f"Failed to write checkpoint {state['number']}")
+            return
+        self._commit(state)
+        logger.debug(f"Checkpoint {state['number']} written on {state['date']}")
+
+    def _commit(self, state):
+        """ Records a checkpoint as the one the next adds to, and removes the payload files it no longer uses.
+
+        :param state: The dict holding the state of the committed checkpoint.
+        :return: none
+        """
+        in_use = {file_name for file_name, _ in state["payload_files"].values()}
+        for file_name, _ in self._payload_files.values():
+            if file_name not in in_use:
+                try:
+                    os.remove(os.path.join(self.directory, "payloads", file_name))
+                except FileNotFoundError:
+                    pass
+        self._number = state["number"]
+        self._tables = state["tables"]
+        self._payload_files = state["payload_files"]
+
+    def wait(self):
+        """ Waits until the latest checkpoint has been written.
+
+        :return: none
+        """
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def close(self):
+        """ Finishes writing checkpoints, once the backtest has stopped.
+
+        :return: none
+        """
+        self.wait()
+
+    def restore(self, backtest, trade_handler):
+        """ Restores the state of a backtest from the last committed checkpoint, so that it carries on from the day
+            after it. The backtest must have been created with the same settings, and not yet have been run.
+
+        :param backtest: The new Backtest object.
+        :param trade_handler: The backtest's new TradeHandler object.
+        :return: The date of the checkpoint.
+        """
+        with open(os.path.join(self.directory, STATE_FILE), "rb") as f:
+            state = pickle.load(f)
+        # Files written by a checkpoint that was never committed are not part of the restored state.
+        in_use = {file_name for file_name, _ in state["payload_files"].values()}
+        for path in glob.glob(os.path.join(self.directory, "payloads", "*")):
+            if os.path.basename(path) not in in_use:
+                os.remove(path)
+        tables = {table: self._read_table(table, num_parts) for table, (_, num_parts) in state["tables"].items()}
+
+        ledger = backtest.ledger
+        for key, (file_name, _) in state["payload_files"].items():
+            with open(os.path.join(self.directory, "payloads", file_name), "rb") as f:
+                for name, value in pickle.load(f).items():
+                    ledger.payload_store.put(key, name, value)
+        trades = [Trade.from_record(record, ledger.payload_store) for record in state["open_trades"]]
+        ledger.restore(state["ledger"], _records(tables["trades"], CLOSED_POSITION_DTYPE), trades)
+        trade_handler.restore_state(state["trade_handler"], {trade.payload_key: trade for trade in trades})
+
+        backtest.backtest_date = state["date"]
+        equity = tables["equity"]
+        backtest.equity_dates = GrowableArray("datetime64[s]", capacity=len(equity["date"]) * 2)
+        backtest.equity_dates.extend(equity["date"])
+        backtest.equity_balances = GrowableArray(float, capacity=len(equity["date"]) * 2)
+        backtest.equity_balances.extend(equity["total_balance"])
+        if backtest.sink is not None:
+            backtest.sink.restore(state["sink"], _records(tables.get("days", {}), DAY_STATS_DTYPE))
+        backtest.rng.setstate(state["random_state"])
+
+        self._days = 0
+        self._number = state["number"]
+        self._tables = state["tables"]
+        self._payload_files = state["payload_files"]
+        logger.info(f"Resumed the backtest from checkpoint {state['number']} on {state['date']}")
+        return state["date"]
+
+    def _read_table(self, table, num_parts):
+        """ Reads the parts of a table that belong to the committed checkpoint.
+
+        :param table: The name of the table.
+        :param num_parts: The number of parts of the table in the checkpoint.
+        :return: A dict holding an array per column, empty if the table has no rows.
+        """
+        parts = []
+        for part in range(num_parts):
+            with np.load(os.path.join(self.directory, table, f"part-{part:05d}.npz")) as data:
+                parts.append({column: data[column] for column in data.files})
+        if not parts:
+            return {}
+        return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
@@ -0,0 +1,97 @@
+""" The control plane of a backtest, through which other threads (e.g. the socket event handlers) pause, resume and
+    stop it. Its state and pause flag are changed under a condition variable, so that a backtest waiting while paused or
+    between days, and threads waiting for it to stop, are woken as soon as they change rather than polling for them. """
+
+import threading
+
+ACTIVE = "active"
+STOPPING = "stopping"
+INACTIVE = "inactive"
+# The states a backtest can move to from each state.
+TRANSITIONS = {
+    ACTIVE: (STOPPING, INACTIVE),
+    STOPPING: (INACTIVE,),
+    INACTIVE: ()
+}
+
+
+class BacktestControl:
+
+    def __init__(self, paused=False):
+        """ Constructor for the control of an active backtest.
+
+        :param paused: Whether the backtest starts paused.
+        """
+        self._condition = threading.Condition()
+        self._state = ACTIVE
+        self._paused = bool(paused)
+
+    @property
+    def state(self):
+        """ The state of the backtest: active, stopping (asked to stop but still running) or inactive. """
+        return self._state
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def set_paused(self, paused):
+        """ Pauses or resumes the backtest.
+
+        :param paused: True to pause the backtest, False to resume it.
+        :return: none
+        """
+        with self._condition:
+            self._paused = bool(paused)
+            self._condition.notify_all()
+
+    def stop(self):
+        """ Asks the backtest to stop, which it does once it has finished the day it is processing.
+
+        :return: none
+        """
+        self._transition(STOPPING)
+
+    def finish(self):
+        """ Marks the backtest as inactive, once it has stopped running.
+
+        :return: none
+        """
+        self._transition(INACTIVE)
+
+    def wait_while_paused(self):
+        """ Waits until the backtest is resumed or asked to stop.
+
+        :return: none
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._paused or self._state != ACTIVE)
+
+    def sleep(self, seconds):
+        """ Waits for a number of seconds, returning early if the backtest is paused or asked to stop.
+
+        :param seconds: The most seconds to wait.
+        :return: True if the wait was cut short.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._paused or self._state != ACTIVE, timeout=seconds)
+
+    def wait_until_inactive(self, timeout=None):
+        """ Waits until the backtest has stopped running.
+
+        :param timeout: The most seconds to wait, or None to wait for as long as it takes.
+        :return: True if the backtest is inactive.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._state == INACTIVE, timeout=timeout)
+
+    def _transition(self, state):
+        """ Moves the backtest to a new state, if it can move to it from its current state.
+
+        :param state: The new state.
+        :return: none
+        """
+        with self._condition:
+            if state in TRANSITIONS[self._state]:
+                self._state = state
+                self._condition.notify_all()
@@ -0,0 +1,221 @@
+""" Runs many simulations of a backtest together in one pass, to judge a strategy by the distribution of its outcomes
+    rather than by a single run. A backtest picks one of each day's potential trades at random, so a single run is only
+    one sample of what the strategy could have done. Everything that does not depend on those choices is shared by the
+    simulations: the strategy is executed once per day and its potential trades are offered to every simulation, and
+    the prices of the tickers held are read once per day. The balances and open positions of every simulation are held
+    in arrays, so each extra simulation only adds to the vectorised bookkeeping. Simulated trades are not sent to the
+    api, and their results are written to local files. """
+
+from src.data_handlers import serializer
+from src.data_handlers.market_data_store import MarketDataStore
+from src.data_validators import date_validator
+from src.strategy.strategy import create_strategy
+from src.trades.growable_array import GrowableArray
+from src.trades.position_book import SimulatedPositionBook
+from src.backtest.sweep import max_drawdown_pct
+import datetime as dt
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("monte_carlo")
+
+# The percentiles of the simulations' returns given in the summary.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class MonteCarloBacktest:
+
+    def __init__(self, settings, num_simulations, seed=None, market_data=None):
+        """ Constructor for the simulations of a backtest.
+
+        :param settings: A dict of backtest settings, as given to a Backtest.
+        :param num_simulations: The number of simulations to run.
+        :param seed: The seed of the random trade choices, so that the simulations can be repeated.
+        :param market_data: The MarketDataStore to read the historical data from, a new one is created if not given.
+        """
+        if num_simulations < 1:
+            raise ValueError(f"At least one simulation must be run, got {num_simulations}.")
+        self.start_date = settings['startDate']
+        self._end_date = settings['endDate']
+        self.backtest_date = self.start_date
+        self.start_balance = settings['startBalance']
+        self.max_cap_pct_per_trade = settings['capPct']
+        self.tp_limit = settings['takeProfit']
+        self.sl_limit = settings['stopLoss']
+        self.strategy_id = settings['strategyId']
+        self.strategy_config = settings.get('strategy')
+        self.market_data = market_data or MarketDataStore()
+        self.num_simulations = num_simulations
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        # The balances of each simulation, and the open positions of all of them.
+        self.total_balance = np.full(num_simulations, float(self.start_balance))
+        self.available_balance = np.full(num_simulations, float(self.start_balance))
+        self.positions = SimulatedPositionBook()
+        self.num_trades = np.zeros(num_simulations, dtype=int)
+        self.num_wins = np.zeros(num_simulations, dtype=int)
+        # The equity curves of the simulations, with a row per day and a column per simulation.
+        self.equity_dates = GrowableArray("datetime64[s]")
+        self.equity_balances = GrowableArray((float, (num_simulations,)))
+        # The tickers that have been traded, positions refer to them by their index in the list.
+        self._tickers = []
+        self._ticker_indexes = {}
+        self._seconds = None
+        self.record_balance()
+
+    def record_balance(self):
+        """ Adds the total balance of each simulation on the current date to the equity curves.
+
+        :return: none
+        """
+        self.equity_dates.append(self.backtest_date)
+        self.equity_balances.append(self.total_balance)
+
+    def run(self, tickers, max_strategy_threads=6):
+        """ Runs every simulation from the start date to the end date.
+
+        :param tickers: A list of company tickers.
+        :param max_strategy_threads: The number of threads to execute the strategy in each day.
+        :return: A DataFrame holding the results of each simulation.
+        """
+        logger.info(f"Running {self.num_simulations} simulations of the backtest with seed {self.seed}")
+        strategy = create_strategy(self)
+        strategy.materialise_indicators(tickers)
+        start_time = time.time()
+
+        while self.backtest_date < self._end_date:
+            next_date = self.backtest_date + dt.timedelta(days=1)
+            self.backtest_date = date_validator.validate_date(next_date, 1)
+            logger.debug(f"---- SIMULATION DATE: {dt.datetime.strftime(self.backtest_date, '%Y-%m-%d')} ----")
+
+            if len(self.positions) > 0:
+                self.close_positions()
+            potential_trades = strategy.find_potential_trades(strategy.screen_tickers(tickers), max_strategy_threads)
+            if potential_trades:
+                self.open_positions(potential_trades)
+            self.record_balance()
+
+        self._seconds = time.time() - start_time
+        logger.info(f"Simulations completed in {str(dt.timedelta(seconds=self._seconds))}")
+        return self.results()
+
+    def close_positions(self):
+        """ Refreshes the prices of every simulation's open positions, and sells the positions that have exceeded
+            their take profit/stop loss thresholds.
+
+        :return: none
+        """
+        # The price of each ticker held by any of the simulations is read once.
+        held = np.unique(self.positions.ticker)
+        new_data = self.market_data.get_hist_dataframes([self._tickers[i] for i in held], self.backtest_date,
+                                                        num_weeks=0, num_days=1)
+        prices = np.full(len(self._tickers), np.nan)
+        prices[held] = [df['close'].iloc[-1] if len(df.index) else np.nan for df in new_data]
+        exits = self.positions.update_prices(prices)
+        if not exits.any():
+            return
+
+        simulation = self.positions.simulation[exits]
+        proceeds = self.positions.current_price[exits] * self.positions.share_qty[exits]
+        profit_loss = proceeds - self.positions.investment_total[exits]
+        # A simulation can sell several positions on the same day, so the balances are added to unbuffered.
+        np.add.at(self.available_balance, simulation, proceeds)
+        np.add.at(self.total_balance, simulation, profit_loss)
+        self.num_trades += np.bincount(simulation, minlength=self.num_simulations)
+        self.num_wins += np.bincount(simulation[profit_loss > 0], minlength=self.num_simulations)
+        self.positions.remove(exits)
+
+    def open_positions(self, potential_trades):
+        """ Has each simulation pick one of the day's potential trades at random, and buy it if it can afford a share,
+            using the same rules as the TradeHandler.
+
+        :param potential_trades: A list of (dataframe, figure) tuples found by the strategy.
+        :return: none
+        """
+        # Sorted so that a seed picks the same trades whatever order the strategy's threads found them in.
+        potential_trades = sorted(potential_trades, key=lambda potential_trade: potential_trade[0].attrs['ticker'])
+        tickers = np.array([self._ticker_index(df.attrs['ticker']) for df, _ in potential_trades])
+        buy_prices = np.array([df['close'].iloc[-1] for df, _ in potential_trades])
+
+        choices = self._rng.integers(len(potential_trades), size=self.num_simulations)
+        buy_price = buy_prices[choices]
+        # The most each simulation can invest, a percentage of its total balance limited to what it has available.
+        max_investment = np.minimum(self.total_balance * self.max_cap_pct_per_trade, self.available_balance)
+        affordable = buy_price <= max_investment
+
+        simulation = np.flatnonzero(affordable)
+        buy_price = buy_price[affordable]
+        qty = np.floor(max_investment[affordable] / buy_price)
+        investment_total = qty * buy_price
+        self.available_balance[simulation] -= investment_total
+        self.positions.add(simulation, tickers[choices[affordable]], buy_price, qty, investment_total,
+                           investment_total * self.tp_limit / qty, investment_total * self.sl_limit / qty)
+
+    def _ticker_index(self, ticker):
+        """ Gets the index positions refer to a ticker by, adding the ticker if it has not been traded before.
+
+        :param ticker: String of the company ticker.
+        :return: The index of the ticker.
+        """
+        if ticker not in self._ticker_indexes:
+            self._ticker_indexes[ticker] = len(self._tickers)
+            self._tickers.append(ticker)
+        return self._ticker_indexes[ticker]
+
+    def results(self):
+        """ Gets the results of each simulation. Positions that are still open are valued at their buy price, as they
+            are in the total balance of a backtest.
+
+        :return: A DataFrame holding a row per simulation.
+        """
+        return pd.DataFrame({
+            "simulation": np.arange(self.num_simulations),
+            "total_balance": self.total_balance,
+            "return_pct": (self.total_balance / self.start_balance - 1) * 100,
+            "max_drawdown_pct": max_drawdown_pct(self.equity_balances.values),
+            "num_trades": self.num_trades,
+            "win_rate_pct": np.divide(self.num_wins * 100, self.num_trades, out=np.zeros(self.num_simulations),
+                                      where=self.num_trades > 0),
+            "num_open_trades": np.bincount(self.positions.simulation, minlength=self.num_simulations)
+        })
+
+    def summary(self):
+        """ Summarises the distribution of the simulations' outcomes.
+
+        :return: A dict holding the statistics.
+        """
+        results = self.results()
+        returns = results['return_pct'].to_numpy()
+        summary = {
+            "num_simulations": self.num_simulations,
+            "seed": self.seed,
+            "start_date": self.start_date,
+            "end_date": self.backtest_date,
+            "num_days": len(self.equity_dates) - 1,
+            "seconds": self._seconds,
+            "mean_return_pct": returns.mean(),
+            "std_return_pct": returns.std(),
+            "loss_probability": (returns < 0).mean(),
+            "mean_max_drawdown_pct": results['max_drawdown_pct'].mean(),
+            "mean_num_trades": results['num_trades'].mean()
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(returns, PERCENTILES)):
+            summary[f"return_pct_p{percentile}"] = value
+        return summary
+
+    def write_results(self, directory):
+        """ Writes the results of each simulation to simulations.csv, their equity curves to equity.npz and the summary
+            of their distribution to summary.json.
+
+        :param directory: The directory to write the results to.
+        :return: none
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.results().to_csv(os.path.join(directory, "simulations.csv"), index=False)
+        np.savez(os.path.join(directory, "equity.npz"), date=self.equity_dates.values,
+                 total_balance=self.equity_balances.values)
+        with open(os.path.join(directory, "summary.json"), "wb") as f:
+            f.write(serializer.dumps(self.summary()))
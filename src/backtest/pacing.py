@@ -0,0 +1,117 @@
+""" Pacing policies that control how fast a backtest runs through its days, and the cadence at which its state is sent
+    to the UI. The two are separate, so that the backtest can run at full speed while the UI is sent snapshots of it at
+    a steady frame rate rather than an update for every day. """
+
+import time
+
+# The names of the pacing policies in the backtest settings.
+REAL_TIME = "realTime"
+FIXED_RATE = "fixedRate"
+UNTHROTTLED = "unthrottled"
+
+
+class RealTimePacing:
+    """ Makes each day of the backtest take at least seconds_per_day, so that it can be followed in the UI. """
+
+    def __init__(self, seconds_per_day=1.5):
+        self.seconds_per_day = seconds_per_day
+
+    def reset(self):
+        pass
+
+    def wait(self, day_start_time, sleep=None):
+        """ Waits until the day has taken at least seconds_per_day.
+
+        :param day_start_time: The time.monotonic() value when the day started.
+        :param sleep: The function to wait with, which may return early, or None to use time.sleep.
+        :return: none
+        """
+        remaining = day_start_time + self.seconds_per_day - time.monotonic()
+        if remaining > 0:
+            (sleep or time.sleep)(remaining)
+
+
+class FixedRatePacing:
+    """ Runs the backtest at a target number of days per second. Days are scheduled from when the pacing was started
+        rather than from the end of the previous day, so that time lost on a slow day is made up on the next ones. """
+
+    def __init__(self, days_per_second):
+        if days_per_second <= 0:
+            raise ValueError(f"Pacing must be faster than 0 days per second, got {days_per_second}.")
+        self.interval = 1 / days_per_second
+        self.reset()
+
+    def reset(self):
+        """ Restarts the schedule from now, e.g. once the backtest has been resumed.
+
+        :return: none
+        """
+        self._start_time = time.monotonic()
+        self._num_days = 0
+
+    def wait(self, day_start_time, sleep=None):
+        """ Waits until the next day is due to start.
+
+        :param day_start_time: The time.monotonic() value when the day started.
+        :param sleep: The function to wait with, which may return early, or None to use time.sleep.
+        :return: none
+        """
+        self._num_days += 1
+        remaining = self._start_time + self._num_days * self.interval - time.monotonic()
+        if remaining > 0:
+            (sleep or time.sleep)(remaining)
+
+
+class UnthrottledPacing:
+    """ Runs the backtest as fast as it can be processed. """
+
+    def reset(self):
+        pass
+
+    def wait(self, day_start_time, sleep=None):
+        pass
+
+
+def create_pacing(settings, default=REAL_TIME):
+    """ Creates the pacing policy set in the backtest settings.
+
+    :param settings: The dict of backtest settings, which may hold 'pacing' (realTime, fixedRate or unthrottled),
+        'secondsPerDay' for real time pacing and 'daysPerSecond' for a fixed rate.
+    :param default: The policy to use if the settings do not set one.
+    :return: A pacing policy object.
+    """
+    policy = settings.get('pacing') or default
+    if policy == REAL_TIME:
+        return RealTimePacing(settings.get('secondsPerDay', 1.5))
+    elif policy == FIXED_RATE:
+        return FixedRatePacing(settings['daysPerSecond'])
+    elif policy == UNTHROTTLED:
+        return UnthrottledPacing()
+    else:
+        raise ValueError(f"Pacing policy '{policy}' is not recognised.")
+
+
+class UICadence:
+    """ Decides which days of the backtest are sent to the UI, limiting them to frames_per_second. Without a limit every
+        day is sent. The days in between are still simulated in full, but only the changes that must not be lost (new
+        and closed trades) are sent for them. """
+
+    def __init__(self, frames_per_second=None):
+        self.frame_interval = 1 / frames_per_second if frames_per_second else None
+        self._next_frame_time = None
+
+    def next_day(self):
+        """ Decides whether the day that is starting is sent to the UI.
+
+        :return: True if the day's state is sent to the UI.
+        """
+        if self.frame_interval is None:
+            return True
+        now = time.monotonic()
+        if self._next_frame_time is None:
+            self._next_frame_time = now
+        elif now < self._next_frame_time:
+            return False
+        # Frames are scheduled at a steady interval, unless the backtest has fallen more than a frame behind.
+        self._next_frame_time = max(self._next_frame_time + self.frame_interval, now)
+        return True
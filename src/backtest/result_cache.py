@@ -0,0 +1,158 @@
+""" Memoises the results of headless backtests, so that a backtest that has already been run with the same settings,
+    strategy, seed and market data returns the results of the earlier run rather than being run again. Each entry is a
+    directory holding the files written by a ResultSink, keyed by a hash of the normalised settings (including the
+    strategy configuration and the seed), the tickers and the version of each ticker's historical data.
+
+    Only backtests with a seed are cached, as without one the day's trade is picked at random and the results of a run
+    cannot be repeated. As the data versions are part of the key, an entry is never returned once the data it was run
+    on has been downloaded again or updated, and evict_stale removes such entries from disk. """
+
+from src.data_handlers.historical_data_handler import HistoricalDataHandler
+from src.data_handlers.result_sink import TABLES
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger("result_cache")
+
+# Changed whenever the results written by a backtest change, so that entries written by an earlier version are not used.
+CACHE_FORMAT = 3
+ENTRY_FILE = "entry.json"
+# The age after which an entry left part way through being written is removed.
+TEMP_EXPIRY_SECONDS = 24 * 60 * 60
+# The results copied to and from the cache, the checkpoints of a run are not needed once it has finished.
+RESULT_FILES = TABLES + ("summary.json",)
+# Settings that change how a backtest is run, shown or identified, but not its results.
+UNKEYED_SETTINGS = frozenset({
+    "backtestId", "strategyId", "tickers", "asyncRequests", "compressRequests", "streamUpdates", "deltaUpdates",
+    "deferredFigures", "uiFramesPerSecond", "pacing", "secondsPerDay", "daysPerSecond", "checkpointDays",
+    "checkpointPath"
+})
+
+
+def normalise_settings(settings):
+    """ Converts the settings of a backtest into a canonical string, leaving out the settings that do not change its
+        results so that backtests differing only in them share an entry.
+
+    :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+    :return: A JSON string with sorted keys, and the dates in ISO format.
+    """
+    keyed = {key: value for key, value in settings.items() if key not in UNKEYED_SETTINGS}
+    return json.dumps(keyed, sort_keys=True, default=lambda value: value.isoformat())
+
+
+class ResultCache:
+
+    def __init__(self, directory="result_cache", hist_data_handler=None):
+        """ Constructor for a cache of backtest results.
+
+        :param directory: The directory holding the entries.
+        :param hist_data_handler: The HistoricalDataHandler the versions of the historical data are read from.
+        """
+        self.directory = directory
+        self.hist_data_handler = hist_data_handler or HistoricalDataHandler()
+        # The data versions of each key created, recorded in the entry when its results are stored.
+        self._versions = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, settings, tickers):
+        """ Creates the key of a backtest's results.
+
+        :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+        :param tickers: A list of company tickers backtested.
+        :return: A string holding the key, or None if the backtest has no seed and so cannot be cached.
+        """
+        if settings.get('seed') is None:
+            return None
+        versions = self.hist_data_handler.get_data_versions(sorted(set(tickers)))
+        content = json.dumps([CACHE_FORMAT, normalise_settings(settings), versions], sort_keys=True)
+        key = hashlib.sha256(content.encode()).hexdigest()
+        self._versions[key] = versions
+        return key
+
+    def fetch(self, key, output):
+        """ Copies the cached results of a backtest to its output directory, replacing any results already there.
+
+        :param key: The key of the results.
+        :param output: The directory to write the results to.
+        :return: True if the results were cached, False if the backtest needs to be run.
+        """
+        entry = os.path.join(self.directory, key)
+        if not os.path.exists(os.path.join(entry, ENTRY_FILE)):
+            return False
+        os.makedirs(output, exist_ok=True)
+        for name in RESULT_FILES:
+            target = os.path.join(output, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            if os.path.isdir(os.path.join(entry, name)):
+                shutil.copytree(os.path.join(entry, name), target)
+            else:
+                shutil.copy2(os.path.join(entry, name), target)
+        logger.info(f"Copied the cached results {key[:12]} to '{output}'")
+        return True
+
+    def store(self, key, results_directory):
+        """ Adds the results of a finished backtest to the cache. The entry is written to a temporary directory that is
+            then renamed, so that an entry is never read part way through being written.
+
+        :param key: The key created for the backtest before it was run.
+        :param results_directory: The directory its ResultSink wrote the results to.
+        :return: none
+        """
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+        temp_entry = os.path.join(self.directory, f"{key}.tmp-{uuid.uuid4().hex}")
+        os.makedirs(temp_entry)
+        for name in RESULT_FILES:
+            source = os.path.join(results_directory, name)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(temp_entry, name))
+            else:
+                shutil.copy2(source, os.path.join(temp_entry, name))
+        with open(os.path.join(temp_entry, ENTRY_FILE), "w") as f:
+            json.dump({"format": CACHE_FORMAT, "versions": self._versions[key]}, f)
+        try:
+            os.rename(temp_entry, entry)
+        except OSError:
+            # The same backtest was stored by another process meanwhile.
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            return
+        logger.info(f"Cached the results of '{results_directory}' as {key[:12]}")
+
+    def evict_stale(self):
+        """ Removes the entries whose historical data has changed since they were run, or that were written by an
+            earlier version of the cache, along with any left part way through being written.
+
+        :return: The number of entries removed.
+        """
+        entries = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                with open(os.path.join(path, ENTRY_FILE)) as f:
+                    entries[path] = json.load(f)
+            except (OSError, ValueError):
+                entries[path] = None
+        tickers = {ticker for entry in entries.values() if entry is not None for ticker in entry["versions"]}
+        current = self.hist_data_handler.get_data_versions(sorted(tickers)) if tickers else {}
+
+        num_evicted = 0
+        for path, entry in entries.items():
+            if entry is not None and entry["format"] == CACHE_FORMAT \
+                    and all(current[ticker] == version for ticker, version in entry["versions"].items()):
+                continue
+            # Entries are renamed into place once written, so a temporary directory is either being written by another
+            # process or was left by one that died while storing it.
+            if ".tmp-" in path and time.time() - os.path.getmtime(path) < TEMP_EXPIRY_SECONDS:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            num_evicted += 1
+        if num_evicted:
+            logger.info(f"Evicted {num_evicted} stale entries from the result cache")
+        return num_evicted
@@ -0,0 +1,279 @@
+""" Runs a parameter sweep: many headless backtests of the same settings and strategy with different parameters, spread
+    across a pool of processes. The market data is loaded once and published to shared memory, which every worker
+    attaches to rather than reading the database. Each run writes its results to its own directory, and the summary of
+    the sweep ranks the runs by their return and then by their drawdown. With a result cache, runs that have been run
+    before on the same data are copied from the cache rather than being run again.
+
+    Parameters are named by their key in the backtest settings (e.g. 'capPct'), or by the name of a technical analysis
+    module and the key in its configuration (e.g. 'Bollinger Bands.dayPeriod'). A sweep is specified either as a grid,
+    which runs every combination of the listed values:
+
+        {"grid": {"capPct": [0.1, 0.25], "Bollinger Bands.dayPeriod": [10, 20]}}
+
+    or as a random search, which samples each parameter from a list of values or a {"min": .., "max": ..} range, the
+    range being of integers if both of its bounds are:
+
+        {"random": {"takeProfit": {"min": 1.01, "max": 1.1},
+                    "Moving Averages.longTermDayPeriod": {"min": 10, "max": 50}},
+         "samples": 20, "seed": 1} """
+
+from src.backtest.backtest import Backtest
+from src.data_handlers.market_data_store import MarketDataStore, SharedMarketDataStore, publish
+from src.data_handlers.result_sink import ResultSink, read_table
+from src.strategy.strategy import Strategy
+import copy
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+import types
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("sweep")
+
+# The market data attached to by each worker process.
+_worker_store = None
+
+
+def expand_grid(grid):
+    """ Creates every combination of the values of the parameters in a grid.
+
+    :param grid: A dict holding the list of values of each parameter.
+    :return: A list of dicts, each holding one value of every parameter.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sample_random(space, num_samples, seed=None):
+    """ Samples random values of the parameters in a search space.
+
+    :param space: A dict holding either a list of values or a {"min": .., "max": ..} range of each parameter.
+    :param num_samples: The number of parameter sets to sample.
+    :param seed: The seed of the random number generator, so that a search can be repeated.
+    :return: A list of dicts, each holding one value of every parameter.
+    """
+    rng = np.random.default_rng(seed)
+    parameter_sets = []
+    for _ in range(num_samples):
+        parameters = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                low, high = values['min'], values['max']
+                if isinstance(low, int) and isinstance(high, int):
+                    parameters[name] = int(rng.integers(low, high, endpoint=True))
+                else:
+                    parameters[name] = float(rng.uniform(low, high))
+            else:
+                parameters[name] = values[rng.integers(len(values))]
+        parameter_sets.append(parameters)
+    return parameter_sets
+
+
+def parameter_sets(spec):
+    """ Creates the parameter sets of a sweep.
+
+    :param spec: A dict holding either a 'grid', or a 'random' search space with the number of 'samples' and an
+        optional 'seed'.
+    :return: A list of dicts, each holding one value of every parameter.
+    """
+    if 'grid' in spec:
+        return expand_grid(spec['grid'])
+    elif 'random' in spec:
+        return sample_random(spec['random'], spec['samples'], spec.get('seed'))
+    else:
+        raise ValueError("A sweep must be specified as either a 'grid' or a 'random' search.")
+
+
+def apply_parameters(settings, parameters):
+    """ Creates the settings of a run of the sweep, by setting the parameters on a copy of the base settings.
+
+    :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+    :param parameters: A dict holding the value of each parameter.
+    :return: A new dict of settings.
+    """
+    settings = copy.deepcopy(settings)
+    modules = {module['name']: module['config'] for module in settings['strategy']['technicalAnalysis']}
+    for name, value in parameters.items():
+        if "." in name:
+            module_name, key = name.split(".", 1)
+            if module_name not in modules:
+                raise ValueError(f"The strategy does not use the technical analysis module '{module_name}'.")
+            modules[module_name][key] = value
+        else:
+            settings[name] = value
+    return settings
+
+
+def max_drawdown_pct(balances):
+    """ Calculates the largest fall of an equity curve from its highest point so far.
+
+    :param balances: An array holding the total balance on each day, or a 2D array with a column per equity curve.
+    :return: The maximum drawdown, as a percentage of the highest balance before it, or an array holding the maximum
+        drawdown of each column.
+    """
+    if len(balances) == 0:
+        return 0
+    peaks = np.maximum.accumulate(balances, axis=0)
+    drawdowns = ((peaks - balances) / peaks).max(axis=0) * 100
+    return float(drawdowns) if np.ndim(drawdowns) == 0 else drawdowns
+
+
+def summarise_backtest(backtest):
+    """ Gets the results of a finished backtest that the runs of a sweep are compared by.
+
+    :param backtest: The Backtest object, once it has finished.
+    :return: A dict holding the results.
+    """
+    summary = backtest.ledger.summary()
+    return {
+        "total_balance": backtest.total_balance,
+        "return_pct": (backtest.total_balance / backtest.start_balance - 1) * 100,
+        "max_drawdown_pct": max_drawdown_pct(backtest.equity_balances.values),
+        "num_trades": summary['num_trades'],
+        "win_rate_pct": summary['win_rate_pct']
+    }
+
+
+def summarise_results(directory, start_balance):
+    """ Gets the same results as summarise_backtest from the files written by a finished backtest's ResultSink, for runs
+        whose results were copied from the result cache rather than run.
+
+    :param directory: The directory the results were written to.
+    :param start_balance: The start balance of the backtest.
+    :return: A dict holding the results.
+    """
+    with open(os.path.join(directory, "summary.json")) as f:
+        summary = json.load(f)
+    equity = read_table(directory, "equity")
+    return {
+        "total_balance": summary['total_balance'],
+        "return_pct": (summary['total_balance'] / start_balance - 1) * 100,
+        "max_drawdown_pct": max_drawdown_pct(equity['total_balance'].to_numpy() if len(equity) else np.empty(0)),
+        "num_trades": summary['num_trades'],
+        "win_rate_pct": summary['win_rate_pct']
+    }
+
+
+def rank_runs(rows):
+    """ Creates the summary table of a sweep, ranking the runs by return and then by drawdown.
+
+    :param rows: A list of dicts, each holding the parameters and results of a run.
+    :return: A DataFrame holding a row per run, best first.
+    """
+    summary = pd.DataFrame(rows).sort_values(["return_pct", "max_drawdown_pct"], ascending=[False, True],
+                                             kind="stable", ignore_index=True)
+    summary.insert(0, "rank", np.arange(1, len(summary) + 1))
+    return summary
+
+
+def _materialise_indicators(store, runs, tickers):
+    """ Materialises the indicators used by every run's strategy before the market data is published, as the workers
+        cannot add them to the shared data.
+
+    :param store: The MarketDataStore that is published.
+    :param runs: A list of the settings of each run.
+    :param tickers: A list of company tickers.
+    :return: none
+    """
+    specs = set()
+    for strategy_config in {str(settings['strategy']): settings['strategy'] for settings in runs}.values():
+        # The strategy only needs to know where to read the market data from to find the indicators it uses.
+        strategy = Strategy(strategy_config, types.SimpleNamespace(market_data=store))
+        specs.update(strategy.required_indicators)
+    if specs:
+        store.materialise_indicators(tickers, sorted(specs))
+
+
+def _attach_worker(name, layout, log_level):
+    """ Sets up a worker process, attaching it to the published market data.
+
+    :param name: The name of the SharedMemory block holding the market data.
+    :param layout: The layout of the block returned by publish.
+    :param log_level: The logging level of the worker.
+    :return: none
+    """
+    global _worker_store
+    logging.getLogger().setLevel(log_level)
+    logging.getLogger("trade_handler").setLevel(log_level)
+    _worker_store = SharedMarketDataStore(name, layout)
+
+
+def _run(run_id, parameters, settings, tickers, output):
+    """ Runs a backtest of the sweep in a worker process.
+
+    :param run_id: The number of the run in the sweep.
+    :param parameters: A dict holding the value of each parameter of the run.
+    :param settings: The dict of settings of the run.
+    :param tickers: A list of company tickers.
+    :param output: The directory the sweep's results are written to.
+    :return: A dict holding the parameters and results of the run.
+    """
+    settings['backtestId'] = run_id
+    start_time = time.monotonic()
+    backtest = Backtest(settings, sink=ResultSink(os.path.join(output, f"run-{run_id:05d}")),
+                        market_data=_worker_store)
+    backtest.start_backtest(tickers)
+    backtest.ledger.close()
+    return {"run": run_id, **parameters, **summarise_backtest(backtest), "seconds": time.monotonic() - start_time}
+
+
+def run_sweep(settings, tickers, spec, output, processes=None, log_level="WARNING", cache=None):
+    """ Runs every backtest of a sweep across a pool of processes, and writes the ranked summary of the runs to
+        summary.csv in the output directory.
+
+    :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+    :param tickers: A list of company tickers.
+    :param spec: A dict specifying the parameters of the sweep, see parameter_sets.
+    :param output: The directory to write the results to, each run writes its own to a 'run-<number>' directory.
+    :param processes: The number of worker processes, defaults to the number of cores.
+    :param log_level: The logging level of the worker processes, per-day logging slows the backtests.
+    :param cache: A ResultCache the results of runs are copied from if they have been run before, and added to once
+        they are run. Only runs with a seed in their settings are cached.
+    :return: A DataFrame holding the summary, best run first.
+    """
+    sets = parameter_sets(spec)
+    runs = [apply_parameters(settings, parameters) for parameters in sets]
+    logger.info(f"Sweeping {len(runs)} backtests over {len(tickers)} tickers")
+
+    # The runs that have been run before are copied from the cache, and only the rest are run.
+    rows = []
+    pending = []
+    keys = {}
+    for run_id, (parameters, run_settings) in enumerate(zip(sets, runs), 1):
+        start_time = time.monotonic()
+        directory = os.path.join(output, f"run-{run_id:05d}")
+        keys[run_id] = cache.key(run_settings, tickers) if cache is not None else None
+        if keys[run_id] is not None and cache.fetch(keys[run_id], directory):
+            rows.append({"run": run_id, **parameters,
+                         **summarise_results(directory, run_settings['startBalance']),
+                         "seconds": time.monotonic() - start_time})
+        else:
+            pending.append((run_id, parameters, run_settings, tickers, output))
+    if rows:
+        logger.info(f"Copied the results of {len(rows)} backtests from the cache, running {len(pending)}")
+
+    if pending:
+        store = MarketDataStore()
+        _materialise_indicators(store, [run_settings for _, _, run_settings, _, _ in pending], tickers)
+        memory, layout = publish(store, tickers)
+        # The workers read the data from the shared block, so the copy held by the store can be released.
+        del store
+        try:
+            with multiprocessing.Pool(processes, initializer=_attach_worker,
+                                      initargs=(memory.name, layout, log_level)) as pool:
+                rows.extend(pool.starmap(_run, pending))
+        finally:
+            memory.close()
+            memory.unlink()
+        for run_id, _, _, _, _ in pending:
+            if keys[run_id] is not None:
+                cache.store(keys[run_id], os.path.join(output, f"run-{run_id:05d}"))
+
+    summary = rank_runs(rows)
+    os.makedirs(output, exist_ok=True)
+    summary.to_csv(os.path.join(output, "summary.csv"), index=False)
+    return summary
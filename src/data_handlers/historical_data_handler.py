@@ -1,10 +1,13 @@
 from src.data_validators.historical_data_validator import HistoricalDataValidator
 from src.data_validators import date_validator
+from src.data_handlers import indicator_store
 from src.exceptions.custom_exceptions import InvalidMarketIndexError, InvalidHistoricalDataIndexError, \
     InvalidHistoricalDataError
 
+import hashlib
 import math
 import datetime as dt
+import numpy as np
 import pandas as pd
 import pandas_datareader as web
 import requests
@@ -17,6 +20,9 @@ import time
 import threading
 import sqlite3
 
+# The columns held in each ticker's historical data table.
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume", "adj_close"]
+
 
 class HistoricalDataHandler:
     num_tickers = 0
@@ -97,7 +103,7 @@ class HistoricalDataHandler:
         self.num_tickers = len(tickers)
         return tickers
 
-    def get_hist_dataframe(self, ticker, backtest_date, num_weeks=12, num_days=0):
+    def get_hist_dataframe(self, ticker, backtest_date, num_weeks=12, num_days=0, indicators=None, conn=None):
         """ Retrieves the historical dataframe for the specified ticker from the SQLite database, for a number of
             days or weeks before the given date.
 
@@ -105,11 +111,15 @@ class HistoricalDataHandler:
         :param backtest_date: A datetime object holding the 'end' date to retrieve.
         :param num_weeks: Number of weeks worth of data to retrieve before 'end' date.
         :param num_days: Number of days worth of data to retrieve before 'end' date.
+        :param indicators: A list of indicator keys (e.g. 'sma_20') to add as columns, if they have been materialised.
+        :param conn: An open connection to the SQLite database to use, a new one is opened if not provided.
         :return: A DataFrame holding the historical data for the given period.
         """
 
         # Connect to SQLite database.
-        conn = sqlite3.connect('historical_data/historical_data.db')
+        close_conn = conn is None
+        if close_conn:
+            conn = sqlite3.connect('historical_data/historical_data.db')
         c = conn.cursor()
         # Calculate the 'start' date for the date range.
         buffer_date = backtest_date - dt.timedelta(weeks=num_weeks, days=num_days)
@@ -124,17 +134,129 @@ class HistoricalDataHandler:
             # If trying to access a data that doesn't exist, throw exception.
             raise InvalidHistoricalDataIndexError(ticker, buffer_date, first_date)
 
+        # Join on any of the requested indicators that have been materialised for this ticker.
+        materialised = []
+        if indicators:
+            available_keys = indicator_store.get_materialised_keys(conn, ticker)
+            materialised = [key for key in indicators if key in available_keys]
+
         # Grab historical dataframe from the relevant SQLite table for the correct date range.
-        historical_df = pd.read_sql_query(
-            f"""SELECT * FROM '{ticker}' WHERE `date` > ? AND `date` <= ?""", conn, params=[buffer_date, backtest_date],
-            index_col='date', parse_dates=['date'])
+        if materialised:
+            columns = ", ".join(f"i.[{key}]" for key in materialised)
+            historical_df = pd.read_sql_query(
+                f"""SELECT p.*, {columns} FROM '{ticker}' p LEFT JOIN '{ticker}_indicators' i ON p.`date` = i.`date`
+                        WHERE p.`date` > ? AND p.`date` <= ?""", conn, params=[buffer_date, backtest_date],
+                index_col='date', parse_dates=['date'])
+        else:
+            historical_df = pd.read_sql_query(
+                f"""SELECT * FROM '{ticker}' WHERE `date` > ? AND `date` <= ?""", conn,
+                params=[buffer_date, backtest_date], index_col='date', parse_dates=['date'])
 
         # Add the ticker to the dataframe's custom attributes for later identification.
         historical_df.attrs['ticker'] = ticker
 
-        conn.close()
+        if close_conn:
+            conn.close()
         return historical_df
 
+    def get_hist_dataframes(self, tickers, backtest_date, num_weeks=12, num_days=0, indicators=None):
+        """ Retrieves the historical dataframes for many tickers using a single connection to the SQLite database.
+
+        :param tickers: A list of company tickers to retrieve.
+        :param backtest_date: A datetime object holding the 'end' date to retrieve.
+        :param num_weeks: Number of weeks worth of data to retrieve before 'end' date.
+        :param num_days: Number of days worth of data to retrieve before 'end' date.
+        :param indicators: A list of indicator keys (e.g. 'sma_20') to add as columns, if they have been materialised.
+        :return: A list of DataFrames holding the historical data, in the same order as the tickers.
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db')
+        try:
+            return [self.get_hist_dataframe(ticker, backtest_date, num_weeks, num_days, indicators, conn)
+                    for ticker in tickers]
+        finally:
+            conn.close()
+
+    def get_future_closes(self, ticker, date):
+        """ Retrieves every close price of a ticker after the given date.
+
+        :param ticker: String of the company ticker to retrieve.
+        :param date: A datetime object, only dates after this are retrieved.
+        :return dates: An array holding the dates of the close prices.
+        :return closes: An array holding the close prices, oldest first.
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db')
+        rows = conn.execute(f"""SELECT `date`, close FROM '{ticker}' WHERE `date` > ? ORDER BY `date`""",
+                            [date]).fetchall()
+        conn.close()
+
+        dates = np.array([row[0] for row in rows], dtype="datetime64[s]")
+        closes = np.array([row[1] for row in rows], dtype=float)
+        return dates, closes
+
+    def get_latest_closes(self, tickers, backtest_date, num_bars):
+        """ Retrieves the most recent close prices of many tickers at once, to be used in cheap vectorised checks over
+            the whole universe. Tickers that are marked as invalid or have not been downloaded are left out.
+
+        :param tickers: A list of company tickers.
+        :param backtest_date: A datetime object holding the 'end' date to retrieve.
+        :param num_bars: The number of most recent days to retrieve for each ticker.
+        :return tickers: The list of tickers that have been retrieved.
+        :return closes: A 2D array holding the close prices, one row per ticker with the oldest price first. Rows are
+            padded with NaN at the start if the ticker does not have enough data.
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db')
+        c = conn.cursor()
+
+        valid_tickers = {ticker for ticker, in c.execute("""SELECT ticker FROM available_tickers WHERE valid""")}
+        tickers = [ticker for ticker in tickers if ticker in valid_tickers]
+
+        closes = np.full((len(tickers), num_bars), np.nan)
+        for i, ticker in enumerate(tickers):
+            rows = c.execute(f"""SELECT close FROM '{ticker}' WHERE `date` <= ? ORDER BY `date` DESC LIMIT ?""",
+                             [backtest_date, num_bars]).fetchall()
+            if rows:
+                # Rows come out newest first, so reverse them into the end of the row.
+                closes[i, num_bars - len(rows):] = [row[0] for row in reversed(rows)]
+
+        conn.close()
+        return tickers, closes
+
+    def materialise_indicators(self, tickers, specs):
+        """ Makes sure the given indicators are materialised in the SQLite database for every ticker in the list.
+
+        :param tickers: A list of company tickers.
+        :param specs: A list of (indicator, period) tuples to materialise.
+        :return: none
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db', timeout=10)
+        c = conn.cursor()
+        valid_tickers = {ticker for ticker, in c.execute("""SELECT ticker FROM available_tickers WHERE valid""")}
+
+        for ticker in tickers:
+            if ticker in valid_tickers:
+                indicator_store.materialise_indicators(conn, ticker, specs)
+        conn.close()
+
+    def get_data_versions(self, tickers):
+        """ Gets the version of each ticker's historical data, which changes whenever its data is downloaded or updated.
+            Versions are recorded when the data is saved, and worked out from the table for data saved before they were.
+
+        :param tickers: A list of company tickers.
+        :return: A dict holding the version of each ticker, None for tickers that have no historical data.
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db', timeout=10)
+        c = conn.cursor()
+        _create_data_versions(c)
+        versions = dict(c.execute("""SELECT ticker, version FROM data_versions"""))
+        tables = {name for name, in c.execute("""SELECT name FROM sqlite_master WHERE type='table'""")}
+        result = {}
+        for ticker in tickers:
+            if ticker not in versions and ticker in tables:
+                versions[ticker] = record_data_version(conn, ticker)
+            result[ticker] = versions.get(ticker)
+        conn.close()
+        return result
+
     def sqlite_table_up_to_date(self, ticker):
         """ Opens the ticker's SQLite table  and checks to see if the data runs up to the date set in self.start_date,
             which is yesterday by default due to that being guaranteed to be the last full day of data.
@@ -191,7 +313,7 @@ class HistoricalDataHandler:
                 historical_df = web.DataReader(ticker, "yahoo", self.start_date, self.end_date)
                 historical_df = historical_df.reset_index().reindex(
                     columns=["Date", "Open", "High", "Low", "Close", "Volume", "Adj Close"])
-                historical_df.columns = ["date", "open", "high", "low", "close", "volume", "adj_close"]
+                historical_df.columns = ["date"] + PRICE_COLUMNS
 
                 # Validate data, and save into a SQLite table.
                 valid = HistoricalDataValidator(historical_df).validate_data()
@@ -202,6 +324,12 @@ class HistoricalDataHandler:
                                     VALUES (?, ?, ?, ?, ?)''',
                           [ticker, valid, self.market_index, first_date, last_date])
                 conn.commit()
+                record_data_version(conn, ticker)
+
+                # Any indicators left over from a previous table are stale, so compute them again on the new data.
+                indicator_store.invalidate_indicators(conn, ticker)
+                if valid:
+                    indicator_store.materialise_indicators(conn, ticker)
             # If table already exists in SQLite DB, check to see if it has data up until self.end_date.
             else:
                 # Check to see if the dataset has been marked as invalid.
@@ -230,7 +358,7 @@ class HistoricalDataHandler:
                         continue
                     historical_df = historical_df.reset_index().reindex(
                         columns=["Date", "Open", "High", "Low", "Close", "Volume", "Adj Close"])
-                    historical_df.columns = ["date", "open", "high", "low", "close", "volume", "adj_close"]
+                    historical_df.columns = ["date"] + PRICE_COLUMNS
 
                     # Validate data, and append to an existing SQLite table.
                     valid = HistoricalDataValidator(historical_df).validate_data()
@@ -239,6 +367,11 @@ class HistoricalDataHandler:
                                                     SET valid=?, last_date=?
                                                         WHERE ticker=? """, [valid, self.end_date, ticker])
                     conn.commit()
+                    record_data_version(conn, ticker)
+
+                    # Extend the materialised indicators with the new days.
+                    if valid:
+                        indicator_store.materialise_indicators(conn, ticker)
             conn.close()
 
     def multithreaded_data_download(self, tickers):
@@ -280,6 +413,33 @@ class HistoricalDataHandler:
         log.info(f"Historical data checks completed in: {total_time}")
 
 
+def _create_data_versions(c):
+    """ Creates the table holding the version of each ticker's historical data, if it does not already exist.
+
+    :param c: A cursor of the SQLite database.
+    :return: none
+    """
+    c.execute("""CREATE TABLE IF NOT EXISTS data_versions ([ticker] text PRIMARY KEY, [version] text)""")
+
+
+def record_data_version(conn, ticker):
+    """ Records the version of a ticker's historical data, a fingerprint of its table's size, date range and prices.
+        Replacing or appending to the data changes at least one of them.
+
+    :param conn: A connection to the SQLite database.
+    :param ticker: String of the company ticker.
+    :return: A string holding the version.
+    """
+    c = conn.cursor()
+    _create_data_versions(c)
+    stats = c.execute(f"""SELECT count(*), min(`date`), max(`date`), total(close), total(adj_close), total(volume)
+                              FROM '{ticker}'""").fetchone()
+    version = hashlib.sha256(repr(stats).encode()).hexdigest()[:16]
+    c.execute("""INSERT OR REPLACE INTO data_versions (ticker, version) VALUES (?, ?)""", [ticker, version])
+    conn.commit()
+    return version
+
+
 def split_list(tickers, num_portions, portion_id):
     """ Splits a list into equal sections, returns the portion of the list needed by that thread/thread.
 
@@ -0,0 +1,192 @@
+""" Materialises common indicator series (SMA/EMA/rolling stdev) into the SQLite database next to the price data, so
+    that they are computed once per ticker rather than in every backtest. Each ticker's indicators are held in a
+    '<ticker>_indicators' table with one column per indicator and parameter (e.g. 'sma_20'), and the
+    materialised_indicators table records what has been computed and on which data. """
+
+import numpy as np
+import pandas as pd
+import logging as log
+
+# Indicators materialised for every ticker whenever its historical data is downloaded or updated. EMAs are not read
+# by the strategies (see get_materialised), so they are only materialised when asked for.
+DEFAULT_INDICATORS = [("sma", 20), ("sma", 50), ("sma", 200), ("std", 20)]
+
+
+def indicator_key(indicator, period):
+    """ Creates the key used to identify a materialised indicator, which is also its column name.
+
+    :param indicator: The type of indicator ('sma', 'ema' or 'std').
+    :param period: The day period of the indicator.
+    :return: A string holding the key, e.g. 'sma_20'.
+    """
+    return f"{indicator}_{int(period)}"
+
+
+def calculate_indicator(closes, indicator, period, seed=None):
+    """ Calculates an indicator series from a series of close prices.
+
+    :param closes: A Series holding the close prices.
+    :param indicator: The type of indicator ('sma', 'ema' or 'std').
+    :param period: The day period of the indicator.
+    :param seed: The indicator value on the day before the first close, only used to continue an EMA.
+    :return: A Series holding the indicator values.
+    """
+    if indicator == "sma":
+        return closes.rolling(window=period).mean()
+    elif indicator == "std":
+        return closes.rolling(window=period).std()
+    elif indicator == "ema":
+        if seed is None:
+            return closes.ewm(span=period, adjust=False).mean()
+        # Continue the EMA from the previous value by placing it in front of the new close prices.
+        seeded = pd.concat([pd.Series([seed]), closes.reset_index(drop=True)])
+        res = seeded.ewm(span=period, adjust=False).mean()[1:]
+        res.index = closes.index
+        return res
+    else:
+        raise ValueError(f"Indicator type '{indicator}' cannot be materialised.")
+
+
+def get_materialised(df, indicator, period):
+    """ Gets a materialised indicator series from a historical dataframe, if it was retrieved with one. The values
+        match those calculated from the dataframe alone, so that a strategy's signals do not depend on which
+        indicators happen to be materialised: the days before the first full window are left empty. An EMA depends
+        on every close before it rather than on a window, so one materialised over the full history cannot match and
+        None is returned for it.
+
+    :param df: A DataFrame object holding a ticker's historical data.
+    :param indicator: The type of indicator ('sma' or 'std').
+    :param period: The day period of the indicator.
+    :return: A Series holding the indicator values, or None if it is not in the dataframe, is missing values that
+        could be calculated from the dataframe or is an EMA.
+    """
+    key = indicator_key(indicator, period)
+    if indicator == "ema" or key not in df.columns or df[key].iloc[int(period) - 1:].isna().any():
+        return None
+    res = df[key].copy()
+    res.iloc[:int(period) - 1] = np.nan
+    return res
+
+
+def _create_registry(c):
+    """ Creates the table that records which indicators have been materialised, if it does not already exist.
+
+    :param c: A cursor for the SQLite database.
+    :return: none
+    """
+    c.execute("""CREATE TABLE IF NOT EXISTS materialised_indicators
+                     ([ticker] text, [indicator_key] text, [first_date] datetime, [last_date] datetime,
+                      [num_rows] integer, [close_sum] real)""")
+
+
+def get_materialised_keys(conn, ticker):
+    """ Gets the keys of all indicators that have been materialised for a ticker.
+
+    :param conn: A connection to the SQLite database.
+    :param ticker: String of the company ticker.
+    :return: A set of indicator keys.
+    """
+    c = conn.cursor()
+    exists = c.execute("""SELECT count(name) FROM sqlite_master WHERE type='table' AND name='materialised_indicators'""")\
+        .fetchone()[0]
+    if not exists:
+        return set()
+    return {key for key, in c.execute("""SELECT indicator_key FROM materialised_indicators WHERE ticker=?""",
+                                      [ticker])}
+
+
+def invalidate_indicators(conn, ticker):
+    """ Removes all materialised indicators of a ticker, so that they are recalculated from scratch.
+
+    :param conn: A connection to the SQLite database.
+    :param ticker: String of the company ticker.
+    :return: none
+    """
+    c = conn.cursor()
+    _create_registry(c)
+    c.execute(f"""DROP TABLE IF EXISTS '{ticker}_indicators'""")
+    c.execute("""DELETE FROM materialised_indicators WHERE ticker=?""", [ticker])
+    conn.commit()
+
+
+def materialise_indicators(conn, ticker, specs=None):
+    """ Makes sure the given indicators are materialised and up to date for a ticker. Missing indicators are computed
+        from the full price history, indicators behind the price data are extended with the new days only, and all of
+        the ticker's indicators are invalidated if the price data they were computed on has changed.
+
+    :param conn: A connection to the SQLite database.
+    :param ticker: String of the company ticker.
+    :param specs: A list of (indicator, period) tuples to materialise. Defaults to DEFAULT_INDICATORS plus every
+        indicator that has already been materialised for the ticker.
+    :return: none
+    """
+    c = conn.cursor()
+    _create_registry(c)
+    first_date, last_date = c.execute(f"""SELECT min(`date`), max(`date`) FROM '{ticker}'""").fetchone()
+    if last_date is None:
+        return
+
+    registry = {row[0]: row[1:] for row in
+                c.execute("""SELECT indicator_key, first_date, last_date, num_rows, close_sum
+                                 FROM materialised_indicators WHERE ticker=?""", [ticker])}
+
+    # Check that the price data the indicators were computed on has not changed, other than by new days appended.
+    for key_first_date, key_last_date, num_rows, close_sum in registry.values():
+        rows_covered, close_sum_covered = c.execute(f"""SELECT count(*), total(close) FROM '{ticker}'
+                                                            WHERE `date` <= ?""", [key_last_date]).fetchone()
+        if key_first_date != first_date or rows_covered != num_rows \
+                or abs(close_sum_covered - close_sum) > abs(close_sum) * 1e-9:
+            log.debug(f"Price data for {ticker} has changed, invalidating its materialised indicators")
+            invalidate_indicators(conn, ticker)
+            registry = {}
+            break
+
+    if specs is None:
+        specs = DEFAULT_INDICATORS + [(key.split("_")[0], int(key.split("_")[1])) for key in registry]
+    specs = list(dict.fromkeys((indicator, int(period)) for indicator, period in specs))
+
+    c.execute(f"""CREATE TABLE IF NOT EXISTS '{ticker}_indicators' ([date] timestamp PRIMARY KEY)""")
+    columns = {row[1] for row in c.execute(f"""PRAGMA table_info('{ticker}_indicators')""")}
+
+    for indicator, period in specs:
+        key = indicator_key(indicator, period)
+        if key not in columns:
+            c.execute(f"""ALTER TABLE '{ticker}_indicators' ADD COLUMN [{key}] real""")
+            columns.add(key)
+
+        if key not in registry:
+            # Compute the indicator from the full price history.
+            prices = pd.read_sql_query(f"""SELECT `date`, close FROM '{ticker}' ORDER BY `date`""", conn)
+            values = calculate_indicator(prices['close'], indicator, period)
+        elif registry[key][1] < last_date:
+            # Extend the indicator with the new days only.
+            key_last_date = registry[key][1]
+            prices = pd.read_sql_query(f"""SELECT `date`, close FROM '{ticker}' WHERE `date` > ? ORDER BY `date`""",
+                                       conn, params=[key_last_date])
+            if indicator == "ema":
+                # Continue the EMA on from its last materialised value.
+                seed = c.execute(f"""SELECT [{key}] FROM '{ticker}_indicators' WHERE `date` = ?""",
+                                 [key_last_date]).fetchone()[0]
+                values = calculate_indicator(prices['close'], indicator, period, seed=seed)
+            else:
+                # Use the closes before the new days to warm up the rolling window.
+                warm_up = pd.read_sql_query(f"""SELECT close FROM '{ticker}' WHERE `date` <= ? ORDER BY `date` DESC
+                                                    LIMIT ?""", conn, params=[key_last_date, period - 1])
+                closes = pd.concat([warm_up['close'][::-1], prices['close']], ignore_index=True)
+                values = calculate_indicator(closes, indicator, period)[len(warm_up):]
+        else:
+            # Already up to date.
+            continue
+
+        rows = [(date, None if pd.isna(value) else float(value)) for date, value in zip(prices['date'], values)]
+        c.executemany(f"""INSERT OR IGNORE INTO '{ticker}_indicators' (`date`) VALUES (?)""", [[row[0]] for row in rows])
+        c.executemany(f"""UPDATE '{ticker}_indicators' SET [{key}]=? WHERE `date`=?""",
+                      [[value, date] for date, value in rows])
+
+        # Record a fingerprint of the price data the indicator was computed on, to detect later changes to it.
+        num_rows, close_sum = c.execute(f"""SELECT count(*), total(close) FROM '{ticker}'""").fetchone()
+        c.execute("""DELETE FROM materialised_indicators WHERE ticker=? AND indicator_key=?""", [ticker, key])
+        c.execute("""INSERT INTO materialised_indicators
+                         (ticker, indicator_key, first_date, last_date, num_rows, close_sum) VALUES (?, ?, ?, ?, ?, ?)""",
+                  [ticker, key, first_date, last_date, num_rows, close_sum])
+    conn.commit()
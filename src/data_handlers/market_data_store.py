@@ -0,0 +1,275 @@
+""" A read-only store of market data held in memory, which is shared by every backtest run by the controller. Each
+    ticker's prices and materialised indicators are read from the SQLite database once, the first time any backtest
+    asks for them, rather than by every backtest on every day. The store answers the same queries as the
+    HistoricalDataHandler by slicing the cached data by date, and hands out copies so that no backtest can change the
+    data that the others see.
+
+    The data can also be published to shared memory, so that backtests run in other processes (e.g. a parameter sweep)
+    attach to one copy of it with a SharedMarketDataStore rather than each reading it from the database. """
+
+from src.data_handlers.historical_data_handler import HistoricalDataHandler
+from src.data_handlers import indicator_store
+from src.exceptions.custom_exceptions import InvalidHistoricalDataIndexError, InvalidHistoricalDataError
+import datetime as dt
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+import sqlite3
+import threading
+
+
+class _TickerData:
+    """ The cached market data of a ticker. """
+    __slots__ = ("valid", "first_date", "dates", "data", "price_columns", "indicator_keys")
+
+    def __init__(self, valid, first_date=None, data=None, indicator_keys=()):
+        self.valid = valid
+        self.first_date = first_date
+        self.data = data
+        self.dates = None if data is None else data.index.values
+        self.indicator_keys = set(indicator_keys)
+        self.price_columns = [] if data is None else [column for column in data.columns
+                                                      if column not in self.indicator_keys]
+
+
+class MarketDataStore:
+
+    def __init__(self, hist_data_handler=None):
+        """ Constructor for the store, which loads each ticker's data when it is first asked for.
+
+        :param hist_data_handler: The HistoricalDataHandler used to materialise indicators in the database.
+        """
+        self.hist_data_handler = hist_data_handler or HistoricalDataHandler()
+        self._tickers = {}
+        # Held while looking up or adding to the cache, with a lock per ticker held while loading it so that a ticker
+        # asked for by several backtests at once is only read from the database once.
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        # Held while materialising indicators, so that backtests starting together do not write to the database at
+        # the same time.
+        self._materialise_lock = threading.Lock()
+
+    def get_hist_dataframe(self, ticker, backtest_date, num_weeks=12, num_days=0, indicators=None, conn=None):
+        """ Retrieves the historical dataframe for the specified ticker, for a number of days or weeks before the given
+            date.
+
+        :param ticker: String of the company ticker to retrieve.
+        :param backtest_date: A datetime object holding the 'end' date to retrieve.
+        :param num_weeks: Number of weeks worth of data to retrieve before 'end' date.
+        :param num_days: Number of days worth of data to retrieve before 'end' date.
+        :param indicators: A list of indicator keys (e.g. 'sma_20') to add as columns, if they have been materialised.
+        :param conn: Unused, accepted so that the store can be used in place of a HistoricalDataHandler.
+        :return: A DataFrame holding the historical data for the given period.
+        """
+        ticker_data = self._get(ticker)
+        if not ticker_data.valid:
+            raise InvalidHistoricalDataError(ticker)
+        # Calculate the 'start' date for the date range.
+        buffer_date = backtest_date - dt.timedelta(weeks=num_weeks, days=num_days)
+        if buffer_date <= ticker_data.first_date:
+            # If trying to access a data that doesn't exist, throw exception.
+            raise InvalidHistoricalDataIndexError(ticker, buffer_date, ticker_data.first_date)
+
+        columns = ticker_data.price_columns + [key for key in indicators or [] if key in ticker_data.indicator_keys]
+        start = np.searchsorted(ticker_data.dates, np.datetime64(buffer_date), side="right")
+        end = np.searchsorted(ticker_data.dates, np.datetime64(backtest_date), side="right")
+        historical_df = ticker_data.data.iloc[start:end][columns].copy()
+
+        # Add the ticker to the dataframe's custom attributes for later identification.
+        historical_df.attrs['ticker'] = ticker
+        return historical_df
+
+    def get_hist_dataframes(self, tickers, backtest_date, num_weeks=12, num_days=0, indicators=None):
+        """ Retrieves the historical dataframes for many tickers.
+
+        :param tickers: A list of company tickers to retrieve.
+        :param backtest_date: A datetime object holding the 'end' date to retrieve.
+        :param num_weeks: Number of weeks worth of data to retrieve before 'end' date.
+        :param num_days: Number of days worth of data to retrieve before 'end' date.
+        :param indicators: A list of indicator keys (e.g. 'sma_20') to add as columns, if they have been materialised.
+        :return: A list of DataFrames holding the historical data, in the same order as the tickers.
+        """
+        return [self.get_hist_dataframe(ticker, backtest_date, num_weeks, num_days, indicators) for ticker in tickers]
+
+    def get_future_closes(self, ticker, date):
+        """ Retrieves every close price of a ticker after the given date.
+
+        :param ticker: String of the company ticker to retrieve.
+        :param date: A datetime object, only dates after this are retrieved.
+        :return dates: An array holding the dates of the close prices.
+        :return closes: An array holding the close prices, oldest first.
+        """
+        ticker_data = self._get(ticker)
+        if ticker_data.data is None:
+            return np.array([], dtype="datetime64[s]"), np.array([], dtype=float)
+        start = np.searchsorted(ticker_data.dates, np.datetime64(date), side="right")
+        return ticker_data.dates[start:].astype("datetime64[s]"), \
+            ticker_data.data['close'].to_numpy(dtype=float)[start:].copy()
+
+    def get_latest_closes(self, tickers, backtest_date, num_bars):
+        """ Retrieves the most recent close prices of many tickers at once. Tickers that are marked as invalid or have
+            not been downloaded are left out.
+
+        :param tickers: A list of company tickers.
+        :param backtest_date: A datetime object holding the 'end' date to retrieve.
+        :param num_bars: The number of most recent days to retrieve for each ticker.
+        :return tickers: The list of tickers that have been retrieved.
+        :return closes: A 2D array holding the close prices, one row per ticker with the oldest price first. Rows are
+            padded with NaN at the start if the ticker does not have enough data.
+        """
+        ticker_data = [(ticker, self._get(ticker)) for ticker in tickers]
+        ticker_data = [(ticker, data) for ticker, data in ticker_data if data.valid]
+
+        closes = np.full((len(ticker_data), num_bars), np.nan)
+        date = np.datetime64(backtest_date)
+        for i, (_, data) in enumerate(ticker_data):
+            end = np.searchsorted(data.dates, date, side="right")
+            rows = data.data['close'].to_numpy(dtype=float)[max(end - num_bars, 0):end]
+            closes[i, num_bars - len(rows):] = rows
+        return [ticker for ticker, _ in ticker_data], closes
+
+    def materialise_indicators(self, tickers, specs):
+        """ Makes sure the given indicators are materialised in the SQLite database for every ticker in the list, and
+            drops the cached data of the tickers that did not hold them so that it is loaded again with them.
+
+        :param tickers: A list of company tickers.
+        :param specs: A list of (indicator, period) tuples to materialise.
+        :return: none
+        """
+        keys = {indicator_store.indicator_key(indicator, period) for indicator, period in specs}
+        with self._materialise_lock:
+            self.hist_data_handler.materialise_indicators(tickers, specs)
+            with self._lock:
+                for ticker in tickers:
+                    ticker_data = self._tickers.get(ticker)
+                    if ticker_data is not None and ticker_data.valid and not keys <= ticker_data.indicator_keys:
+                        del self._tickers[ticker]
+
+    def _get(self, ticker):
+        """ Gets the cached data of a ticker, loading it from the database if it has not been loaded yet.
+
+        :param ticker: String of the company ticker.
+        :return: A _TickerData object.
+        """
+        ticker_data = self._tickers.get(ticker)
+        if ticker_data is not None:
+            return ticker_data
+        with self._lock:
+            load_lock = self._load_locks.setdefault(ticker, threading.Lock())
+        with load_lock:
+            # Another backtest may have loaded the ticker while this one was waiting.
+            ticker_data = self._tickers.get(ticker)
+            if ticker_data is None:
+                ticker_data = self._load(ticker)
+                with self._lock:
+                    self._tickers[ticker] = ticker_data
+        return ticker_data
+
+    def _load(self, ticker):
+        """ Reads the full price history of a ticker and all of its materialised indicators from the database.
+
+        :param ticker: String of the company ticker.
+        :return: A _TickerData object.
+        """
+        conn = sqlite3.connect('historical_data/historical_data.db')
+        try:
+            row = conn.execute("""SELECT first_date, valid FROM available_tickers WHERE ticker=? """,
+                               [ticker]).fetchone()
+            if row is None or not row[1]:
+                return _TickerData(valid=False)
+            first_date = dt.datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+
+            keys = sorted(indicator_store.get_materialised_keys(conn, ticker))
+            if keys:
+                columns = ", ".join(f"i.[{key}]" for key in keys)
+                data = pd.read_sql_query(
+                    f"""SELECT p.*, {columns} FROM '{ticker}' p LEFT JOIN '{ticker}_indicators' i
+                            ON p.`date` = i.`date` ORDER BY p.`date`""", conn, index_col='date', parse_dates=['date'])
+            else:
+                data = pd.read_sql_query(f"""SELECT * FROM '{ticker}' ORDER BY `date`""", conn, index_col='date',
+                                         parse_dates=['date'])
+        finally:
+            conn.close()
+        return _TickerData(True, first_date, data, keys)
+
+
+def publish(store, tickers):
+    """ Copies the market data of the tickers from a store into a block of shared memory, for other processes to attach
+        a SharedMarketDataStore to. Each ticker's dates and columns are held in one contiguous float64 array, so the
+        volumes are read back as floats.
+
+    :param store: The MarketDataStore to copy the data from, which materialises any indicators needed beforehand.
+    :param tickers: A list of company tickers.
+    :return memory: The SharedMemory block, which the caller closes and unlinks once the other processes are done.
+    :return layout: A dict describing where each ticker's data is held in the block, keyed by ticker, to be passed to
+        the SharedMarketDataStore.
+    """
+    ticker_data = {ticker: store._get(ticker) for ticker in tickers}
+    size = sum(len(data.dates) * (1 + len(data.data.columns)) * 8 for data in ticker_data.values() if data.valid)
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    layout = {}
+    offset = 0
+    for ticker, data in ticker_data.items():
+        if not data.valid:
+            layout[ticker] = None
+            continue
+        num_rows, columns = len(data.dates), list(data.data.columns)
+        np.ndarray(num_rows, dtype="datetime64[ns]", buffer=memory.buf, offset=offset)[:] = data.dates
+        np.ndarray((num_rows, len(columns)), dtype=float, buffer=memory.buf, offset=offset + num_rows * 8)[:] = \
+            data.data.to_numpy(dtype=float)
+        layout[ticker] = (data.first_date, offset, num_rows, columns, sorted(data.indicator_keys))
+        offset += num_rows * (1 + len(columns)) * 8
+    return memory, layout
+
+
+class SharedMarketDataStore(MarketDataStore):
+    """ A store attached to market data published to shared memory by another process, whose prices and indicators are
+        views onto the shared block rather than copies of it. Tickers that were not published are treated as not
+        downloaded. """
+
+    def __init__(self, name, layout):
+        """ Constructor that attaches the store to a block of shared memory.
+
+        :param name: The name of the SharedMemory block.
+        :param layout: The layout of the block returned by publish.
+        """
+        super().__init__()
+        self._memory = shared_memory.SharedMemory(name=name)
+        for ticker, entry in layout.items():
+            self._tickers[ticker] = _TickerData(valid=False) if entry is None else self._attach(entry)
+
+    def _attach(self, entry):
+        """ Creates the cached data of a ticker from its place in the shared block, without copying it.
+
+        :param entry: The ticker's entry in the layout.
+        :return: A _TickerData object.
+        """
+        first_date, offset, num_rows, columns, indicator_keys = entry
+        dates = np.ndarray(num_rows, dtype="datetime64[ns]", buffer=self._memory.buf, offset=offset)
+        values = np.ndarray((num_rows, len(columns)), dtype=float, buffer=self._memory.buf,
+                            offset=offset + num_rows * 8)
+        # The dates are copied, as the index is shared with the DataFrames handed out rather than copied with them.
+        data = pd.DataFrame(values, index=pd.DatetimeIndex(dates.copy(), name='date'), columns=columns, copy=False)
+        return _TickerData(True, first_date, data, indicator_keys)
+
+    def materialise_indicators(self, tickers, specs):
+        """ Does nothing, as the published data cannot be changed. Indicators must be materialised before the data is
+            published, any that were not are calculated by the analysis as usual.
+
+        :param tickers: A list of company tickers.
+        :param specs: A list of (indicator, period) tuples.
+        :return: none
+        """
+        pass
+
+    def _load(self, ticker):
+        return _TickerData(valid=False)
+
+    def close(self):
+        """ Detaches the store from the shared memory.
+
+        :return: none
+        """
+        self._tickers = {}
+        self._memory.close()
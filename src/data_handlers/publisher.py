@@ -0,0 +1,400 @@
+""" Sends the updates made during a backtest to the data access API from a background thread, so that the backtest loop
+    does not wait on the API's latency. Requests are sent in the order they are queued, except that a request for a
+    resource whose state is sent in full (e.g. the backtest's properties) replaces any older request for it that has not
+    yet been sent, as only the latest state is needed. If the API supports batches, the requests made during each day
+    of the backtest are collected and sent together in one request. Requests can instead be streamed over the socket
+    connection, falling back to REST if the stream becomes unavailable. """
+
+from src.data_handlers import request_handler, serializer, socket_stream
+from src.exceptions.custom_exceptions import BatchNotSupportedError, StreamUnavailableError
+from concurrent.futures import Future
+import collections
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger("publisher")
+
+
+# The method of the queued requests that hold a batch of other requests.
+BATCH = "BATCH"
+
+
+class _Request:
+    """ A request waiting in the publisher's queue, or a batch of them when its method is BATCH. """
+
+    __slots__ = ("method", "endpoint", "data", "key", "future", "superseded")
+
+    def __init__(self, method, endpoint, data, key):
+        self.method = method
+        self.endpoint = endpoint
+        self.data = data
+        self.key = key
+        self.future = Future()
+        self.superseded = False
+
+
+class Publisher:
+
+    def __init__(self, asynchronous=True, max_pending=64, stream=None, compress=False):
+        """ Constructor that starts the publisher thread.
+
+        :param asynchronous: Whether to send requests from a background thread, if False they are sent straight away
+            by the thread that submits them.
+        :param max_pending: The most requests that can be waiting to be sent, submitting more blocks until there is
+            room so that the queue cannot grow without limit if the API falls behind.
+        :param stream: A SocketStream object to send the requests with rather than REST, or None.
+        :param compress: Whether to gzip compress the large bodies of requests sent over REST, which the API must
+            support.
+        """
+        self.asynchronous = asynchronous
+        self.max_pending = max_pending
+        self.stream = stream
+        self.compress = compress
+        self._queue = collections.deque()
+        # The queued requests that can be replaced by a newer one, keyed by method and endpoint.
+        self._latest = {}
+        self._in_flight = 0
+        self._error = None
+        self._closed = False
+        # The requests collected into the current batch, None when a batch is not being collected.
+        self._batch = None
+        self._condition = threading.Condition()
+        self._thread = None
+        if asynchronous:
+            self._thread = threading.Thread(target=self._run, name="publisher", daemon=True)
+            self._thread.start()
+
+    def submit(self, method, endpoint, data, coalesce=False):
+        """ Queues a request to be sent to the API.
+
+        :param method: The HTTP method of the request (PUT, PATCH or POST).
+        :param endpoint: The endpoint to send the request to.
+        :param data: The data to be placed in the body of the request, which must not be changed once submitted.
+        :param coalesce: Whether the request holds the full state of the resource, so that it replaces any older request
+            to the same endpoint that has not yet been sent.
+        :return: A Future that resolves to the response object, or to None if the request was replaced by a newer one.
+        :raises Exception: The error that stopped the publisher, if a previous request has failed.
+        """
+        request = _Request(method, endpoint, data, (method, endpoint) if coalesce else None)
+        if self._batch is not None:
+            self.check()
+            with self._condition:
+                self._supersede(request)
+            self._batch.append(request)
+            return request.future
+        if not self.asynchronous:
+            self.check()
+            self._send(request)
+            return request.future
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit requests to a closed publisher.")
+            self.check()
+            if not self._supersede(request):
+                self._wait_for_room()
+            self._enqueue(request)
+        return request.future
+
+    def encode(self, data):
+        """ Encodes data into the body of a request, as MessagePack if requests are streamed or otherwise as JSON.
+            Bodies are packed even whilst the socket is not connected, so that they are not decoded and packed again if
+            it has reconnected by the time they are sent.
+
+        :param data: The data to be encoded, see serializer.dumps.
+        :return: The encoded bytes.
+        """
+        return socket_stream.pack(data) if self.stream is not None and self.stream.supported else serializer.dumps(data)
+
+    def begin_batch(self):
+        """ Starts collecting the requests that are submitted into a batch, to be sent in one request by end_batch. Does
+            nothing if the API does not support batches, so requests are queued as they are submitted.
+
+        :return: none
+        """
+        if request_handler.batch_supported() or self._streaming():
+            self._batch = []
+
+    def end_batch(self):
+        """ Queues the batch of requests collected since begin_batch, which is sent as a single request.
+
+        :return: none
+        """
+        batch, self._batch = self._batch, None
+        batch = [item for item in batch or [] if not item.superseded]
+        if not batch:
+            return
+        request = _Request(BATCH, request_handler.BATCH_ENDPOINT, batch, None)
+        if not self.asynchronous:
+            self._send(request)
+            return
+        with self._condition:
+            self._wait_for_room()
+            for item in batch:
+                if item.key is not None and not item.superseded:
+                    self._latest[item.key] = item
+            self._enqueue(request)
+
+    def check(self):
+        """ Raises the error that stopped the publisher thread from sending requests, if there is one, in the calling
+            thread.
+
+        :return: none
+        """
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """ Waits until every queued request has been sent.
+
+        :return: none
+        """
+        with self._condition:
+            while (self._queue or self._in_flight) and self._error is None:
+                self._condition.wait()
+        self.check()
+        self._drain_stream()
+
+    def close(self):
+        """ Sends the queued requests, then stops the publisher thread.
+
+        :return: none
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.check()
+        self._drain_stream()
+
+    def _streaming(self):
+        """ Whether requests are being streamed over the socket connection.
+
+        :return: True if the stream is available.
+        """
+        return self.stream is not None and self.stream.available
+
+    def _drain_stream(self):
+        """ Waits until every streamed request has been acknowledged by the API.
+
+        :return: none
+        :raises StreamAcknowledgementError: If they have not been acknowledged in time.
+        """
+        if self.stream is not None:
+            try:
+                self.stream.drain()
+            except Exception as e:
+                self._error = e
+                raise
+
+    def _supersede(self, request):
+        """ Drops the older request for the same resource as a request that replaces it, if one is waiting to be sent.
+            The newer request is sent after everything queued before it. Must be called holding the condition's lock.
+
+        :param request: The newer _Request object.
+        :return: True if an older request was dropped.
+        """
+        superseded = self._latest.pop(request.key, None) if request.key is not None else None
+        if self._batch is not None:
+            # Older requests in the batch being collected are not in self._latest until the batch is queued.
+            for item in self._batch:
+                if request.key is not None and item.key == request.key and not item.superseded:
+                    superseded = item
+        if superseded is None:
+            return False
+        superseded.superseded = True
+        superseded.future.set_result(None)
+        return True
+
+    def _wait_for_room(self):
+        """ Waits until there is room in the queue for another request. Must be called holding the condition's lock.
+
+        :return: none
+        """
+        while len(self._queue) >= self.max_pending and self._error is None:
+            self._condition.wait()
+        self.check()
+
+    def _enqueue(self, request):
+        """ Adds a request to the end of the queue. Must be called holding the condition's lock.
+
+        :param request: The _Request object to be sent.
+        :return: none
+        """
+        if request.key is not None:
+            self._latest[request.key] = request
+        self._queue.append(request)
+        self._condition.notify_all()
+
+    def _run(self):
+        """ The publisher thread, sends queued requests in order until the publisher is closed or a request fails.
+
+        :return: none
+        """
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                request = self._queue.popleft()
+                for item in (request.data if request.method == BATCH else [request]):
+                    if item.key is not None and self._latest.get(item.key) is item:
+                        del self._latest[item.key]
+                if request.method == BATCH:
+                    # Requests replaced since the batch was queued are left out of it.
+                    request.data = [item for item in request.data if not item.superseded]
+                self._condition.notify_all()
+                if request.superseded:
+                    continue
+                self._in_flight += 1
+            try:
+                self._send(request)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+            if self._error is not None:
+                self._fail_queued()
+                return
+
+    def _send(self, request):
+        """ Sends a request with the request handler, resolving its future with the response. A batch whose requests
+            cannot be sent together, as the API does not support batches, is sent as separate requests instead.
+
+        :param request: The _Request object to be sent.
+        :return: none
+        """
+        try:
+            if self._streaming() and self._stream(request):
+                return
+            if request.method == BATCH:
+                response = self._send_batch(request.data)
+            else:
+                response = getattr(request_handler, request.method.lower())(request.endpoint, _rest_body(request.data),
+                                                                            compress=self.compress)
+        except Exception as e:
+            logger.critical(f"Stopped publishing updates after {request.method} request to {request.endpoint} "
+                            f"failed: {e}")
+            self._error = e
+            for item in (request.data if request.method == BATCH else []) + [request]:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            if not self.asynchronous:
+                raise
+        else:
+            request.future.set_result(response)
+
+    def _stream(self, request):
+        """ Streams a request, or a batch of them, over the socket connection. Its future, and those of the requests in
+            the batch, are resolved when the API acknowledges it.
+
+        :param request: The _Request object to be sent.
+        :return: True if it was sent, False if the stream is unavailable so it must be sent over REST.
+        """
+        batch = request.data if request.method == BATCH else [request]
+        try:
+            acknowledged = self.stream.send([(item.method, item.endpoint, item.data) for item in batch])
+        except StreamUnavailableError as e:
+            logger.warning(f"{e} Sending updates over REST.")
+            self.stream = None
+            return False
+
+        def resolve(future):
+            error = future.exception()
+            if error is not None:
+                logger.critical(f"Stopped publishing updates after streamed updates failed: {error}")
+                self._error = error
+                for item in set(batch + [request]):
+                    item.future.set_exception(error)
+                return
+            responses = future.result()
+            for item, response in zip(batch, responses):
+                if item is not request:
+                    item.future.set_result(response)
+            request.future.set_result(responses if request.method == BATCH else responses[0])
+
+        acknowledged.add_done_callback(resolve)
+        return True
+
+    def _send_batch(self, batch):
+        """ Sends a batch of requests in a single request, resolving the future of each with its response.
+
+        :param batch: A list of _Request objects.
+        :return: The list of responses.
+        """
+        if not batch:
+            return []
+        try:
+            responses = request_handler.send_batch([(item.method, item.endpoint, _rest_body(item.data))
+                                                    for item in batch], compress=self.compress)
+        except BatchNotSupportedError as e:
+            logger.warning(f"{e} Sending the requests separately.")
+            for item in batch:
+                self._send(item)
+                self.check()
+            return [item.future.result() for item in batch]
+        for item, response in zip(batch, responses):
+            item.future.set_result(response)
+        return responses
+
+    def _fail_queued(self):
+        """ Fails every request still in the queue with the error that stopped the publisher thread.
+
+        :return: none
+        """
+        with self._condition:
+            while self._queue:
+                request = self._queue.popleft()
+                for item in (request.data if request.method == BATCH else []) + [request]:
+                    if not item.superseded and not item.future.done():
+                        item.future.set_exception(self._error)
+            self._latest.clear()
+            self._condition.notify_all()
+
+
+def _rest_body(data):
+    """ Gets the body of a request to be sent over REST, re-encoding bodies that were packed to be streamed as JSON.
+
+    :param data: The data to be placed in the body of the request.
+    :return: The data, or the JSON bytes of packed data.
+    """
+    return serializer.dumps(socket_stream.unpack(data)) if isinstance(data, socket_stream.Packed) else data
+
+
+class LocalPublisher:
+    """ Stands in for the publisher when a backtest is run headless, without the data access API. Nothing is encoded or
+        sent, and new trades are given ids locally in place of the ones that the API generates. """
+
+    def __init__(self):
+        self._trade_ids = itertools.count(1)
+
+    def submit(self, method, endpoint, data, coalesce=False):
+        """ Discards a request, see Publisher.submit.
+
+        :return: A resolved Future holding the response the API would give.
+        """
+        body = {"trade_id": next(self._trade_ids)} if method == "POST" and endpoint.startswith("/trades/") else {}
+        future = Future()
+        future.set_result(request_handler.BatchResponse(200, body))
+        return future
+
+    def encode(self, data):
+        return data
+
+    def begin_batch(self):
+        pass
+
+    def end_batch(self):
+        pass
+
+    def check(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -1,15 +1,67 @@
-
 """ This file is simply to save the hassle of typing the target URL and error handling in every HTTP request sent to
-    the data access API throughout the application. """
+    the data access API throughout the application. All requests share one session, so that connections to the API are
+    kept alive and reused from a pool rather than being set up (with a TLS handshake) for every request. """
 
+from src.exceptions.custom_exceptions import APIConnectionError, BatchNotSupportedError
+from src.data_handlers import serializer
+from requests.adapters import HTTPAdapter
 import requests
 import logging
+import random
+import threading
 import time
+import gzip
 
 logger = logging.getLogger("request_handler")
 URL = None
 max_attempts = 5
-retry_delay_seconds = 3
+# Retries wait for retry_delay_seconds, doubling with each attempt up to max_retry_delay_seconds, with random jitter so
+# that threads retrying at the same time do not all hit the API together.
+retry_delay_seconds = 1
+max_retry_delay_seconds = 16
+# The number of connections kept open to the API, enough for the strategy threads, the backtest loop and the sockets.
+pool_size = 10
+# Request bodies of at least this many bytes are gzip compressed, when they are sent with compression.
+compress_min_bytes = 1024
+# The (connect, read) timeouts in seconds of requests to each endpoint, matched by the longest prefix. Requests carrying
+# the trades of a whole day can take much longer for the API to process than the small updates.
+DEFAULT_TIMEOUT = (3.05, 15)
+ENDPOINT_TIMEOUTS = {
+    "/batch": (3.05, 60),
+    "/trades": (3.05, 60),
+    "/backtests": (3.05, 30),
+    "/backtest_settings": (3.05, 10),
+    "/strategies": (3.05, 10)
+}
+# Methods that can safely be sent again when the API may have already received them.
+IDEMPOTENT_METHODS = ("GET", "PUT")
+# Headers sent with bodies that have already been encoded by the serializer.
+JSON_HEADERS = {"Content-Type": "application/json"}
+# The endpoint that accepts a batch of requests in one envelope, and the status codes the API responds with if it does
+# not support batches.
+BATCH_ENDPOINT = "/batch"
+BATCH_UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+
+_session = None
+_session_lock = threading.Lock()
+# Whether the API accepts batches, None until it has been checked.
+_batch_supported = None
+
+
+class BatchResponse:
+    """ The response to one of the requests in a batch, with the parts of a requests Response that are used. """
+
+    def __init__(self, status_code, body):
+        """ Constructor that holds the response.
+
+        :param status_code: The status code of the request within the batch.
+        :param body: The decoded JSON body of the response.
+        """
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
 
 
 def set_environment(sio, environment):
@@ -28,134 +80,210 @@ def set_environment(sio, environment):
     sio.connect(URL)
 
 
-def get(endpoint):
-    """ Sends a GET request to the specified endpoint.
+def get_session():
+    """ Gets the session shared by every request, creating it on first use. Sessions are safe to share between threads
+        for sending requests, and its connection pool holds up to pool_size connections to the API.
 
-    :param endpoint: The endpoint to send the request to.
-    :return response: The response object.
+    :return: The requests Session object.
     """
-    logger.debug(f"Sending GET request to '{URL}{endpoint}'")
-    attempts = 0
-    while True:
-        attempts += 1
-        try:
-            response = requests.get(URL + endpoint)
-            break
-        except requests.exceptions.ConnectionError as e:
-            # Handle connection errors.
-            if attempts < max_attempts:
-                logger.warning(f"Could not connect to {URL}, retrying in {retry_delay_seconds} seconds...")
-                time.sleep(3)
-                continue
-            else:
-                logger.critical(f"Could not connect to {URL} after {attempts} attempts to send GET request to {endpoint}.")
-                exit()
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
 
-    if attempts > 1:
-        logger.info(f"Successfully sent PUT request to {URL}{endpoint} after {attempts} attempts")
 
+def close_session():
+    """ Closes the connections held by the shared session, a new session is created by the next request.
+
+    :return: none
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def check_batch_support():
+    """ Checks whether the API accepts batches of requests, so that they can be used for the rest of the session.
+        Called once at startup, batches are not used until it has been called.
+
+    :return: True if batches are supported.
+    """
+    global _batch_supported
+    response = get(BATCH_ENDPOINT)
+    _batch_supported = response.status_code == 200
+    logger.info(f"Batched requests are {'' if _batch_supported else 'not '}supported by the data access API")
+    return _batch_supported
+
+
+def batch_supported():
+    """ Whether batches can be sent to the API.
+
+    :return: True if the API has been checked and supports batches.
+    """
+    return bool(_batch_supported)
+
+
+def send_batch(requests_batch, compress=False):
+    """ Sends several requests to the API in one envelope, which the API applies in order. The bodies are spliced into
+        the envelope as they are, so bodies that have already been encoded by the serializer are not decoded.
+
+    :param requests_batch: A list of (method, endpoint, data) tuples.
+    :param compress: Whether to gzip compress the envelope if it is large, which the API must support.
+    :return: A list of BatchResponse objects, one for each request in the batch.
+    :raises BatchNotSupportedError: If the API does not accept batches, in which case they are not used again.
+    """
+    global _batch_supported
+    entries = []
+    for method, endpoint, data in requests_batch:
+        body = data if isinstance(data, bytes) else serializer.dumps(data)
+        entries.append(b'{"method":' + serializer.dumps(method) + b',"endpoint":' + serializer.dumps(endpoint)
+                       + b',"body":' + body + b'}')
+    envelope = b'{"requests":[' + b','.join(entries) + b']}'
+    logger.debug(f"Sending batch of {len(requests_batch)} requests to '{URL}{BATCH_ENDPOINT}'")
+    response = _send("POST", BATCH_ENDPOINT, _body(envelope, compress=compress))
+    if response.status_code in BATCH_UNSUPPORTED_STATUS_CODES:
+        _batch_supported = False
+        raise BatchNotSupportedError(response.status_code)
     if response.status_code >= 400:
-        logger.error(f"Status code {response.status_code} received when sending GET request to {URL}{endpoint}")
+        # The batch as a whole was rejected, so every request in it was.
+        return [BatchResponse(response.status_code, None) for _ in requests_batch]
+    return [BatchResponse(item.get("status"), item.get("body")) for item in response.json()["responses"]]
 
-    return response
 
+def _timeout(endpoint):
+    """ Gets the timeouts of requests to an endpoint.
 
-def put(endpoint, data):
-    """ Sends a PUT request to the specified endpoint.
+    :param endpoint: The endpoint the request is sent to.
+    :return: A tuple holding the connect and read timeouts in seconds.
+    """
+    matches = [prefix for prefix in ENDPOINT_TIMEOUTS if endpoint.startswith(prefix)]
+    return ENDPOINT_TIMEOUTS[max(matches, key=len)] if matches else DEFAULT_TIMEOUT
+
+
+def _retry_delay(attempts):
+    """ Gets the time to wait before the next attempt at sending a request, using exponential backoff with jitter.
+
+    :param attempts: The number of attempts made so far.
+    :return: The delay in seconds.
+    """
+    delay = min(retry_delay_seconds * 2 ** (attempts - 1), max_retry_delay_seconds)
+    return delay * random.uniform(0.5, 1)
+
+
+def _body(data, form=False, compress=False):
+    """ Gets the keyword arguments that place the data in the body of a request. Bytes are sent as they are, having
+        already been encoded into JSON by the serializer, and are gzip compressed if they are large enough and the
+        request is sent with compression.
+
+    :param data: The data to be placed in the body of the request.
+    :param form: Whether to form encode data that is not bytes, rather than encode it as JSON.
+    :param compress: Whether to gzip compress encoded data of at least compress_min_bytes.
+    :return: A dict of keyword arguments for the requests library.
+    """
+    if isinstance(data, bytes):
+        if compress and len(data) >= compress_min_bytes:
+            return {"data": gzip.compress(data, compresslevel=5),
+                    "headers": {**JSON_HEADERS, "Content-Encoding": "gzip"}}
+        return {"data": data, "headers": JSON_HEADERS}
+    return {"data": data} if form else {"json": data}
+
+
+def _describe(data):
+    """ Describes the data placed in the body of a request for the debug log, without decoding encoded bodies.
 
-    :param endpoint: The endpoint to send the request to.
     :param data: The data to be placed in the body of the request.
+    :return: A string describing the data.
+    """
+    return f"{len(data)} bytes" if isinstance(data, bytes) else str(data)
+
+
+def _send(method, endpoint, body=None):
+    """ Sends a request through the shared session, retrying with backoff if the API cannot be reached. Requests that
+        time out waiting for a response are only retried if they are idempotent, as the API may have processed them.
+
+    :param method: The HTTP method (e.g. 'PUT').
+    :param endpoint: The endpoint to send the request to.
+    :param body: The keyword arguments that place the data in the body of the request.
     :return response: The response object.
+    :raises APIConnectionError: If the request could not be sent after max_attempts attempts.
     """
-    logger.debug(f"Sending PUT request to '{URL}{endpoint}' with payload: {data}")
+    session = get_session()
+    timeout = _timeout(endpoint)
     attempts = 0
     while True:
         attempts += 1
         try:
-            response = requests.put(URL + endpoint, json=data)
+            response = session.request(method, URL + endpoint, timeout=timeout, **(body or {}))
             break
-        except requests.exceptions.ConnectionError as e:
-            # Handle connection errors.
-            if attempts < max_attempts:
-                logger.warning(f"Could not connect to {URL}, retrying in {retry_delay_seconds} seconds...")
-                time.sleep(3)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Handle connection errors, and timeouts of requests that can safely be sent again.
+            retryable = isinstance(e, requests.exceptions.ConnectionError) or method in IDEMPOTENT_METHODS
+            if retryable and attempts < max_attempts:
+                delay = _retry_delay(attempts)
+                logger.warning(f"Could not send {method} request to {URL}{endpoint} ({type(e).__name__}), retrying in "
+                               f"{delay:.1f} seconds...")
+                time.sleep(delay)
                 continue
-            else:
-                logger.critical(f"Could not connect to {URL} after {attempts} attempts to send PUT request to {endpoint}.")
-                exit()
+            logger.critical(f"Could not send {method} request to {URL}{endpoint} after {attempts} attempts.")
+            raise APIConnectionError(method, f"{URL}{endpoint}", attempts) from e
 
     if attempts > 1:
-        logger.info(f"Successfully sent PUT request to {URL}{endpoint} after {attempts} attempts")
+        logger.info(f"Successfully sent {method} request to {URL}{endpoint} after {attempts} attempts")
 
     if response.status_code >= 400:
-        logger.error(f"Status code {response.status_code} received when sending PUT request to {URL}{endpoint}")
+        logger.error(f"Status code {response.status_code} received when sending {method} request to {URL}{endpoint}")
 
     return response
 
 
-def patch(endpoint, data):
-    """ Sends a PATCH request to the specified endpoint.
+def get(endpoint):
+    """ Sends a GET request to the specified endpoint.
 
     :param endpoint: The endpoint to send the request to.
-    :param data: The data to be placed in the body of the request.
     :return response: The response object.
     """
-    logger.debug(f"Sending PATCH request to '{URL}{endpoint}' with payload: {str(data)}")
-    attempts = 0
-    while True:
-        attempts += 1
-        try:
-            response = requests.patch(URL + endpoint, data=data)
-            break
-        except requests.exceptions.ConnectionError as e:
-            # Handle connection errors.
-            if attempts < max_attempts:
-                logger.warning(f"Could not connect to {URL}, retrying in {retry_delay_seconds} seconds...")
-                time.sleep(3)
-                continue
-            else:
-                logger.critical(f"Could not connect to {URL} after {attempts} attempts to "
-                                f"send PATCH request to {endpoint}.")
-                exit()
+    logger.debug(f"Sending GET request to '{URL}{endpoint}'")
+    return _send("GET", endpoint)
 
-    if attempts > 1:
-        logger.info(f"Successfully sent PUT request to {URL}{endpoint} after {attempts} attempts")
 
-    if response.status_code >= 400:
-        logger.error(f"Status code {response.status_code} received when sending PATCH request to {URL}{endpoint}")
+def put(endpoint, data, compress=False):
+    """ Sends a PUT request to the specified endpoint.
 
-    return response
+    :param endpoint: The endpoint to send the request to.
+    :param data: The data to be placed in the body of the request.
+    :param compress: Whether to gzip compress the body if it is large, which the API must support.
+    :return response: The response object.
+    """
+    logger.debug(f"Sending PUT request to '{URL}{endpoint}' with payload: {_describe(data)}")
+    return _send("PUT", endpoint, _body(data, compress=compress))
 
 
-def post(endpoint, data):
+def patch(endpoint, data, compress=False):
     """ Sends a PATCH request to the specified endpoint.
 
     :param endpoint: The endpoint to send the request to.
     :param data: The data to be placed in the body of the request.
+    :param compress: Whether to gzip compress the body if it is large, which the API must support.
     :return response: The response object.
     """
-    logger.debug(f"Sending POST request to '{URL}{endpoint}' with payload: {str(data)}")
-    attempts = 0
-    while True:
-        attempts += 1
-        try:
-            response = requests.post(URL + endpoint, json=data)
-            break
-        except requests.exceptions.ConnectionError as e:
-            # Handle connection errors.
-            if attempts < max_attempts:
-                logger.warning(f"Could not connect to {URL}, retrying in {retry_delay_seconds} seconds...")
-                time.sleep(3)
-                continue
-            else:
-                logger.critical(f"Could not connect to {URL} after {attempts} attempts to "
-                                f"send POST request to {endpoint}.")
-                exit()
+    logger.debug(f"Sending PATCH request to '{URL}{endpoint}' with payload: {_describe(data)}")
+    return _send("PATCH", endpoint, _body(data, form=True, compress=compress))
 
-    if attempts > 1:
-        logger.info(f"Successfully sent POST request to {URL}{endpoint} after {attempts} attempts")
 
-    if response.status_code >= 400:
-        logger.error(f"Status code {response.status_code} received when sending POST request to {URL}{endpoint}")
+def post(endpoint, data, compress=False):
+    """ Sends a POST request to the specified endpoint.
 
-    return response
+    :param endpoint: The endpoint to send the request to.
+    :param data: The data to be placed in the body of the request.
+    :param compress: Whether to gzip compress the body if it is large, which the API must support.
+    :return response: The response object.
+    """
+    logger.debug(f"Sending POST request to '{URL}{endpoint}' with payload: {_describe(data)}")
+    return _send("POST", endpoint, _body(data, compress=compress))
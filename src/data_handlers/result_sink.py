@@ -0,0 +1,150 @@
+""" Writes the results of a backtest that is run headless to local files, in place of sending them to the data access
+    API. Each table (the closed trades, the equity curve and the statistics of each day) is a directory of numbered
+    .npz parts, each holding an array per column of the rows added since the previous part. Parts are written every
+    flush_days days so that results are streamed to disk as the backtest runs, and read_table joins them back into a
+    DataFrame. A summary of the run, including the throughput of the backtest engine, is written when it finishes. """
+
+from src.data_handlers import serializer
+from src.trades.growable_array import GrowableArray
+import numpy as np
+import pandas as pd
+import glob
+import os
+
+TABLES = ("trades", "equity", "days")
+DAY_STATS_DTYPE = np.dtype([
+    ("date", "datetime64[s]"),
+    ("total_balance", "f8"),
+    ("available_balance", "f8"),
+    ("num_open_trades", "i8"),
+    ("num_screened_out", "i8"),
+    ("num_analysed", "i8"),
+    ("seconds", "f8")
+])
+
+
+def read_table(directory, table):
+    """ Reads a table written by a ResultSink.
+
+    :param directory: The directory the results were written to.
+    :param table: The name of the table, one of TABLES.
+    :return: A DataFrame holding the rows of every part of the table.
+    """
+    parts = []
+    for path in sorted(glob.glob(os.path.join(directory, table, "part-*.npz"))):
+        with np.load(path) as part:
+            parts.append(pd.DataFrame({column: part[column] for column in part.files}))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def _columns(table):
+    """ Gets the columns of a table, which is either a structured array or a dict of arrays.
+
+    :param table: A structured array, or a dict of arrays.
+    :return: A dict of arrays.
+    """
+    if isinstance(table, np.ndarray):
+        return {name: table[name] for name in table.dtype.names}
+    return table
+
+
+class ResultSink:
+
+    def __init__(self, directory, flush_days=50):
+        """ Constructor that creates the results directory.
+
+        :param directory: The directory to write the results to.
+        :param flush_days: The number of days between parts being written.
+        """
+        self.directory = directory
+        self.flush_days = flush_days
+        self._days = GrowableArray(DAY_STATS_DTYPE)
+        # The number of rows of each table that have been written, and the number of parts written.
+        self._written = {table: 0 for table in TABLES}
+        self._parts = {table: 0 for table in TABLES}
+        for table in TABLES:
+            os.makedirs(os.path.join(directory, table), exist_ok=True)
+
+    @property
+    def days(self):
+        """ A structured array holding the statistics of each day recorded so far. """
+        return self._days.values
+
+    def checkpoint_state(self):
+        """ Gets the numbers of rows and parts written of each table, to be saved in a checkpoint. The statistics of
+            each day are saved separately.
+
+        :return: A dict holding the state.
+        """
+        return {"written": dict(self._written), "parts": dict(self._parts)}
+
+    def restore(self, state, days):
+        """ Restores the sink of a backtest resumed from a checkpoint, removing the parts written after the checkpoint
+            so that they are written again as the backtest carries on.
+
+        :param state: The dict returned by checkpoint_state.
+        :param days: A structured array holding the statistics of each day recorded up to the checkpoint.
+        :return: none
+        """
+        self._days = GrowableArray(DAY_STATS_DTYPE, capacity=len(days) * 2)
+        self._days.extend(days)
+        self._written = dict(state["written"])
+        self._parts = dict(state["parts"])
+        for table in TABLES:
+            for path in glob.glob(os.path.join(self.directory, table, "part-*.npz")):
+                if int(os.path.basename(path)[5:-4]) >= self._parts[table]:
+                    os.remove(path)
+
+    def record_day(self, backtest, screening_stats, seconds):
+        """ Records the statistics of a day of the backtest, writing new parts of the tables every flush_days days.
+
+        :param backtest: The Backtest object, on the day that has just been processed.
+        :param screening_stats: A tuple of the numbers of tickers screened out and analysed in full on the day.
+        :param seconds: The time taken to process the day.
+        :return: none
+        """
+        self._days.append((backtest.backtest_date, backtest.total_balance, backtest.available_balance,
+                           len(backtest.ledger.open_positions), *screening_stats, seconds))
+        if len(self._days) - self._written["days"] >= self.flush_days:
+            self.flush(backtest)
+
+    def flush(self, backtest):
+        """ Writes the rows added to each table since they were last written as new parts.
+
+        :param backtest: The Backtest object.
+        :return: none
+        """
+        tables = {
+            "trades": backtest.ledger.closed_positions,
+            "equity": {"date": backtest.equity_dates.values, "total_balance": backtest.equity_balances.values},
+            "days": self._days.values
+        }
+        for table, values in tables.items():
+            columns = _columns(values)
+            num_rows = len(next(iter(columns.values())))
+            if num_rows == self._written[table]:
+                continue
+            path = os.path.join(self.directory, table, f"part-{self._parts[table]:05d}.npz")
+            np.savez(path, **{column: arr[self._written[table]:] for column, arr in columns.items()})
+            self._written[table] = num_rows
+            self._parts[table] += 1
+
+    def close(self, backtest, seconds):
+        """ Writes the remaining rows of each table, and the summary of the run.
+
+        :param backtest: The Backtest object, once it has finished.
+        :param seconds: The time taken to run the backtest.
+        :return: none
+        """
+        self.flush(backtest)
+        summary = backtest.ledger.summary()
+        summary.update({
+            "start_date": backtest.start_date,
+            "end_date": backtest.backtest_date,
+            "total_balance": backtest.total_balance,
+            "num_days": len(self._days),
+            "seconds": seconds,
+            "days_per_second": len(self._days) / seconds if seconds else None
+        })
+        with open(os.path.join(self.directory, "summary.json"), "wb") as f:
+            f.write(serializer.dumps(summary))
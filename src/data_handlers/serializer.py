@@ -0,0 +1,116 @@
+""" Converts the objects sent to the data access API into JSON bytes. Classes declare an explicit json_schema of the
+    fields to send and how to convert each one, so only those fields are read and nothing is copied. NumPy arrays and
+    scalars, datetimes, dataframes and Plotly figures are encoded natively by the encoder's default hook, rather than
+    being converted into lists of Python objects beforehand. """
+
+import datetime as dt
+import json
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def to_serializable(obj, omit=()):
+    """ Gets the fields of an object listed in its class's json_schema. Each schema entry is a tuple of the field name
+        and a function to convert the field's value with, or None to send the value as it is.
+
+    :param obj: The object to be sent, whose class has a json_schema attribute.
+    :param omit: Names of fields that are sent as None, without being read or converted.
+    :return: A dict holding the schema fields, in the order of the schema.
+    """
+    serializable = {}
+    for name, convert in type(obj).json_schema:
+        if name in omit:
+            serializable[name] = None
+            continue
+        value = getattr(obj, name)
+        serializable[name] = value if convert is None else convert(value)
+    return serializable
+
+
+def dumps(data):
+    """ Encodes data into the body of a request.
+
+    :param data: The data to be encoded, which may hold objects with a json_schema, NumPy arrays, dates, dataframes and
+        Plotly figures.
+    :return: The encoded JSON bytes.
+    """
+    return json.dumps(data, default=encode_object, separators=(',', ':')).encode('utf-8')
+
+
+def date_string(value):
+    """ Converts a date into the string format used by the API.
+
+    :param value: A datetime, Timestamp or None.
+    :return: A string holding the date.
+    """
+    return str(value)
+
+
+def price_data(df):
+    """ Converts a historical dataframe into a dict of columns, with a 'date' column holding the index. The column
+        arrays are left as they are to be encoded by dumps.
+
+    :param df: A DataFrame object indexed by date.
+    :return: A dict holding a list of dates, followed by an array for each column.
+    """
+    data = {"date": list(df.index.strftime(DATE_FORMAT))}
+    for column in df.columns:
+        data[column] = df[column].to_numpy()
+    return data
+
+
+def figure_json(fig):
+    """ Encodes a Plotly figure into a JSON string, in place of fig.to_json(), using the same encoder hook as dumps.
+
+    :param fig: A Plotly figure object.
+    :return: A string holding the figure JSON.
+    """
+    return json.dumps(fig.to_plotly_json(), default=encode_object, separators=(',', ':'))
+
+
+def _encode_array(arr):
+    """ Converts a NumPy array into a list, replacing missing values with None so they are encoded as null.
+
+    :param arr: A NumPy array.
+    :return: A list of JSON serializable values.
+    """
+    if arr.dtype.kind == 'M':
+        strings = np.datetime_as_string(arr, unit='s')
+        return [None if s == 'NaT' else s for s in strings.tolist()]
+    if arr.dtype.kind == 'f':
+        missing = np.isnan(arr)
+        if missing.any():
+            return np.where(missing, None, arr).tolist()
+    if arr.dtype.kind == 'O':
+        return [encode_object(v) if not isinstance(v, (str, int, float, type(None))) else v for v in arr.tolist()]
+    return arr.tolist()
+
+
+def encode_object(obj):
+    """ Default hook of the JSON encoder, called for every object the stdlib encoder cannot encode itself. Also used by
+        the socket stream's MessagePack encoder, for the objects it does not send as raw bytes.
+
+    :param obj: The object to be encoded.
+    :return: A JSON serializable version of the object.
+    """
+    if hasattr(type(obj), "json_schema"):
+        return to_serializable(obj)
+    if isinstance(obj, np.ndarray):
+        return _encode_array(obj)
+    if isinstance(obj, np.generic):
+        if isinstance(obj, np.datetime64):
+            return _encode_array(np.array([obj]))[0]
+        return obj.item()
+    if isinstance(obj, (pd.Timestamp, dt.datetime, dt.date)):
+        return obj.isoformat()
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return _encode_array(obj.to_numpy())
+    if isinstance(obj, pd.DataFrame):
+        return price_data(obj)
+    if hasattr(obj, "to_plotly_json"):
+        return obj.to_plotly_json()
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
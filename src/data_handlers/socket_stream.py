@@ -0,0 +1,190 @@
+""" Streams the updates made during a backtest to the data access API over the socket.io connection, as compact binary
+    MessagePack messages rather than REST requests with JSON bodies. NumPy arrays are sent as their raw bytes instead of
+    lists of numbers. Each message holds a batch of requests and is acknowledged by the API with their responses, and
+    only max_unacked messages can be waiting for acknowledgement at once so that a slow API is not flooded. msgpack is
+    an optional dependency, updates are sent over REST if it is not installed or the API does not accept streams. """
+
+from src.data_handlers import serializer
+from src.data_handlers.request_handler import BatchResponse
+from src.exceptions.custom_exceptions import StreamUnavailableError, StreamAcknowledgementError
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+import socketio
+import threading
+import logging
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("socket_stream")
+
+# The API answers CAPABILITY_EVENT with true if it accepts the batches of updates sent as UPDATE_EVENT messages.
+CAPABILITY_EVENT = "streamUpdatesSupported"
+UPDATE_EVENT = "backtestUpdates"
+# The MessagePack extension type of NumPy arrays, whose data is the packed [dtype string, shape, raw bytes].
+NDARRAY_EXT = 1
+# The kinds of array (bool, int, unsigned int, float, datetime) that are sent as raw bytes.
+RAW_ARRAY_KINDS = "biufM"
+
+
+class Packed(bytes):
+    """ A request body encoded into MessagePack by pack, rather than into JSON by the serializer. """
+
+
+def pack(data):
+    """ Encodes data into a MessagePack message body.
+
+    :param data: The data to be encoded, which may hold anything that serializer.dumps can encode.
+    :return: The encoded Packed bytes.
+    """
+    return Packed(msgpack.packb(data, default=_encode, use_bin_type=True))
+
+
+def unpack(data):
+    """ Decodes a MessagePack message body, with NumPy arrays decoded back into arrays.
+
+    :param data: The encoded bytes.
+    :return: The decoded data.
+    """
+    return msgpack.unpackb(data, ext_hook=_decode_ext, raw=False)
+
+
+def _encode(obj):
+    """ Default hook of the MessagePack encoder, called for every object it cannot encode itself. Arrays of numbers and
+        dates are encoded as extension types holding their raw bytes, other objects are converted as they are for JSON.
+
+    :param obj: The object to be encoded.
+    :return: An ExtType, or a version of the object that MessagePack can encode.
+    """
+    if isinstance(obj, (pd.Series, pd.Index)):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in RAW_ARRAY_KINDS:
+        arr = np.ascontiguousarray(obj)
+        return msgpack.ExtType(NDARRAY_EXT, msgpack.packb([arr.dtype.str, list(arr.shape), arr.tobytes()]))
+    return serializer.encode_object(obj)
+
+
+def _decode_ext(code, data):
+    """ Extension type hook of the MessagePack decoder.
+
+    :param code: The extension type code.
+    :param data: The bytes of the extension type.
+    :return: The decoded object.
+    """
+    if code != NDARRAY_EXT:
+        return msgpack.ExtType(code, data)
+    dtype, shape, raw = msgpack.unpackb(data)
+    return np.frombuffer(raw, dtype=np.dtype(dtype)).reshape(shape)
+
+
+def _message(requests_batch):
+    """ Encodes a batch of requests into a message. Bodies that have already been packed are spliced into the message
+        as they are, as MessagePack values can simply be concatenated.
+
+    :param requests_batch: A list of (method, endpoint, data) tuples, whose data is either Packed or not yet encoded.
+    :return: The message bytes.
+    :raises ValueError: If a body has been encoded into JSON rather than packed.
+    """
+    packer = msgpack.Packer()
+    parts = [packer.pack_map_header(1), packer.pack("requests"), packer.pack_array_header(len(requests_batch))]
+    for method, endpoint, data in requests_batch:
+        if isinstance(data, bytes) and not isinstance(data, Packed):
+            raise ValueError(f"The body of the {method} request to {endpoint} is encoded as JSON, so cannot be "
+                             "streamed.")
+        if not isinstance(data, Packed):
+            data = pack(data)
+        parts += [packer.pack_map_header(3), packer.pack("method"), packer.pack(method), packer.pack("endpoint"),
+                  packer.pack(endpoint), packer.pack("body"), data]
+    return b''.join(parts)
+
+
+class SocketStream:
+
+    def __init__(self, socket, max_unacked=8, ack_timeout=30):
+        """ Constructor that checks whether the API accepts streamed updates.
+
+        :param socket: The socket.io client connected to the API.
+        :param max_unacked: The most messages that can be waiting to be acknowledged, sending another blocks until the
+            oldest is acknowledged.
+        :param ack_timeout: The most seconds to wait for a message to be acknowledged.
+        """
+        self.socket = socket
+        self.max_unacked = max_unacked
+        self.ack_timeout = ack_timeout
+        self._window = threading.BoundedSemaphore(max_unacked)
+        self._supported = self._check_support()
+
+    @property
+    def supported(self):
+        """ Whether the API accepts streamed updates, even if the socket is not connected right now. """
+        return self._supported
+
+    @property
+    def available(self):
+        """ Whether updates can be streamed to the API. """
+        return self._supported and self.socket.connected
+
+    def send(self, requests_batch):
+        """ Sends a batch of requests to the API in one message, once there is room in the acknowledgement window.
+
+        :param requests_batch: A list of (method, endpoint, data) tuples.
+        :return: A Future that resolves to a list of BatchResponse objects once the API acknowledges the message.
+        :raises StreamUnavailableError: If the message could not be sent, so should be sent over REST instead.
+        :raises StreamAcknowledgementError: If the oldest message has not been acknowledged within the timeout.
+        """
+        if not self.available:
+            raise StreamUnavailableError("the socket is not connected")
+        if not self._window.acquire(timeout=self.ack_timeout):
+            raise StreamAcknowledgementError(self.ack_timeout)
+        future = Future()
+
+        def acknowledge(data=None):
+            self._window.release()
+            try:
+                responses = (unpack(data) if isinstance(data, bytes) else data)["responses"]
+                future.set_result([BatchResponse(item.get("status"), item.get("body")) for item in responses])
+            except Exception as e:
+                future.set_exception(e)
+
+        try:
+            self.socket.emit(UPDATE_EVENT, _message(requests_batch), callback=acknowledge)
+        except socketio.exceptions.SocketIOError as e:
+            self._window.release()
+            raise StreamUnavailableError(e)
+        return future
+
+    def drain(self):
+        """ Waits until every message sent has been acknowledged.
+
+        :return: none
+        :raises StreamAcknowledgementError: If the messages have not been acknowledged within the timeout.
+        """
+        deadline = time.monotonic() + self.ack_timeout
+        acquired = 0
+        try:
+            for _ in range(self.max_unacked):
+                if not self._window.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                    raise StreamAcknowledgementError(self.ack_timeout)
+                acquired += 1
+        finally:
+            for _ in range(acquired):
+                self._window.release()
+
+    def _check_support(self):
+        """ Asks the API whether it accepts streamed updates.
+
+        :return: True if updates can be streamed.
+        """
+        if msgpack is None:
+            logger.warning("Updates cannot be streamed as msgpack is not installed, sending them over REST")
+            return False
+        try:
+            supported = bool(self.socket.call(CAPABILITY_EVENT, timeout=5))
+        except socketio.exceptions.SocketIOError:
+            supported = False
+        logger.info(f"Streamed updates are {'' if supported else 'not '}supported by the data access API")
+        return supported
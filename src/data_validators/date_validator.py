@@ -1,4 +1,5 @@
 import datetime as dt
+import functools
 import sys
 sys.path.append("../")
 import pandas_market_calendars as mcal
@@ -16,14 +17,23 @@ def is_weekend_check(date):
         return False
 
 
+@functools.lru_cache(maxsize=None)
+def _get_holidays():
+    """ Gets the dates of all NYSE holidays. Building the calendar is slow, so it is only done once.
+
+    :return: A frozenset of date objects.
+    """
+    nyse = mcal.get_calendar('NYSE')
+    return frozenset(holiday.item() for holiday in nyse.holidays().holidays)
+
+
 def is_holiday_check(date):
     """ Checks if date falls on a holiday (banks closed).
 
     :param date: Datetime object to be checked.
     :return: True if date is a holiday, False if not
     """
-    nyse = mcal.get_calendar('NYSE')
-    us_holidays = nyse.holidays().holidays
+    us_holidays = _get_holidays()
 
     if date.date() in us_holidays:
         return True
@@ -46,3 +46,31 @@ class InvalidStrategyConfigException(Exception):
     def __init__(self, invalid_reason):
         self.message = f"Strategy configuration data invalid: {invalid_reason}"
         super().__init__(self.message)
+
+
+class APIConnectionError(Exception):
+    """ Exception raised when a request could not be sent to the data access API after retrying. """
+    def __init__(self, method, url, attempts):
+        self.message = f"Could not send {method} request to {url} after {attempts} attempts."
+        super().__init__(self.message)
+
+
+class BatchNotSupportedError(Exception):
+    """ Exception raised when the data access API does not accept batches of requests. """
+    def __init__(self, status_code):
+        self.message = f"Batched requests are not supported by the data access API (status code {status_code})."
+        super().__init__(self.message)
+
+
+class StreamUnavailableError(Exception):
+    """ Exception raised when updates cannot be streamed over the socket connection, before anything has been sent. """
+    def __init__(self, reason):
+        self.message = f"Could not stream updates to the data access API: {reason}."
+        super().__init__(self.message)
+
+
+class StreamAcknowledgementError(Exception):
+    """ Exception raised when the data access API has not acknowledged the updates streamed to it. """
+    def __init__(self, timeout):
+        self.message = f"Streamed updates were not acknowledged by the data access API within {timeout} seconds."
+        super().__init__(self.message)
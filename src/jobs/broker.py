@@ -0,0 +1,230 @@
+""" The job queue through which backtests are spread across machines. A coordinator enqueues backtest jobs with a
+    broker, and workers claim them, run them and report their results back. A worker sends heartbeats while it runs a
+    job, and a job whose worker stops sending them (e.g. because its machine died) is put back in the queue for another
+    worker.
+
+    Brokers are pluggable: a broker is any class that implements the methods of Broker. SQLiteBroker holds the queue in
+    an SQLite file, so that it can run on a single machine (or machines sharing a filesystem) without outside services.
+    Heartbeats are timestamped with each machine's clock, which must be kept in sync for jobs to be
+    requeued correctly. """
+
+from src.data_handlers import serializer
+import json
+import sqlite3
+import time
+
+# The states of a job.
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _encode(data):
+    """ Encodes a payload or result as JSON text, with dates in ISO format and NumPy values as plain numbers.
+
+    :param data: A dict.
+    :return: A string holding the JSON.
+    """
+    return serializer.dumps(data).decode('utf-8')
+
+
+class Job:
+    """ A job held by a broker, and the state it was in when it was read. """
+    __slots__ = ("job_id", "payload", "state", "worker_id", "attempts", "max_attempts", "heartbeat", "result", "error")
+
+    def __init__(self, job_id, payload, state=QUEUED, worker_id=None, attempts=0, max_attempts=3, heartbeat=None,
+                 result=None, error=None):
+        self.job_id = job_id
+        self.payload = payload
+        self.state = state
+        self.worker_id = worker_id
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.heartbeat = heartbeat
+        self.result = result
+        self.error = error
+
+
+class Broker:
+    """ The interface of a job queue broker. Payloads and results are dicts that can be encoded by serializer.dumps,
+        and are read back as plain JSON, so dates are read back as ISO format strings. """
+
+    def enqueue(self, payload, max_attempts=3):
+        """ Adds a job to the end of the queue.
+
+        :param payload: A dict describing the job.
+        :param max_attempts: The number of times the job is run before it is failed, if its workers keep dying.
+        :return: The id of the job.
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id):
+        """ Takes the oldest queued job for a worker to run. Each job is only ever claimed by one worker at a time.
+
+        :param worker_id: The id of the worker.
+        :return: The Job object, or None if there are no queued jobs.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job_id, worker_id):
+        """ Records that a worker is still running a job.
+
+        :param job_id: The id of the job.
+        :param worker_id: The id of the worker.
+        :return: True if the job still belongs to the worker, False if it has been requeued or finished without it.
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id, worker_id, result):
+        """ Records the result of a job that has been run.
+
+        :param job_id: The id of the job.
+        :param worker_id: The id of the worker that ran it.
+        :param result: A dict holding the results.
+        :return: True if the result was recorded, False if the job no longer belongs to the worker.
+        """
+        raise NotImplementedError
+
+    def fail(self, job_id, worker_id, error):
+        """ Records that a job could not be run.
+
+        :param job_id: The id of the job.
+        :param worker_id: The id of the worker that ran it.
+        :param error: A string describing the error.
+        :return: True if the failure was recorded, False if the job no longer belongs to the worker.
+        """
+        raise NotImplementedError
+
+    def release(self, job_id, worker_id):
+        """ Puts a job that a worker has stopped running back in the queue, e.g. when the worker is shutting down,
+            without counting it as an attempt.
+
+        :param job_id: The id of the job.
+        :param worker_id: The id of the worker.
+        :return: True if the job was requeued, False if it no longer belongs to the worker.
+        """
+        raise NotImplementedError
+
+    def requeue_expired(self, timeout):
+        """ Puts the running jobs whose workers have not sent a heartbeat within the timeout back in the queue, or
+            fails them if they have been attempted max_attempts times.
+
+        :param timeout: The number of seconds since its last heartbeat after which a worker is presumed dead.
+        :return: A list of the ids of the jobs that were requeued or failed.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """ Reads a job.
+
+        :param job_id: The id of the job.
+        :return: The Job object, or None if there is no such job.
+        """
+        raise NotImplementedError
+
+
+class SQLiteBroker(Broker):
+    """ A broker that holds the queue in a table of an SQLite file. Every operation is its own transaction, and claims
+        are made under a write lock so that no two workers can claim the same job. """
+
+    def __init__(self, path="jobs.db"):
+        """ Constructor that creates the jobs table, if it does not already exist.
+
+        :param path: The path of the SQLite file.
+        """
+        self.path = path
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs
+                            ([job_id] integer PRIMARY KEY AUTOINCREMENT, [payload] text, [state] text,
+                             [worker_id] text, [attempts] integer, [max_attempts] integer, [heartbeat] real,
+                             [result] text, [error] text)""")
+        conn.close()
+
+    def _connect(self):
+        # Autocommit mode, so that transactions are begun explicitly where a read and write must be atomic.
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, payload, max_attempts=3):
+        conn = self._connect()
+        try:
+            c = conn.execute("""INSERT INTO jobs (payload, state, attempts, max_attempts) VALUES (?, ?, 0, ?)""",
+                             [_encode(payload), QUEUED, max_attempts])
+            return c.lastrowid
+        finally:
+            conn.close()
+
+    def claim(self, worker_id):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""SELECT job_id FROM jobs WHERE state=? ORDER BY job_id LIMIT 1""",
+                               [QUEUED]).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("""UPDATE jobs SET state=?, worker_id=?, attempts=attempts + 1, heartbeat=? WHERE job_id=?""",
+                         [RUNNING, worker_id, time.time(), row[0]])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return self.get(row[0])
+
+    def heartbeat(self, job_id, worker_id):
+        return self._update_owned(job_id, worker_id, "heartbeat=?", [time.time()])
+
+    def complete(self, job_id, worker_id, result):
+        return self._update_owned(job_id, worker_id, "state=?, result=?", [SUCCEEDED, _encode(result)])
+
+    def fail(self, job_id, worker_id, error):
+        return self._update_owned(job_id, worker_id, "state=?, error=?", [FAILED, error])
+
+    def release(self, job_id, worker_id):
+        return self._update_owned(job_id, worker_id, "state=?, worker_id=NULL, attempts=attempts - 1", [QUEUED])
+
+    def requeue_expired(self, timeout):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute("""SELECT job_id, attempts, max_attempts FROM jobs
+                                      WHERE state=? AND heartbeat < ?""", [RUNNING, time.time() - timeout]).fetchall()
+            for job_id, attempts, max_attempts in expired:
+                if attempts >= max_attempts:
+                    conn.execute("""UPDATE jobs SET state=?, error=? WHERE job_id=?""",
+                                 [FAILED, f"The worker stopped responding on each of {attempts} attempts", job_id])
+                else:
+                    conn.execute("""UPDATE jobs SET state=?, worker_id=NULL WHERE job_id=?""", [QUEUED, job_id])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return [job_id for job_id, _, _ in expired]
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("""SELECT job_id, payload, state, worker_id, attempts, max_attempts, heartbeat, result,
+                                         error FROM jobs WHERE job_id=?""", [job_id]).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job_id, payload, state, worker_id, attempts, max_attempts, heartbeat, result, error = row
+        return Job(job_id, json.loads(payload), state, worker_id, attempts, max_attempts, heartbeat,
+                   None if result is None else json.loads(result), error)
+
+    def _update_owned(self, job_id, worker_id, assignments, params):
+        """ Updates a running job, if it belongs to the worker.
+
+        :param job_id: The id of the job.
+        :param worker_id: The id of the worker.
+        :param assignments: The SET clause of the update.
+        :param params: The values of the parameters in the SET clause.
+        :return: True if the job was updated.
+        """
+        conn = self._connect()
+        try:
+            c = conn.execute(f"""UPDATE jobs SET {assignments} WHERE job_id=? AND worker_id=? AND state=?""",
+                             params + [job_id, worker_id, RUNNING])
+            return c.rowcount == 1
+        finally:
+            conn.close()
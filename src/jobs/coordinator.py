@@ -0,0 +1,79 @@
+""" Enqueues backtest jobs with a broker for workers to run, and collects their results. A sweep is enqueued as a job
+    per run, so that its runs are spread across every machine with a worker attached to the broker rather than across
+    the cores of one machine. """
+
+from src.backtest.sweep import parameter_sets, apply_parameters, rank_runs
+from src.jobs.broker import SUCCEEDED, FAILED
+import logging
+import time
+
+logger = logging.getLogger("coordinator")
+
+
+def enqueue_backtest(broker, settings, tickers=None, parameters=None, max_attempts=3):
+    """ Enqueues a headless backtest.
+
+    :param broker: The Broker to enqueue the job with.
+    :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+    :param tickers: A list of company tickers, the worker's tickers are used if not given.
+    :param parameters: A dict holding the sweep parameters the settings were created from, reported with the results.
+    :param max_attempts: The number of times the job is run before it is failed, if its workers keep dying.
+    :return: The id of the job.
+    """
+    payload = {"settings": settings, "tickers": tickers, "parameters": parameters or {}}
+    return broker.enqueue(payload, max_attempts=max_attempts)
+
+
+def enqueue_sweep(broker, settings, spec, tickers=None, max_attempts=3):
+    """ Enqueues every backtest of a parameter sweep.
+
+    :param broker: The Broker to enqueue the jobs with.
+    :param settings: A dict of backtest settings, with the strategy configuration under 'strategy'.
+    :param spec: A dict specifying the parameters of the sweep, see sweep.parameter_sets.
+    :param tickers: A list of company tickers, the worker's tickers are used if not given.
+    :param max_attempts: The number of times each job is run before it is failed, if its workers keep dying.
+    :return: A list of the ids of the jobs.
+    """
+    sets = parameter_sets(spec)
+    logger.info(f"Enqueuing {len(sets)} backtests of the sweep")
+    return [enqueue_backtest(broker, apply_parameters(settings, parameters), tickers, parameters, max_attempts)
+            for parameters in sets]
+
+
+def wait_for_jobs(broker, job_ids, heartbeat_timeout=60, poll_interval=5, timeout=None):
+    """ Waits until every job has succeeded or failed, requeuing the jobs of dead workers meanwhile so that they are
+        picked up even if every other worker is busy.
+
+    :param broker: The Broker holding the jobs.
+    :param job_ids: A list of the ids of the jobs.
+    :param heartbeat_timeout: The number of seconds without a heartbeat after which a worker is presumed dead.
+    :param poll_interval: The number of seconds between checks of the jobs.
+    :param timeout: The most seconds to wait, or None to wait for as long as it takes.
+    :return: A list of the finished Job objects, in the order of the ids.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    finished = {}
+    while True:
+        broker.requeue_expired(heartbeat_timeout)
+        for job_id in job_ids:
+            if job_id not in finished:
+                job = broker.get(job_id)
+                if job.state in (SUCCEEDED, FAILED):
+                    finished[job_id] = job
+        if len(finished) == len(job_ids):
+            return [finished[job_id] for job_id in job_ids]
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"{len(job_ids) - len(finished)} of {len(job_ids)} jobs have not finished.")
+        time.sleep(poll_interval)
+
+
+def sweep_summary(jobs):
+    """ Creates the summary table of a sweep run as jobs, ranking the runs that succeeded by return and then drawdown.
+
+    :param jobs: A list of the finished Job objects of the sweep.
+    :return: A DataFrame holding a row per successful run, best first.
+    """
+    failed = [job.job_id for job in jobs if job.state == FAILED]
+    if failed:
+        logger.warning(f"Jobs {failed} of the sweep failed and are left out of its summary")
+    return rank_runs([{"job": job.job_id, **job.result} for job in jobs if job.state == SUCCEEDED])
@@ -0,0 +1,182 @@
+""" A worker that runs the backtest jobs held by a broker, one at a time, until it is stopped. Each job is run as a
+    headless backtest that writes its results to its own directory in the worker's output directory, and its summary is
+    reported back to the broker. The jobs run by a worker share one MarketDataStore, so each ticker's data is read from
+    the database once however many jobs use it.
+
+    While a job runs, a background thread sends heartbeats to the broker. If the broker rejects a heartbeat, the job has
+    been requeued for another worker (e.g. because this one stalled for longer than the timeout), so the backtest is
+    stopped and its result discarded. Every worker also requeues the jobs of dead workers before claiming its next job,
+    so no separate process is needed to watch over them. A job whose settings enable checkpoints (checkpointDays) is
+    resumed from its last checkpoint when it is run again, if the worker can reach the previous worker's output. With a
+    result cache, a job whose backtest has been run before on the same data is answered from the cache. """
+
+from src.backtest.backtest import Backtest
+from src.backtest.checkpoint import has_checkpoint
+from src.backtest.sweep import summarise_backtest, summarise_results
+from src.data_handlers.market_data_store import MarketDataStore
+from src.data_handlers.result_sink import ResultSink
+import datetime as dt
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+logger = logging.getLogger("job_worker")
+
+
+def parse_settings(settings):
+    """ Converts the settings of a job read from the broker back into the settings of a backtest.
+
+    :param settings: A dict of backtest settings, with the dates as ISO format strings.
+    :return: The dict of settings, with the dates as datetime objects.
+    """
+    settings = dict(settings)
+    settings['startDate'] = dt.datetime.fromisoformat(settings['startDate'])
+    settings['endDate'] = dt.datetime.fromisoformat(settings['endDate'])
+    return settings
+
+
+class JobWorker:
+
+    def __init__(self, broker, tickers, output="results", heartbeat_interval=10, heartbeat_timeout=60,
+                 poll_interval=2, worker_id=None, cache=None):
+        """ Constructor for a job worker.
+
+        :param broker: The Broker to claim jobs from.
+        :param tickers: The list of company tickers backtested by jobs that do not list their own.
+        :param output: The directory to write the results to, each job writes its own to a 'job-<id>' directory.
+        :param heartbeat_interval: The number of seconds between heartbeats.
+        :param heartbeat_timeout: The number of seconds without a heartbeat after which a worker is presumed dead.
+        :param poll_interval: The number of seconds to wait before polling the broker again when no jobs are queued.
+        :param worker_id: The id of the worker, defaults to the host name and process id.
+        :param cache: A ResultCache the results of jobs are copied from if they have been run before, and added to
+            once they are run.
+        """
+        self.broker = broker
+        self.tickers = tickers
+        self.output = output
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.cache = cache
+        self.market_data = MarketDataStore()
+        self._stopping = threading.Event()
+        self._backtest = None
+
+    def run(self, max_jobs=None):
+        """ Claims and runs jobs until the worker is stopped.
+
+        :param max_jobs: The number of jobs to run before returning, or None to keep running until stopped.
+        :return: The number of jobs that were run.
+        """
+        logger.info(f"Worker {self.worker_id} waiting for jobs")
+        num_jobs = 0
+        while not self._stopping.is_set() and (max_jobs is None or num_jobs < max_jobs):
+            requeued = self.broker.requeue_expired(self.heartbeat_timeout)
+            if requeued:
+                logger.warning(f"Requeued jobs {requeued}, as their workers stopped sending heartbeats")
+            job = self.broker.claim(self.worker_id)
+            if job is None:
+                self._stopping.wait(self.poll_interval)
+                continue
+            self.run_job(job)
+            num_jobs += 1
+        logger.info(f"Worker {self.worker_id} stopped after {num_jobs} jobs")
+        return num_jobs
+
+    def run_job(self, job):
+        """ Runs a claimed job while sending heartbeats, and reports its result to the broker.
+
+        :param job: The Job object.
+        :return: none
+        """
+        logger.info(f"Running job {job.job_id} (attempt {job.attempts} of {job.max_attempts})")
+        finished = threading.Event()
+        lost = threading.Event()
+        heartbeats = threading.Thread(target=self._send_heartbeats, args=(job.job_id, finished, lost), daemon=True)
+        heartbeats.start()
+        try:
+            result = self.execute(job.payload, job.job_id)
+        except Exception:
+            logger.exception(f"Job {job.job_id} failed")
+            self.broker.fail(job.job_id, self.worker_id, traceback.format_exc())
+            return
+        finally:
+            finished.set()
+            heartbeats.join()
+
+        if lost.is_set():
+            logger.warning(f"Discarded the result of job {job.job_id}, as it was requeued for another worker")
+        elif result is None:
+            # The backtest was interrupted by the worker stopping, so it is left for another worker to run.
+            self.broker.release(job.job_id, self.worker_id)
+            logger.info(f"Returned job {job.job_id} to the queue")
+        elif self.broker.complete(job.job_id, self.worker_id, result):
+            logger.info(f"Completed job {job.job_id}")
+        else:
+            logger.warning(f"Could not report the result of job {job.job_id}, as it was requeued for another worker")
+
+    def execute(self, payload, job_id):
+        """ Runs the headless backtest of a job.
+
+        :param payload: A dict holding the backtest 'settings' (with the strategy configuration under 'strategy'), and
+            optionally the 'tickers' to backtest and the sweep 'parameters' the settings were created from.
+        :param job_id: The id of the job.
+        :return: A dict holding the parameters and results of the backtest, or None if it was stopped before it
+            finished.
+        """
+        settings = parse_settings(payload['settings'])
+        settings['backtestId'] = job_id
+        tickers = payload.get('tickers') or self.tickers
+        start_time = time.monotonic()
+        directory = os.path.join(self.output, f"job-{job_id:05d}")
+        key = self.cache.key(settings, tickers) if self.cache is not None else None
+        if key is not None and self.cache.fetch(key, directory):
+            return {**payload.get('parameters', {}), **summarise_results(directory, settings['startBalance']),
+                    "seconds": time.monotonic() - start_time, "worker_id": self.worker_id}
+        sink = ResultSink(directory)
+        self._backtest = Backtest(settings, sink=sink, market_data=self.market_data)
+        resume = self._backtest.checkpointer is not None and has_checkpoint(self._backtest.checkpointer.directory)
+        # The worker may have been stopped while the backtest was being created.
+        if self._stopping.is_set():
+            self._backtest.control.stop()
+        try:
+            self._backtest.start_backtest(tickers, resume=resume)
+            self._backtest.ledger.close()
+            if self._backtest.backtest_date < settings['endDate']:
+                return None
+            if key is not None:
+                self.cache.store(key, directory)
+            return {**payload.get('parameters', {}), **summarise_backtest(self._backtest),
+                    "seconds": time.monotonic() - start_time, "worker_id": self.worker_id}
+        finally:
+            self._backtest = None
+
+    def stop(self):
+        """ Stops the worker, interrupting the job it is running, which is returned to the queue.
+
+        :return: none
+        """
+        self._stopping.set()
+        backtest = self._backtest
+        if backtest is not None:
+            backtest.control.stop()
+
+    def _send_heartbeats(self, job_id, finished, lost):
+        """ Sends heartbeats for a job until it has finished, stopping its backtest if the job is lost.
+
+        :param job_id: The id of the job.
+        :param finished: An Event set once the job has finished.
+        :param lost: An Event that is set if the broker rejects a heartbeat.
+        :return: none
+        """
+        while not finished.wait(self.heartbeat_interval):
+            if not self.broker.heartbeat(job_id, self.worker_id):
+                lost.set()
+                backtest = self._backtest
+                if backtest is not None:
+                    backtest.control.stop()
+                return
@@ -1,22 +1,28 @@
 from src.data_handlers import request_handler
-from src.data_handlers.historical_data_handler import HistoricalDataHandler, split_list
+from src.data_handlers.historical_data_handler import split_list
 from src.strategy.technical_analysis import BaseTechnicalAnalysisModule
+from src.data_handlers.indicator_store import indicator_key
 from src.exceptions.custom_exceptions import InvalidHistoricalDataIndexError, InvalidStrategyConfigException, \
     InvalidHistoricalDataError
+import numpy as np
 import logging
+import threading
 
 logger = logging.getLogger("strategy")
 
 
 def create_strategy(backtest):
-    """ Creates a strategy object to be used throughout the backtest, using the configuration saved in the database.
+    """ Creates a strategy object to be used throughout the backtest, using the configuration saved in the database
+        unless the backtest was given its own.
 
     :param backtest: A backtest object.
     :return: A strategy object.
     """
 
     # Manual configuration for now, will eventually be set by the UI.
-    input_config = request_handler.get(f"/strategies/{backtest.strategy_id}").json()
+    input_config = backtest.strategy_config
+    if input_config is None:
+        input_config = request_handler.get(f"/strategies/{backtest.strategy_id}").json()
 
     # Create the strategy using the configuration.
     strategy = Strategy(input_config, backtest)
@@ -34,9 +40,12 @@ class Strategy:
         :param backtest: The object that holds all information on the backtest that the strategy will be used on.
         """
         self.backtest = backtest
-        self.hist_data_handler = HistoricalDataHandler(start_date=backtest.start_date)
+        self.hist_data_handler = backtest.market_data
         self.max_lookback_range_weeks = strategy_config['lookbackRangeWeeks']
         self.technical_analysis = self._init_technical_analysis(strategy_config)
+        # The indicators used by the analysis, retrieved with the historical data when they have been materialised.
+        self.required_indicators = list(dict.fromkeys(self.technical_analysis.required_indicators()))
+        self.indicator_keys = [indicator_key(indicator, period) for indicator, period in self.required_indicators]
 
     def _init_technical_analysis(self, config):
         """ Dynamically creates an order of execution for the analysis segment of the strategy defined in the provided
@@ -67,6 +76,59 @@ class Strategy:
         # Return the dynamically wrapped technical analysis module.
         return technical_analysis
 
+    def materialise_indicators(self, tickers):
+        """ Makes sure the indicators used by the analysis are materialised in the database for every ticker, so that
+            they do not have to be recalculated throughout the backtest.
+
+        :param tickers: A list of company tickers.
+        :return: none
+        """
+        if self.required_indicators:
+            logger.info(f"Materialising indicators {self.indicator_keys} for {len(tickers)} tickers")
+            self.hist_data_handler.materialise_indicators(tickers, self.required_indicators)
+
+    def screen_tickers(self, tickers):
+        """ Runs the cheap screening stage of the strategy over the whole ticker universe, so that only the tickers
+            that could trigger an indicator go through the full analysis.
+
+        :param tickers: A list of company tickers.
+        :return: The list of tickers that survived the screen.
+        """
+        num_bars = self.technical_analysis.screen_lookback()
+        if num_bars == 0:
+            # None of the modules provide a screen, so every ticker has to be analysed in full.
+            return tickers
+
+        screened_tickers, closes = self.hist_data_handler.get_latest_closes(tickers, self.backtest.backtest_date,
+                                                                            num_bars)
+        survivors = self.technical_analysis.screen_data(closes)
+        # Tickers without enough recent data cannot be judged by the screen, so leave them for the full analysis.
+        survivors |= np.isnan(closes).any(axis=1)
+
+        return [ticker for ticker, survived in zip(screened_tickers, survivors) if survived]
+
+    def find_potential_trades(self, tickers, max_strategy_threads):
+        """ Executes the strategy on every ticker, split across a number of threads.
+
+        :param tickers: A list of company tickers.
+        :param max_strategy_threads: The number of threads to execute the strategy in.
+        :return: A list of (dataframe, figure) tuples for the tickers where the analysis identified an opportunity.
+        """
+        potential_trades = []
+        download_threads = []
+
+        # Create a number of threads to download data concurrently, to speed up the process.
+        for thread_id in range(0, max_strategy_threads):
+            download_thread = threading.Thread(target=self.execute,
+                                               args=(tickers, potential_trades, max_strategy_threads, thread_id))
+            download_threads.append(download_thread)
+            download_thread.start()
+
+        # Wait for all threads to finish downloading data before continuing.
+        for download_thread in download_threads:
+            download_thread.join()
+        return potential_trades
+
     def execute(self, tickers, potential_trades, max_strategy_threads, thread_id):
         # Get a portion of tickers for this thread to work with.
         slice_of_tickers = split_list(tickers, max_strategy_threads, thread_id)
@@ -76,7 +138,8 @@ class Strategy:
             try:
                 # Get the required historical data for this ticker.
                 stock_df = self.hist_data_handler.get_hist_dataframe(ticker, self.backtest.backtest_date,
-                                                                     self.max_lookback_range_weeks)
+                                                                     self.max_lookback_range_weeks,
+                                                                     indicators=self.indicator_keys)
                 stock_df.attrs['triggered_indicators'] = []
             except (InvalidHistoricalDataIndexError, InvalidHistoricalDataError):
                 # If there isn't enough data recorded for this ticker, or it is marked as invalid, skip it.
@@ -1,7 +1,79 @@
 from src.data_validators import date_validator
-import plotly.graph_objects as go
+from src.trades import downsampling
+from src.trades.figure_model import FigureModel, CANDLES_ROLE, TAKE_PROFIT_ROLE, STOP_LOSS_ROLE
 import datetime as dt
 import numpy as np
+import pandas as pd
+
+# Relative tolerance applied to the screening comparisons, so that rounding differences between the vectorised screen
+# and the pandas calculations in the full analysis can never screen out a ticker that would have triggered.
+SCREEN_TOLERANCE = 1e-9
+# The most points drawn in each trace of a trade figure, which is 460 pixels wide: one per pixel for lines, and one per
+# four pixels for candles. The days in the visible range of the figure are never downsampled.
+FIGURE_MAX_LINE_POINTS = 460
+FIGURE_MAX_CANDLES = 115
+FIGURE_RANGE_DAYS = 30
+
+
+def _date_indices(x, dates):
+    """ Finds the positions of dates within the x values of a trace.
+
+    :param x: An array holding the x values of a trace.
+    :param dates: A list of dates to be found.
+    :return: An array holding the positions of the dates that are in the trace.
+    """
+    if not len(dates):
+        return np.empty(0, dtype=int)
+    return np.flatnonzero(pd.DatetimeIndex(x).isin(pd.DatetimeIndex(dates)))
+
+
+def downsample_line_traces(traces, keep_dates=()):
+    """ Downsamples the older points of line traces in a trade figure once they hold more than FIGURE_MAX_LINE_POINTS,
+        keeping the days in the visible range and the given dates as they are. The traces must share the same x values,
+        and the same points are kept in each so that lines drawn together (e.g. filled bands) stay aligned. The points
+        are selected from the first trace, along with the extrema of every trace.
+
+    :param traces: A list of TraceBuffer objects, updated in place.
+    :param keep_dates: Dates that must not be downsampled, such as the buy date of the trade.
+    :return: none
+    """
+    if not traces:
+        return
+    split = downsampling.split_recent(len(traces[0]['x']), FIGURE_MAX_LINE_POINTS, FIGURE_RANGE_DAYS)
+    if split is None:
+        return
+    num_older, max_points = split
+    x = np.asarray(traces[0]['x'])
+    ys = [np.asarray(trace['y'], dtype=float) for trace in traces]
+    keep = list(_date_indices(x[:num_older], keep_dates))
+    for y in ys[1:]:
+        if not np.isnan(y[:num_older]).all():
+            keep += [np.nanargmin(y[:num_older]), np.nanargmax(y[:num_older])]
+    selected = downsampling.lttb(ys[0][:num_older], max_points, keep=keep)
+    selected = np.concatenate([selected, np.arange(num_older, len(x))])
+    for trace, y in zip(traces, ys):
+        trace.set(x=x[selected], y=y[selected])
+
+
+def downsample_candlestick_trace(trace, keep_dates=()):
+    """ Merges the older candles of a candlestick trace in a trade figure once it holds more than FIGURE_MAX_CANDLES,
+        keeping the days in the visible range and the given dates as they are.
+
+    :param trace: The TraceBuffer object of the candlestick trace, updated in place.
+    :param keep_dates: Dates that must not be merged, such as the buy date of the trade.
+    :return: none
+    """
+    split = downsampling.split_recent(len(trace['x']), FIGURE_MAX_CANDLES, FIGURE_RANGE_DAYS)
+    if split is None:
+        return
+    num_older, max_points = split
+    x = np.asarray(trace['x'])
+    prices = {key: np.asarray(trace[key], dtype=float) for key in ("open", "high", "low", "close")}
+    starts, *merged = downsampling.ohlc(*(prices[key][:num_older] for key in ("open", "high", "low", "close")),
+                                        max_points, keep=_date_indices(x[:num_older], keep_dates))
+    trace.set(x=np.concatenate([x[starts], x[num_older:]]),
+              **{key: np.concatenate([values, prices[key][num_older:]])
+                 for key, values in zip(("open", "high", "low", "close"), merged)})
 
 
 class TechnicalAnalysisInterface:
@@ -10,6 +82,15 @@ class TechnicalAnalysisInterface:
     def analyse_data(self, historical_df):
         pass
 
+    def screen_data(self, closes):
+        pass
+
+    def screen_lookback(self):
+        pass
+
+    def required_indicators(self):
+        pass
+
 
 class TechnicalAnalysisDecorator(TechnicalAnalysisInterface):
     """ Concrete component with the default analysis functionality (nothing). This is what gets wrapped by the
@@ -48,9 +129,66 @@ class TechnicalAnalysisDecorator(TechnicalAnalysisInterface):
 
         return fig
 
+    def screen_data(self, closes):
+        """ Runs the cheap screening test of every layer of the strategy over the whole ticker universe at once. A
+            ticker survives the screen if any layer could trigger on it, as a trade is made whenever at least one
+            indicator has been triggered.
+
+        :param closes: A 2D array holding the latest close prices of every ticker (one row per ticker, oldest first).
+        :return: A boolean array, True for each ticker that could trigger and needs the full analysis.
+        """
+        # Perform the inner layers of the strategy first (In order defined in the config).
+        survivors = self._wrapped.screen_data(closes)
+
+        return survivors | self._screen(closes)
+
+    def screen_lookback(self):
+        """ Gets the number of most recent bars needed to run the screen of every layer in the strategy.
+
+        :return: The number of bars, 0 if no layer provides a screen.
+        """
+        return max(self._wrapped.screen_lookback(), self._screen_lookback())
+
+    def required_indicators(self):
+        """ Gets the indicators used by every layer of the strategy, so that they can be materialised in the database.
+
+        :return: A list of (indicator, period) tuples.
+        """
+        return self._wrapped.required_indicators() + self._required_indicators()
+
+    def _required_indicators(self):
+        """ The indicators the module reads from the historical data.
+
+        :return: An empty list, as the default module does not use any indicators.
+        """
+        return []
+
+    def _screen(self, closes):
+        """ Default screen for modules that do not provide one, cannot rule out any ticker so all of them survive.
+
+        :param closes: A 2D array holding the latest close prices of every ticker.
+        :return: A boolean array with every ticker marked as a survivor.
+        """
+        return np.ones(closes.shape[0], dtype=bool)
+
+    def _screen_lookback(self):
+        """ The number of bars the module needs for its screen.
+
+        :return: 0, as the default screen does not look at the data.
+        """
+        return 0
+
+    def _trace_role(self, line):
+        """ Gets the role of a trace drawn by the module, used to look the trace up in the trade figure.
+
+        :param line: The name of the line within the module (e.g. 'upper_band').
+        :return: A string holding the role, unique to the module.
+        """
+        return f"{type(self).__name__}.{line}"
+
     def _draw_figure(self):
         """ Draw the plotly figure to illustrate the analysis that influenced the trade.
-        :return: A plotly figure object (Or none).
+        :return: A FigureModel object (Or none).
         """
         return None
 
@@ -70,23 +208,24 @@ class TechnicalAnalysisDecorator(TechnicalAnalysisInterface):
 
         y_range_offset = (y_max - y_min) * 0.15
         # Draw the foundation candlestick chart.
-        fig = go.Figure(data=[go.Candlestick(x=historical_df.index[-start_index_offset:],
-                                             open=historical_df['open'][-start_index_offset:],
-                                             high=historical_df['high'][-start_index_offset:],
-                                             low=historical_df['low'][-start_index_offset:],
-                                             close=historical_df['close'][-start_index_offset:],
-                                             line=dict(width=1.2),
-                                             name="Stock Price")])
-        fig.update_layout(height=250, width=460, template="simple_white",
-                          legend=dict(orientation="h", yanchor="top", y=1.17, xanchor="center", x=0.5,
-                                      font_size=10),
-                          margin=dict(t=10, l=0, r=0, b=0), plot_bgcolor='rgba(0,0,0,0)',
-                          xaxis=dict(rangebreaks=[dict(bounds=['sat', 'mon'])], showline=True,
-                                     linewidth=1, range=[start_date_range, end_date_range],
-                                     tickcolor="rgba(0,0,0,0.3)", linecolor="rgba(0,0,0,0.3)", showgrid=False),
-                          yaxis=dict(showline=True, linecolor="rgba(0,0,0,0.3)", linewidth=1, showgrid=True,
-                                     gridcolor="rgba(0,0,0,0.08)", tickcolor="rgba(0,0,0,0.3)",
-                                     layer="below traces", range=[y_min - y_range_offset, y_max + y_range_offset]))
+        fig = FigureModel(dict(
+            height=250, width=460, template="simple_white",
+            legend=dict(orientation="h", yanchor="top", y=1.17, xanchor="center", x=0.5, font=dict(size=10)),
+            margin=dict(t=10, l=0, r=0, b=0), plot_bgcolor='rgba(0,0,0,0)',
+            xaxis=dict(rangebreaks=[dict(bounds=['sat', 'mon'])], showline=True,
+                       linewidth=1, range=[start_date_range, end_date_range],
+                       tickcolor="rgba(0,0,0,0.3)", linecolor="rgba(0,0,0,0.3)", showgrid=False),
+            yaxis=dict(showline=True, linecolor="rgba(0,0,0,0.3)", linewidth=1, showgrid=True,
+                       gridcolor="rgba(0,0,0,0.08)", tickcolor="rgba(0,0,0,0.3)",
+                       layer="below traces", range=[y_min - y_range_offset, y_max + y_range_offset])))
+        fig.add_trace(CANDLES_ROLE, "candlestick",
+                      dict(x=historical_df.index[-start_index_offset:],
+                           open=historical_df['open'][-start_index_offset:],
+                           high=historical_df['high'][-start_index_offset:],
+                           low=historical_df['low'][-start_index_offset:],
+                           close=historical_df['close'][-start_index_offset:]),
+                      line=dict(width=1.2), name="Stock Price")
+        downsample_candlestick_trace(fig[CANDLES_ROLE])
 
         return fig
 
@@ -106,6 +245,28 @@ class BaseTechnicalAnalysisModule(TechnicalAnalysisInterface):
         fig = None
         return historical_df, fig
 
+    def screen_data(self, closes):
+        """ Blank screening method, the blank analysis never triggers so no ticker survives the screen.
+
+        :param closes: A 2D array holding the latest close prices of every ticker.
+        :return: A boolean array with no tickers marked as survivors.
+        """
+        return np.zeros(closes.shape[0], dtype=bool)
+
+    def screen_lookback(self):
+        """ The blank analysis does not need any data to screen.
+
+        :return: 0
+        """
+        return 0
+
+    def required_indicators(self):
+        """ The blank analysis does not use any indicators.
+
+        :return: An empty list.
+        """
+        return []
+
     def update_figure(self, trade):
         """ Updates the basic candlestick chart held within the open trade object.
 
@@ -125,16 +286,13 @@ class BaseTechnicalAnalysisModule(TechnicalAnalysisInterface):
         tp_sl_end_val = date_validator.validate_date(tp_sl_end_val, -1)
 
         # Append the newest values from the historical dataframe to the figure data arrays.
-        fig.data[0]['x'] = np.append(fig.data[0]['x'], x_val)
-        fig.data[0]['open'] = np.append(fig.data[0]['open'], open_val)
-        fig.data[0]['high'] = np.append(fig.data[0]['high'], high_val)
-        fig.data[0]['low'] = np.append(fig.data[0]['low'], low_val)
-        fig.data[0]['close'] = np.append(fig.data[0]['close'], close_val)
-
-        # Find the tp/sl traces in the figure and extend x[1] by one day (y value doesn't need to change).
-        for i, trace in enumerate(fig.data):
-            if trace['legendgroup'] == "tp/sl":
-                trace['x'] = (trace['x'][0], tp_sl_end_val)
+        fig[CANDLES_ROLE].append(x=x_val, open=open_val, high=high_val, low=low_val, close=close_val)
+        downsample_candlestick_trace(fig[CANDLES_ROLE], keep_dates=[trade.buy_date])
+
+        # Extend x[1] of the tp/sl traces to the new end date (y value doesn't need to change).
+        for role in (TAKE_PROFIT_ROLE, STOP_LOSS_ROLE):
+            if role in fig:
+                fig[role].set(x=(fig[role]['x'][0], tp_sl_end_val))
 
         # Update the view range for the axis.
         start_date_range = trade.historical_data.index[-range_days]
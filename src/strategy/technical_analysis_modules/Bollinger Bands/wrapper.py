@@ -1,5 +1,5 @@
-from src.strategy.technical_analysis import TechnicalAnalysisDecorator
-import plotly.graph_objects as go
+from src.strategy.technical_analysis import TechnicalAnalysisDecorator, SCREEN_TOLERANCE, downsample_line_traces
+from src.data_handlers import indicator_store
 import pandas as pd
 import numpy as np
 
@@ -11,7 +11,25 @@ def simple_moving_avg(df, period):
     :param period: The day period for the simple moving average.
     :return: A Series object with the simple moving average.
     """
-    res = df['close'].rolling(window=period).mean()
+    # Use the materialised indicator if it was retrieved with the historical data.
+    res = indicator_store.get_materialised(df, "sma", period)
+    if res is None:
+        res = df['close'].rolling(window=period).mean()
+    return res
+
+
+def rolling_stdev(df, period):
+    """ Converts the close column in a historical dataframe into a rolling standard deviation of the specified day
+        period.
+
+    :param df: A DataFrame object holding a ticker's historical data.
+    :param period: The day period for the standard deviation.
+    :return: A Series object with the rolling standard deviation.
+    """
+    # Use the materialised indicator if it was retrieved with the historical data.
+    res = indicator_store.get_materialised(df, "std", period)
+    if res is None:
+        res = df['close'].rolling(window=period).std()
     return res
 
 
@@ -34,7 +52,7 @@ class BollingerBands(TechnicalAnalysisDecorator):
 
         # Calculate SMA and standard deviation.
         sma = simple_moving_avg(historical_df, self.config['dayPeriod'])
-        stdev = historical_df['close'].rolling(window=self.config['dayPeriod']).std()
+        stdev = rolling_stdev(historical_df, self.config['dayPeriod'])
 
         # Calculate upper and lower bands using the SMA and stdev.
         upper_band = sma + (stdev * 2)
@@ -62,7 +80,7 @@ class BollingerBands(TechnicalAnalysisDecorator):
             # Define long-term and short-term lines based on config.
             # Calculate SMA and standard deviation.
             sma = simple_moving_avg(trade.historical_data, self.config['dayPeriod'])
-            stdev = trade.historical_data['close'].rolling(window=self.config['dayPeriod']).std()
+            stdev = rolling_stdev(trade.historical_data, self.config['dayPeriod'])
 
             # Calculate upper and lower bands using the SMA and stdev.
             upper_band = sma + (stdev * 2)
@@ -78,19 +96,50 @@ class BollingerBands(TechnicalAnalysisDecorator):
 
             # Update the Bollinger Band traces in the figure with the respective updated value.
             x_val = trade.historical_data.index[-1]
-            for trace in fig.data:
-                if trace['name'] == f"{self.config['dayPeriod']}-day Bollinger Bands":
-                    trace['x'] = np.append(trace['x'], x_val)
-                    trace['y'] = np.append(trace['y'], sma[-1])
-                if trace['name'] == "Upper Bollinger Band":
-                    trace['x'] = np.append(trace['x'], x_val)
-                    trace['y'] = np.append(trace['y'], upper_band[-1])
-                if trace['name'] == "Lower Bollinger Band":
-                    trace['x'] = np.append(trace['x'], x_val)
-                    trace['y'] = np.append(trace['y'], lower_band[-1])
+            bb_traces = [fig[self._trace_role(line)] for line in ("sma", "upper_band", "lower_band")]
+            for trace, band in zip(bb_traces, (sma, upper_band, lower_band)):
+                trace.append(x=x_val, y=band[-1])
+            # Keep the number of points in the traces bounded for long running trades, the bands stay aligned so that
+            # the area between them is filled correctly.
+            downsample_line_traces(bb_traces, keep_dates=[trade.buy_date])
 
         return fig
 
+    def _required_indicators(self):
+        """ The SMA and standard deviation used to draw the bands, so that they can be materialised in the database.
+
+        :return: A list of (indicator, period) tuples.
+        """
+        return [("sma", self.config['dayPeriod']), ("std", self.config['dayPeriod'])]
+
+    def _screen(self, closes):
+        """ Cheap check for a break out of the lower bound, run over the latest bars of every ticker at once.
+
+        :param closes: A 2D array holding the latest close prices of every ticker (one row per ticker, oldest first).
+        :return: A boolean array, True for each ticker that could trigger.
+        """
+        period = self.config['dayPeriod']
+        last_window = closes[:, -period:]
+        second_last_window = closes[:, -period - 1:-1]
+
+        # Calculate the latest two values of the SMA and lower band.
+        sma_last_val = last_window.mean(axis=1)
+        sma_second_last_val = second_last_window.mean(axis=1)
+        lb_last_val = sma_last_val - (last_window.std(axis=1, ddof=1) * 2)
+        lb_second_last_val = sma_second_last_val - (second_last_window.std(axis=1, ddof=1) * 2)
+        tolerance = np.abs(closes[:, -1]) * SCREEN_TOLERANCE
+
+        # Same BUY signal as in _check_for_opportunity, loosened by the tolerance.
+        return (closes[:, -2] >= lb_second_last_val - tolerance) & (closes[:, -1] <= lb_last_val + tolerance) \
+            & (sma_last_val > sma_second_last_val - tolerance)
+
+    def _screen_lookback(self):
+        """ The number of bars needed to calculate the latest two values of the bands.
+
+        :return: The number of bars.
+        """
+        return self.config['dayPeriod'] + 1
+
     def _check_for_opportunity(self, historical_df, sma, upper_band, lower_band):
         """ Check for a break out of the lower bound, which indicates a potential trade opportunity.
             Does not check for breakouts from the upper bound, as short-selling is not a feature in the backtester yet.
@@ -123,7 +172,7 @@ class BollingerBands(TechnicalAnalysisDecorator):
         :param sma: A Series holding the simple moving average of the stock.
         :param upper_band: A Series holding the upper Bollinger Band.
         :param lower_band: A Series holding the lower Bollinger Band.
-        :return: A plotly figure object.
+        :return: A FigureModel object.
         """
 
         range_days = 30
@@ -139,16 +188,17 @@ class BollingerBands(TechnicalAnalysisDecorator):
         fig.update_layout(yaxis=dict(range=[y_min - y_range_offset, y_max + y_range_offset]))
 
         # Add the upper/lower Bollinger Bands to the figure with the area between filled in.
-        fig.add_traces([
-            go.Scatter(
-                x=historical_df.index[-start_index_offset:], y=sma[-start_index_offset:],
+        bb_traces = [
+            fig.add_trace(
+                self._trace_role("sma"), "scatter",
+                dict(x=historical_df.index[-start_index_offset:], y=sma[-start_index_offset:]),
                 name=f"{self.config['dayPeriod']}-day Bollinger Bands",
                 line=dict(dash="dash", shape="spline", smoothing=1.3, color="rgb(65, 98, 135)", width=1.7),
                 legendgroup="bollingerbands", hoverinfo='skip', showlegend=True
             ),
-            go.Scatter(
-                x=historical_df.index[-start_index_offset:],
-                y=upper_band[-start_index_offset:],
+            fig.add_trace(
+                self._trace_role("upper_band"), "scatter",
+                dict(x=historical_df.index[-start_index_offset:], y=upper_band[-start_index_offset:]),
                 legendgroup="bollingerbands",
                 showlegend=False,
                 fillcolor='rgba(126, 163, 204, 0.15)',
@@ -156,9 +206,9 @@ class BollingerBands(TechnicalAnalysisDecorator):
                 hoverinfo='skip',
                 name="Upper Bollinger Band"
             ),
-            go.Scatter(
-                x=historical_df.index[-start_index_offset:],
-                y=lower_band[-start_index_offset:],
+            fig.add_trace(
+                self._trace_role("lower_band"), "scatter",
+                dict(x=historical_df.index[-start_index_offset:], y=lower_band[-start_index_offset:]),
                 fill='tonexty',
                 legendgroup="bollingerbands",
                 showlegend=False,
@@ -167,10 +217,11 @@ class BollingerBands(TechnicalAnalysisDecorator):
                 hoverinfo='skip',
                 name="Lower Bollinger Band"
             )
-        ])
+        ]
+        downsample_line_traces(bb_traces)
 
         # Update the figure with relevant information.
         fig.update_layout(
-            xaxis_rangeslider_visible=False
+            xaxis=dict(rangeslider=dict(visible=False))
         )
         return fig
@@ -1,7 +1,7 @@
 from src.exceptions.custom_exceptions import InvalidStrategyConfigException
-from src.strategy.technical_analysis import TechnicalAnalysisDecorator
+from src.strategy.technical_analysis import TechnicalAnalysisDecorator, SCREEN_TOLERANCE, downsample_line_traces
 from src.data_validators import date_validator
-import plotly.graph_objects as go
+from src.data_handlers import indicator_store
 import numpy as np
 import datetime as dt
 
@@ -13,7 +13,10 @@ def simple_moving_avg(df, period):
     :param period: The day period for the simple moving average.
     :return: A Series object with the simple moving average.
     """
-    res = df['close'].rolling(window=period).mean()
+    # Use the materialised indicator if it was retrieved with the historical data.
+    res = indicator_store.get_materialised(df, "sma", period)
+    if res is None:
+        res = df['close'].rolling(window=period).mean()
     return res
 
 
@@ -25,8 +28,20 @@ def exponential_moving_avg(df, period):
     :param period: The day period for the exponential moving average.
     :return: A Series object with the exponential moving average
     """
-    res = df['close'].ewm(span=period, adjust=False).mean()
-    return res
+    # Always calculated over the dataframe, as an EMA materialised over the full history has different values.
+    return df['close'].ewm(span=period, adjust=False).mean()
+
+
+def latest_simple_moving_avgs(closes, period):
+    """ Calculates the simple moving average of the latest two days for every ticker at once.
+
+    :param closes: A 2D array holding the latest close prices of every ticker (one row per ticker, oldest first).
+    :param period: The day period for the simple moving average.
+    :return: Two arrays holding the SMA of the most recent day and of the day before it.
+    """
+    last_val = closes[:, -period:].mean(axis=1)
+    second_last_val = closes[:, -period - 1:-1].mean(axis=1)
+    return last_val, second_last_val
 
 
 class MovingAverages(TechnicalAnalysisDecorator):
@@ -107,16 +122,53 @@ class MovingAverages(TechnicalAnalysisDecorator):
 
             # Update the Moving Averages traces in the figure with the respective updated value.
             x_val = trade.historical_data.index[-1]
-            for trace in fig.data:
-                if trace['name'] == f"{self.config['longTermDayPeriod']}-day {self.config['longTermType']}":
-                    trace['x'] = np.append(trace['x'], x_val)
-                    trace['y'] = np.append(trace['y'], long_term_val)
-                if trace['name'] == f"{self.config['shortTermDayPeriod']}-day {self.config['shortTermType']}":
-                    trace['x'] = np.append(trace['x'], x_val)
-                    trace['y'] = np.append(trace['y'], short_term_val)
+            ma_traces = [fig[self._trace_role("long_term")], fig[self._trace_role("short_term")]]
+            ma_traces[0].append(x=x_val, y=long_term_val)
+            ma_traces[1].append(x=x_val, y=short_term_val)
+            # Keep the number of points in the traces bounded for long running trades.
+            downsample_line_traces(ma_traces, keep_dates=[trade.buy_date])
 
         return fig
 
+    def _required_indicators(self):
+        """ The simple moving averages used by the module, so that they can be materialised in the database. EMAs are
+            always calculated over the historical data window, see exponential_moving_avg.
+
+        :return: A list of (indicator, period) tuples.
+        """
+        indicators = []
+        for ma_type, period in ((self.config['longTermType'], self.config['longTermDayPeriod']),
+                                (self.config['shortTermType'], self.config['shortTermDayPeriod'])):
+            if ma_type == "SMA":
+                indicators.append((ma_type.lower(), period))
+        return indicators
+
+    def _screen(self, closes):
+        """ Cheap check for the short-term and long-term lines intersecting, run over the latest bars of every ticker at
+            once. An EMA depends on the whole lookback range, so every ticker survives if one is used in the config.
+
+        :param closes: A 2D array holding the latest close prices of every ticker.
+        :return: A boolean array, True for each ticker that could trigger.
+        """
+        if self.config['longTermType'] != "SMA" or self.config['shortTermType'] != "SMA":
+            return np.ones(closes.shape[0], dtype=bool)
+
+        lt_last_val, lt_second_last_val = latest_simple_moving_avgs(closes, self.config['longTermDayPeriod'])
+        st_last_val, st_second_last_val = latest_simple_moving_avgs(closes, self.config['shortTermDayPeriod'])
+        tolerance = np.abs(closes[:, -1]) * SCREEN_TOLERANCE
+
+        # Same BUY signal as in _check_for_intersect, loosened by the tolerance.
+        return (st_second_last_val <= lt_second_last_val + tolerance) & (st_last_val >= lt_last_val - tolerance)
+
+    def _screen_lookback(self):
+        """ The number of bars needed to calculate the latest two values of both moving averages.
+
+        :return: The number of bars, 0 if an EMA is used as it cannot be screened.
+        """
+        if self.config['longTermType'] != "SMA" or self.config['shortTermType'] != "SMA":
+            return 0
+        return max(self.config['longTermDayPeriod'], self.config['shortTermDayPeriod']) + 1
+
     def _check_for_intersect(self, long_term, short_term):
         """ Check the short-term and long-term lines to see if they have just intersected.
 
@@ -145,7 +197,7 @@ class MovingAverages(TechnicalAnalysisDecorator):
         :param fig: The current figure object, is None if analysis hasn't yet been triggered.
         :param long_term: A Series holding the long term moving average.
         :param short_term: A Series holding the short term moving average.
-        :return: A plotly figure object.
+        :return: A FigureModel object.
         """
 
         range_days = 30
@@ -160,16 +212,21 @@ class MovingAverages(TechnicalAnalysisDecorator):
         fig.update_layout(yaxis=dict(range=[y_min - y_range_offset, y_max + y_range_offset]))
 
         # Add the short-term/long-term MA lines to the figure.
-        fig.add_traces([
-            go.Scatter(x=historical_df.index[-start_index_offset:], y=long_term[-start_index_offset:], hoverinfo="skip",
-                       name=f"{self.config['longTermDayPeriod']}-day {self.config['longTermType']}",
-                       line=dict(shape="spline", smoothing=1.3, width=1.3, color="#59b6f0")),
-            go.Scatter(x=historical_df.index[-start_index_offset:], y=short_term[-start_index_offset:], hoverinfo="skip",
-                       name=f"{self.config['shortTermDayPeriod']}-day {self.config['shortTermType']}",
-                       line=dict(shape="spline", smoothing=1.3, width=1.3, color="#3f6deb"))
-        ])
+        ma_traces = [
+            fig.add_trace(self._trace_role("long_term"), "scatter",
+                          dict(x=historical_df.index[-start_index_offset:], y=long_term[-start_index_offset:]),
+                          hoverinfo="skip",
+                          name=f"{self.config['longTermDayPeriod']}-day {self.config['longTermType']}",
+                          line=dict(shape="spline", smoothing=1.3, width=1.3, color="#59b6f0")),
+            fig.add_trace(self._trace_role("short_term"), "scatter",
+                          dict(x=historical_df.index[-start_index_offset:], y=short_term[-start_index_offset:]),
+                          hoverinfo="skip",
+                          name=f"{self.config['shortTermDayPeriod']}-day {self.config['shortTermType']}",
+                          line=dict(shape="spline", smoothing=1.3, width=1.3, color="#3f6deb"))
+        ]
+        downsample_line_traces(ma_traces)
         # Update the figure with relevant information.
         fig.update_layout(
-            xaxis_rangeslider_visible=False
+            xaxis=dict(rangeslider=dict(visible=False))
         )
         return fig
@@ -0,0 +1,105 @@
+""" Reduces the number of points in the series drawn in the figures sent to the UI, which are only ever displayed a few
+    hundred pixels wide, so that payload sizes stay bounded however long a backtest runs. Lines are downsampled with
+    Largest-Triangle-Three-Buckets, which keeps the visual shape of a series, and candles are merged into buckets that
+    keep the open, high, low and close of the days they cover. Points are selected by their position in the series,
+    as the days drawn are evenly spaced trading days. """
+
+import numpy as np
+
+
+def _required_indices(y, num_points, keep):
+    """ Gets the indices that must survive downsampling: the given indices, and the lowest and highest points.
+
+    :param y: An array holding the y values of the series.
+    :param num_points: The number of points in the series.
+    :param keep: Indices of points that must be kept.
+    :return: A sorted array of indices.
+    """
+    required = {int(i) for i in keep if 0 <= i < num_points}
+    if not np.isnan(y).all():
+        required |= {int(np.nanargmin(y)), int(np.nanargmax(y))}
+    return np.array(sorted(required), dtype=int)
+
+
+def lttb(y, max_points, keep=()):
+    """ Selects the points of a line to be drawn using Largest-Triangle-Three-Buckets. The series is split into buckets
+        and from each the point forming the largest triangle with the previously selected point and the average of the
+        next bucket is selected. The first and last points, the extrema and any points in keep are always selected.
+
+    :param y: An array holding the y values of the series.
+    :param max_points: The maximum number of points to be selected.
+    :param keep: Indices of points that must be kept, such as buy and sell dates.
+    :return: A sorted array holding the indices of the selected points.
+    """
+    y = np.asarray(y, dtype=float)
+    num_points = len(y)
+    if num_points <= max_points:
+        return np.arange(num_points)
+
+    required = _required_indices(y, num_points, keep)
+    # Leave room for the required points, along with the first and last.
+    threshold = max(max_points - len(required), 3)
+    x = np.arange(num_points, dtype=float)
+    every = (num_points - 2) / (threshold - 2)
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, num_points)
+        with np.errstate(invalid="ignore"):
+            avg_x = x[next_start:next_end].mean()
+            avg_y = np.nanmean(y[next_start:next_end]) if not np.isnan(y[next_start:next_end]).all() else np.nan
+            areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(areas, nan=-1)))
+        selected[i + 1] = a
+    selected[-1] = num_points - 1
+    return np.union1d(selected, required)
+
+
+def ohlc(opens, highs, lows, closes, max_points, keep=()):
+    """ Merges candles into buckets, each taking the open of its first day, the highest high, the lowest low and the
+        close of its last day, so that the extrema of the series are preserved. Candles in keep are not merged with
+        any others.
+
+    :param opens: An array holding the open prices.
+    :param highs: An array holding the high prices.
+    :param lows: An array holding the low prices.
+    :param closes: An array holding the close prices.
+    :param max_points: The maximum number of candles.
+    :param keep: Indices of candles that must not be merged, such as buy and sell dates.
+    :return: An array holding the index of the first day in each bucket, followed by the merged open, high, low and
+        close arrays.
+    """
+    num_points = len(closes)
+    if num_points <= max_points:
+        return np.arange(num_points), np.asarray(opens), np.asarray(highs), np.asarray(lows), np.asarray(closes)
+
+    keep = np.array([int(i) for i in keep if 0 <= i < num_points], dtype=int)
+    # Each kept candle adds up to two bucket edges, so leave room for them.
+    num_buckets = max(max_points - 2 * len(keep), 1)
+    edges = np.linspace(0, num_points, num_buckets + 1).astype(int)
+    edges = np.unique(np.concatenate([edges, keep, keep + 1]))
+    starts = edges[:-1]
+    ends = edges[1:] - 1
+    return (starts, np.asarray(opens)[starts], np.maximum.reduceat(np.asarray(highs, dtype=float), starts),
+            np.minimum.reduceat(np.asarray(lows, dtype=float), starts), np.asarray(closes)[ends])
+
+
+def split_recent(num_points, max_points, keep_last):
+    """ Works out how to downsample a series whose latest points must be kept as they are, e.g. because they are in
+        the visible range of a figure. Once the series exceeds max_points, the older points are downsampled so that the
+        whole series takes half of max_points, so that it is not downsampled again until many more points are added.
+
+    :param num_points: The number of points in the series.
+    :param max_points: The maximum number of points in the series.
+    :param keep_last: The number of latest points to be kept as they are.
+    :return: The number of older points to be downsampled and the number of points to downsample them into, or None if
+        the series does not need to be downsampled.
+    """
+    if num_points <= max_points or num_points <= keep_last:
+        return None
+    num_older = num_points - keep_last
+    return num_older, max(max_points // 2 - keep_last, 3)
@@ -0,0 +1,212 @@
+""" A lightweight model of the figure drawn for each trade, used in place of a Plotly figure whilst the trade is open.
+    The data arrays of each trace are held in GrowableArrays so that the daily updates append to them cheaply, without
+    reallocating the arrays or going through Plotly's property validation, and traces are looked up by their role
+    rather than by scanning the figure for a matching name. The layout is held as the plain dict of properties it was
+    drawn with, and the model is only converted into Plotly's JSON format when it is serialised, so no Plotly objects
+    are created whilst the trade is open. """
+
+from src.trades.growable_array import GrowableArray
+import plotly.graph_objects as go
+import plotly.io as pio
+import datetime as dt
+import functools
+import pandas as pd
+import numpy as np
+
+# The roles of the traces drawn in every trade figure.
+CANDLES_ROLE = "candles"
+MARKERS_ROLE = "buysell"
+TAKE_PROFIT_ROLE = "take_profit"
+STOP_LOSS_ROLE = "stop_loss"
+
+
+def _to_array(values):
+    """ Converts the values of a trace's data array into a NumPy array, holding dates as datetime64 values.
+
+    :param values: A list, tuple, Series, Index or array of values.
+    :return: A NumPy array.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'M' or (arr.dtype.kind == 'O' and len(arr)
+                                 and all(isinstance(value, (dt.date, np.datetime64)) for value in arr)):
+        return pd.DatetimeIndex(arr).to_numpy().astype("datetime64[s]")
+    if arr.dtype.kind in ('U', 'S'):
+        return arr.astype(object)
+    return arr
+
+
+@functools.lru_cache()
+def _template_json(name):
+    """ Gets a named Plotly template in Plotly's JSON format, as it is written into the layout of a figure using it.
+        Templates are large and never change, so each one is only converted once.
+
+    :param name: The name of the template (e.g. 'simple_white').
+    :return: A dict holding the template.
+    """
+    return pio.templates[name].to_plotly_json()
+
+
+class TraceBuffer:
+    """ A single trace of a figure, holding its data arrays in GrowableArrays along with its other properties. """
+
+    def __init__(self, trace_type, data, properties):
+        """ Constructor that copies the trace's data arrays into buffers.
+
+        :param trace_type: The Plotly type of the trace (e.g. 'scatter').
+        :param data: A dict holding the trace's data arrays, keyed by name (e.g. 'x', 'y', 'open').
+        :param properties: A dict holding the trace's other Plotly properties (e.g. name, line).
+        """
+        self.type = trace_type
+        self.properties = properties
+        self.columns = {}
+        self.set(**data)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, key):
+        return self.columns[key].values
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def append(self, **values):
+        """ Adds a point to the end of the trace's data arrays.
+
+        :param values: The value to be added to each data array, keyed by name.
+        :return: none
+        """
+        for key, value in values.items():
+            self.columns[key].append(value)
+
+    def set(self, **data):
+        """ Replaces the trace's data arrays.
+
+        :param data: The new data arrays, keyed by name.
+        :return: none
+        """
+        for key, values in data.items():
+            arr = _to_array(values)
+            column = GrowableArray(arr.dtype, capacity=max(len(arr) * 2, 16))
+            column.extend(arr)
+            self.columns[key] = column
+
+    def copy(self):
+        """ Copies the trace, so that later updates to it are not seen by the copy.
+
+        :return: A TraceBuffer object.
+        """
+        trace = TraceBuffer.__new__(TraceBuffer)
+        trace.type = self.type
+        trace.properties = _copy_dicts(self.properties)
+        trace.columns = {key: column.copy() for key, column in self.columns.items()}
+        return trace
+
+    def to_plotly_json(self):
+        """ Converts the trace into Plotly's JSON format.
+
+        :return: A dict holding the trace.
+        """
+        trace = {"type": self.type}
+        trace.update(self.properties)
+        for key, column in self.columns.items():
+            trace[key] = column.values
+        return trace
+
+
+class FigureModel:
+    """ The traces and layout of a figure. Traces are kept in the order they are drawn in, and are keyed by role. """
+
+    def __init__(self, layout):
+        """ Constructor that creates a figure with no traces.
+
+        :param layout: A dict holding the figure's layout properties, nested as in Plotly's JSON format (e.g.
+            legend=dict(font=dict(size=10)) rather than legend_font_size). The template may be given by name.
+        """
+        self.layout = layout
+        self.traces = {}
+
+    def __contains__(self, role):
+        return role in self.traces
+
+    def __getitem__(self, role):
+        return self.traces[role]
+
+    def add_trace(self, role, trace_type, data, **properties):
+        """ Adds a trace on top of the existing traces.
+
+        :param role: The unique role of the trace in the figure, used to look it up.
+        :param trace_type: The Plotly type of the trace (e.g. 'scatter').
+        :param data: A dict holding the trace's data arrays, keyed by name (e.g. 'x', 'y').
+        :param properties: The trace's other Plotly properties (e.g. name, line).
+        :return: The TraceBuffer object.
+        """
+        if role in self.traces:
+            raise ValueError(f"The figure already holds a trace with role '{role}'.")
+        self.traces[role] = TraceBuffer(trace_type, data, properties)
+        return self.traces[role]
+
+    def index(self, role):
+        """ Gets the position of a trace in the figure, as used by Plotly to identify it.
+
+        :param role: The role of the trace.
+        :return: The index of the trace.
+        """
+        return list(self.traces).index(role)
+
+    def update_layout(self, **changes):
+        """ Updates the layout, merging nested dicts into the existing properties as Plotly does.
+
+        :param changes: The properties to be changed (e.g. yaxis=dict(range=[0, 1])).
+        :return: none
+        """
+        _merge(self.layout, changes)
+
+    def copy(self):
+        """ Copies the figure, so that later updates to it are not seen by the copy.
+
+        :return: A FigureModel object.
+        """
+        figure = FigureModel(_copy_dicts(self.layout))
+        figure.traces = {role: trace.copy() for role, trace in self.traces.items()}
+        return figure
+
+    def to_plotly_json(self):
+        """ Converts the figure into Plotly's JSON format.
+
+        :return: A dict holding the data and layout of the figure.
+        """
+        layout = self.layout
+        if isinstance(layout.get("template"), str):
+            layout = dict(layout, template=_template_json(layout["template"]))
+        return {"data": [trace.to_plotly_json() for trace in self.traces.values()], "layout": layout}
+
+    def to_figure(self):
+        """ Converts the model into a Plotly figure object.
+
+        :return: A Plotly figure object.
+        """
+        return go.Figure(self.to_plotly_json())
+
+
+def _copy_dicts(properties):
+    """ Copies a dict of properties along with the dicts nested in it, which are the only values updated in place.
+
+    :param properties: The dict to be copied.
+    :return: The copy of the dict.
+    """
+    return {key: _copy_dicts(value) if isinstance(value, dict) else value for key, value in properties.items()}
+
+
+def _merge(target, changes):
+    """ Merges a dict of changes into a dict, recursing into nested dicts.
+
+    :param target: The dict to be updated in place.
+    :param changes: The dict holding the changes.
+    :return: none
+    """
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
@@ -0,0 +1,76 @@
+""" Precompiled figure JSON for the small graphs that are redrawn for every trade, where only a few values change between
+    calls. The figure is drawn with Plotly once with placeholder values, and its JSON is split at the placeholders so
+    that later figures are made by joining the static parts with the encoded values. The values are encoded the same
+    way Plotly encodes them, so the output is identical to calling to_json() on a freshly drawn figure. """
+
+import math
+import numbers
+
+
+class FigureTemplate:
+
+    def __init__(self, fig_json, slots):
+        """ Constructor that splits the figure JSON at each of the placeholders.
+
+        :param fig_json: A JSON string holding a figure drawn with placeholder values.
+        :param slots: A dict mapping each slot name to the JSON of its placeholder, e.g. {"y": '["__y__"]'}. Each
+            placeholder must appear in the figure JSON exactly once.
+        :return: none
+        """
+        positions = []
+        for name, placeholder in slots.items():
+            if fig_json.count(placeholder) != 1:
+                raise ValueError(f"Placeholder for slot '{name}' must appear exactly once in the figure JSON.")
+            positions.append((fig_json.index(placeholder), name, placeholder))
+        positions.sort()
+
+        self._parts = []
+        self._slot_names = []
+        start = 0
+        for position, name, placeholder in positions:
+            self._parts.append(fig_json[start:position])
+            self._slot_names.append(name)
+            start = position + len(placeholder)
+        self._parts.append(fig_json[start:])
+
+    def render(self, **values):
+        """ Creates the figure JSON with values written into the slots.
+
+        :param values: The JSON of each slot's value, keyed by slot name.
+        :return: A JSON string holding the figure.
+        """
+        pieces = [self._parts[0]]
+        for name, part in zip(self._slot_names, self._parts[1:]):
+            pieces.append(values[name])
+            pieces.append(part)
+        return "".join(pieces)
+
+
+def encode_number(value):
+    """ Encodes a number as Plotly does, with missing and infinite values as null.
+
+    :param value: An int or float.
+    :return: A string holding the JSON of the number.
+    """
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return str(int(value))
+    value = float(value)
+    return repr(value) if math.isfinite(value) else "null"
+
+
+def encode_numbers(values):
+    """ Encodes an array of numbers as Plotly does.
+
+    :param values: An array or list of numbers.
+    :return: A string holding the JSON array.
+    """
+    return "[" + ",".join([encode_number(value) for value in values]) + "]"
+
+
+def encode_dates(values):
+    """ Encodes an array of dates as Plotly does, in ISO format.
+
+    :param values: A list of datetime objects.
+    :return: A string holding the JSON array.
+    """
+    return "[" + ",".join(['"' + value.isoformat() + '"' for value in values]) + "]"
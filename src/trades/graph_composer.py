@@ -1,7 +1,15 @@
 from src.data_validators import date_validator
+from src.data_handlers import serializer
+from src.trades import downsampling, figure_template
 import plotly.graph_objects as go
-import plotly.io
 import datetime as dt
+import numpy as np
+
+# The most points drawn in the profit/loss and closed trade graphs, one per pixel of their width.
+PROFIT_LOSS_GRAPH_MAX_POINTS = 120
+CLOSED_TRADE_GRAPH_MAX_POINTS = 75
+# The precompiled open/closed trade graphs, keyed by graph and colour.
+_templates = {}
 
 
 def draw_open_trade_graph(trade):
@@ -11,6 +19,17 @@ def draw_open_trade_graph(trade):
     :param trade: A Trade object containing the trade data.
     :return figure: A JSON object containing the figure object to be easily read by the UI.
     """
+    cp_percent = open_trade_graph_pct(trade)
+    return render_open_trade_graph(cp_percent), cp_percent
+
+
+def open_trade_graph_pct(trade):
+    """ Scales the current price of an open trade between its stop loss (-1) and take profit (1), the value shown in
+        the open trade graph.
+
+    :param trade: A Trade object containing the trade data.
+    :return: The scaled current price.
+    """
     buy_price = trade.buy_price
     current_price = trade.current_price
     take_profit = trade.take_profit
@@ -24,9 +43,27 @@ def draw_open_trade_graph(trade):
         cp_percent = (relative_cp / relative_tp)
     else:
         cp_percent = -(relative_cp / relative_sl)
+    return cp_percent
+
+
+def render_open_trade_graph(cp_percent):
+    """ Draws the open trade graph of a trade from its scaled current price.
 
-    # Set colour and draw figure.
-    colour = "mediumseagreen" if cp_percent >= 0 else "rgb(211,63,73)"
+    :param cp_percent: The current price scaled between the stop loss (-1) and take profit (1).
+    :return: A JSON string holding the figure.
+    """
+    # Write the value and colour into the precompiled figure.
+    template = _get_template("open", _open_trade_graph_colour(cp_percent))
+    return template.render(y=figure_template.encode_numbers([cp_percent]))
+
+
+def _draw_open_trade_figure(cp_percent, colour):
+    """ Draws the open trade graph with Plotly, used to create its precompiled template.
+
+    :param cp_percent: The current price scaled between the stop loss (-1) and take profit (1).
+    :param colour: The colour of the bar.
+    :return fig: A JSON string holding the figure.
+    """
     fig = go.Figure(go.Bar(
         x=['price'],
         y=[cp_percent],
@@ -54,7 +91,26 @@ def draw_open_trade_graph(trade):
                       margin=dict(t=0, l=0, r=0, b=0), plot_bgcolor='rgba(0,0,0,0)', showlegend=False)
     # Save to JSON to allow it to be saved in the MySQL table.
     fig = fig.to_json()
-    return fig, cp_percent
+    return fig
+
+
+def _open_trade_graph_colour(cp_percent):
+    """ Gets the colour of the bar in the open trade graph.
+
+    :param cp_percent: The current price scaled between the stop loss (-1) and take profit (1).
+    :return: A string holding the colour.
+    """
+    return "mediumseagreen" if cp_percent >= 0 else "rgb(211,63,73)"
+
+
+def open_trade_graph_patch(cp_percent):
+    """ Gets the changes needed to update a previously drawn open trade graph to a new price, so that the UI does not
+        need to be sent the whole figure again.
+
+    :param cp_percent: The current price scaled between the stop loss (-1) and take profit (1).
+    :return: A dict holding the new values of the bar trace, keyed by property path.
+    """
+    return {"y": [cp_percent], "marker.color": _open_trade_graph_colour(cp_percent)}
 
 
 def draw_closed_trade_graph(trade):
@@ -69,9 +125,32 @@ def draw_closed_trade_graph(trade):
     # Trim the dataset so that the buy/sell points are not so squeezed together on graph.
     trim_date = date_validator.validate_date(trade.buy_date - dt.timedelta(weeks=2), 1)
     trimmed_data = trade.historical_data[trim_date:trade.sell_date]
+    # Downsample the close prices to the width of the graph, keeping the days the trade was bought and sold on.
+    keep = np.flatnonzero(trimmed_data.index.isin([trade.buy_date, trade.sell_date]))
+    selected = downsampling.lttb(trimmed_data["close"].values, CLOSED_TRADE_GRAPH_MAX_POINTS, keep=keep)
+
+    # Write the values into the precompiled figure.
+    template = _get_template("closed", line_colour)
+    fig = template.render(x=figure_template.encode_dates(trimmed_data.index[selected].to_pydatetime()),
+                          y=figure_template.encode_numbers(trimmed_data["close"].values[selected]),
+                          marker_x=figure_template.encode_dates([trade.buy_date, trade.sell_date]),
+                          marker_y=figure_template.encode_numbers([trade.buy_price, trade.sell_price]))
+    return fig
+
+
+def _draw_closed_trade_figure(x, y, marker_x, marker_y, line_colour):
+    """ Draws the closed trade graph with Plotly, used to create its precompiled template.
+
+    :param x: The dates of the close prices.
+    :param y: The close prices.
+    :param marker_x: The buy and sell dates.
+    :param marker_y: The buy and sell prices.
+    :param line_colour: The colour of the close price line.
+    :return fig: A JSON string holding the figure.
+    """
     fig = go.Figure(go.Scatter(
-        x=trimmed_data.index,
-        y=trimmed_data["close"],
+        x=x,
+        y=y,
         line=dict(color=line_colour),
         mode="lines"
     ))
@@ -86,8 +165,8 @@ def draw_closed_trade_graph(trade):
     )
     # Add the crosses to the graph to show where the bot bought and sold.
     fig.add_trace(dict(
-        x=[trade.buy_date, trade.sell_date],
-        y=[trade.buy_price, trade.sell_price],
+        x=marker_x,
+        y=marker_y,
         mode="markers",
         marker_symbol="x-thin",
         marker_line_color="rgba(0,0,0,0.9)",
@@ -101,37 +180,33 @@ def draw_closed_trade_graph(trade):
     return fig
 
 
-def create_initial_profit_loss_figure(date, total_balance):
-    """ Creates a plain figure object for the profit/loss graph, this will be the graph that gets updated as the
-        backtest progresses.
+def _get_template(graph, colour):
+    """ Gets the precompiled template of the open or closed trade graph in the given colour, drawing it with Plotly the
+        first time it is needed.
 
-    :param date: The starting date in the backtest.
-    :param total_balance: The starting balance in the backtest.
-    :return fig: The profit/loss figure object.
+    :param graph: The graph to get the template of ('open' or 'closed').
+    :param colour: The colour of the bar or line in the graph.
+    :return: A FigureTemplate object.
     """
-    fig = go.Figure(go.Scatter(
-        x=[date],
-        y=[total_balance],
-        mode='markers',
-        line=dict(color="mediumseagreen")
-    ))
-    fig.update_layout(
-        height=37,
-        width=120,
-        margin=dict(t=0, l=0, r=0, b=0),
-        plot_bgcolor='rgba(0,0,0,0)',
-        showlegend=False,
-        yaxis=dict(visible=False),
-        xaxis=dict(visible=False))
-    fig = fig.to_json()
-    return fig
+    key = (graph, colour)
+    if key not in _templates:
+        if graph == "open":
+            fig_json = _draw_open_trade_figure("__y__", colour)
+            slots = {"y": '["__y__"]'}
+        else:
+            fig_json = _draw_closed_trade_figure(["__x__"], ["__y__"], ["__marker_x__"], ["__marker_y__"], colour)
+            slots = {"x": '["__x__"]', "y": '["__y__"]', "marker_x": '["__marker_x__"]',
+                     "marker_y": '["__marker_y__"]'}
+        _templates[key] = figure_template.FigureTemplate(fig_json, slots)
+    return _templates[key]
 
 
-def update_profit_loss_graph(backtest):
-    """ Updates the profit/loss graph held in the backtest properties by appending values into the data.
+def draw_profit_loss_graph(backtest):
+    """ Draws the profit/loss graph from the equity curve held in the backtest. The curve is downsampled so that the
+        size of the graph stays bounded however long the backtest runs.
 
     :param backtest: The backtest object.
-    :return fig: The profit/loss figure object.
+    :return fig: A JSON string holding the profit/loss figure.
     """
     # Set the opacity of the 'start balance' line, it stays fully visible whilst the profit loss is within a 10%
     # difference range, and slowly fades out as it gets further away until it reaches 30%.
@@ -144,25 +219,36 @@ def update_profit_loss_graph(backtest):
         alpha = 0
     else:
         alpha = 255
-    # Load figure from JSON string to allow it to be easily modified.
-    fig = plotly.io.from_json(backtest.total_profit_loss_graph)
-    # Append new date and total balance to x and y tuple objects by adding them as a single element tuple.
-    fig.data[0].x += (backtest.backtest_date,)
-    fig.data[0].y += (backtest.total_balance,)
-    # Set the line colour based on the profit/loss value.
-    fig.data[0].line.color = "mediumseagreen" if backtest.total_profit_loss >=0 else "rgb(211,63,73)"
-    fig.data[0].mode = "lines"
-    if len(fig.data) == 1:
+
+    balances = backtest.equity_balances.values
+    selected = downsampling.lttb(balances, PROFIT_LOSS_GRAPH_MAX_POINTS)
+    dates, balances = backtest.equity_dates.values[selected], balances[selected]
+    fig = go.Figure(go.Scatter(
+        x=dates,
+        y=balances,
+        mode='markers',
+        line=dict(color="mediumseagreen")
+    ))
+    fig.update_layout(
+        height=37,
+        width=120,
+        margin=dict(t=0, l=0, r=0, b=0),
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=False,
+        yaxis=dict(visible=False),
+        xaxis=dict(visible=False))
+
+    # Once the backtest has progressed, draw the curve as a line along with the 'start balance' line.
+    if len(balances) > 1:
+        # Set the line colour based on the profit/loss value.
+        fig.data[0].line.color = "mediumseagreen" if backtest.total_profit_loss >=0 else "rgb(211,63,73)"
+        fig.data[0].mode = "lines"
         fig.add_trace(
-            dict(x=[backtest.start_date, backtest.backtest_date],
+            dict(x=[backtest.start_date, dates[-1]],
                  y=[backtest.start_balance, backtest.start_balance],
                  mode="lines",
                  line=dict(color=f"rgba(0,0,0,{alpha})",
                            width=1,
                            dash="dash"),
                 showlegend=False))
-    else:
-        fig.data[1].x = (backtest.start_date, backtest.backtest_date)
-        fig.data[1].line.color = f"rgba(0,0,0,{alpha})"
-    fig = fig.to_json()
-    return fig
+    return serializer.figure_json(fig)
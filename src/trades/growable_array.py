@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class GrowableArray:
+    """ A NumPy array that can be appended to cheaply. Values are held in a buffer that doubles in capacity when full,
+        so appending is amortised O(1) rather than copying the whole array each time as np.append does. """
+
+    def __init__(self, dtype=float, capacity=16):
+        """ Constructor that creates an empty array.
+
+        :param dtype: The NumPy dtype of the values, or a (dtype, shape) tuple to hold rows of a fixed shape.
+        :param capacity: The number of values to allocate space for initially.
+        """
+        self._buffer = np.empty(max(int(capacity), 1), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        """ A view of the values held in the array. """
+        return self._buffer[:self._size]
+
+    def _reserve(self, size):
+        """ Makes sure the buffer has space for at least the given number of values, doubling its capacity until it does.
+
+        :param size: The number of values the buffer must be able to hold.
+        :return: none
+        """
+        capacity = len(self._buffer)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        buffer = np.empty((capacity,) + self._buffer.shape[1:], dtype=self._buffer.dtype)
+        buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+
+    def append(self, value):
+        """ Adds a value to the end of the array.
+
+        :param value: The value to be added.
+        :return: none
+        """
+        self._reserve(self._size + 1)
+        self._buffer[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        """ Adds several values to the end of the array.
+
+        :param values: An array or list of values to be added.
+        :return: none
+        """
+        values = np.asarray(values, dtype=self._buffer.dtype)
+        self._reserve(self._size + len(values))
+        self._buffer[self._size:self._size + len(values)] = values
+        self._size += len(values)
+
+    def copy(self):
+        """ Copies the array, so that values added to it later are not seen by the copy.
+
+        :return: A GrowableArray holding a copy of the values, with no spare capacity.
+        """
+        array = GrowableArray((self._buffer.dtype, self._buffer.shape[1:]), capacity=self._size)
+        array.extend(self.values)
+        return array
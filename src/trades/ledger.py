@@ -0,0 +1,167 @@
+from src.trades.position_book import PositionBook
+from src.trades.payload_store import TradePayloadStore
+import numpy as np
+
+# The fixed schema of each record in the closed positions array.
+CLOSED_POSITION_DTYPE = np.dtype([
+    ("ticker", "U10"),
+    ("buy_date", "datetime64[s]"),
+    ("sell_date", "datetime64[s]"),
+    ("buy_price", "f8"),
+    ("sell_price", "f8"),
+    ("share_qty", "i8"),
+    ("investment_total", "f8"),
+    ("profit_loss", "f8"),
+    ("profit_loss_pct", "f8")
+])
+
+
+class PortfolioLedger:
+    """ Tracks the balances of a backtest along with its open and closed positions. Open positions are held in a
+        PositionBook and closed positions in a structured NumPy array, so summary statistics come from the arrays. """
+
+    def __init__(self, start_balance, payloads_on_disk=False):
+        """ Constructor that creates an empty ledger.
+
+        :param start_balance: The starting balance of the backtest.
+        :param payloads_on_disk: Whether to keep the heavyweight trade payloads on disk until they are needed.
+        """
+        self.start_balance = start_balance
+        self.total_balance = start_balance
+        self.available_balance = start_balance
+        self.total_profit_loss = 0
+        self.total_profit_loss_pct = 0
+        self.open_positions = PositionBook()
+        self.payload_store = TradePayloadStore(on_disk=payloads_on_disk)
+        self._closed_positions = np.empty(16, dtype=CLOSED_POSITION_DTYPE)
+        self._num_closed = 0
+        # The payload keys of closed trades whose figures are kept to be rendered on request, keyed by trade id.
+        self._closed_figure_keys = {}
+
+    @property
+    def closed_positions(self):
+        """ A structured array holding a record of every closed position. """
+        return self._closed_positions[:self._num_closed]
+
+    def open_position(self, trade):
+        """ Adds a newly opened trade to the open positions, and sets aside its investment total from the available
+            balance.
+
+        :param trade: A Trade object holding all information on the opened trade.
+        :return: none
+        """
+        self.available_balance -= trade.investment_total
+        self.open_positions.add(trade)
+
+    def close_position(self, trade):
+        """ Takes a sold trade out of the open positions, records it in the closed positions and updates the balances
+            with its profit/loss. The trade's sell price and date must already be set.
+
+        :param trade: The Trade object that has been sold, which must be one of the open positions.
+        :return: none
+        """
+        open_trades = self.open_positions.trades
+        mask = np.fromiter((open_trade is trade for open_trade in open_trades), dtype=bool, count=len(open_trades))
+        if not mask.any():
+            raise ValueError(f"The {trade.ticker} trade bought on {trade.buy_date} is not an open position.")
+        self.open_positions.remove(mask)
+
+        self.available_balance += trade.sell_price * trade.share_qty
+        trade.profit_loss = (trade.sell_price * trade.share_qty) - trade.investment_total
+        trade.profit_loss_pct = (trade.profit_loss / trade.investment_total) * 100
+        self.total_balance += trade.profit_loss
+        self.total_profit_loss = self.total_balance - self.start_balance
+        self.total_profit_loss_pct = self.total_profit_loss / self.start_balance * 100
+
+        # Double the capacity of the closed positions array when it is full.
+        if self._num_closed == len(self._closed_positions):
+            self._closed_positions = np.resize(self._closed_positions, len(self._closed_positions) * 2)
+        self._closed_positions[self._num_closed] = (trade.ticker, trade.buy_date, trade.sell_date, trade.buy_price,
+                                                    trade.sell_price, trade.share_qty, trade.investment_total,
+                                                    trade.profit_loss, trade.profit_loss_pct)
+        self._num_closed += 1
+
+    def keep_figure(self, trade):
+        """ Keeps track of the figure of a closed trade that has been left in the payload store, so that it can still
+            be found by find_figure.
+
+        :param trade: The closed Trade object, whose figure payload has not been released.
+        :return: none
+        """
+        self._closed_figure_keys[trade.trade_id] = trade.payload_key
+
+    def find_figure(self, trade_id):
+        """ Finds the figure of an open trade, or of a closed trade whose figure has been kept.
+
+        :param trade_id: The id of the trade assigned by the api.
+        :return: The trade's FigureModel object, or None if it cannot be found.
+        """
+        for trade in self.open_positions.trades:
+            if trade.trade_id == trade_id:
+                return trade.figure
+        key = self._closed_figure_keys.get(trade_id)
+        return None if key is None else self.payload_store.get(key, "figure")
+
+    def checkpoint_state(self):
+        """ Gets the balances of the ledger and the keys of the figures it keeps, to be saved in a checkpoint. The
+            closed and open positions are saved separately.
+
+        :return: A dict holding the state.
+        """
+        return {
+            "total_balance": self.total_balance,
+            "available_balance": self.available_balance,
+            "total_profit_loss": self.total_profit_loss,
+            "total_profit_loss_pct": self.total_profit_loss_pct,
+            "closed_figure_keys": dict(self._closed_figure_keys),
+            "next_payload_key": self.payload_store.next_key
+        }
+
+    def restore(self, state, closed_positions, open_trades):
+        """ Restores the ledger of a backtest resumed from a checkpoint. The payloads of the trades must already have
+            been put back in the payload store.
+
+        :param state: The dict returned by checkpoint_state.
+        :param closed_positions: A structured array holding a record of every closed position.
+        :param open_trades: A list of the open Trade objects, in the order they were opened.
+        :return: none
+        """
+        self.total_balance = state["total_balance"]
+        self.available_balance = state["available_balance"]
+        self.total_profit_loss = state["total_profit_loss"]
+        self.total_profit_loss_pct = state["total_profit_loss_pct"]
+        self._closed_figure_keys = dict(state["closed_figure_keys"])
+        self.payload_store.continue_keys(state["next_payload_key"])
+        self._closed_positions = np.empty(max(16, len(closed_positions) * 2), dtype=CLOSED_POSITION_DTYPE)
+        self._closed_positions[:len(closed_positions)] = closed_positions
+        self._num_closed = len(closed_positions)
+        # The book is shared with the trade handler, so the trades are added to it rather than it being replaced.
+        for trade in open_trades:
+            self.open_positions.add(trade)
+
+    def summary(self):
+        """ Calculates summary statistics of the trades made so far.
+
+        :return: A dict holding the statistics.
+        """
+        closed = self.closed_positions
+        wins = closed['profit_loss'] > 0
+        return {
+            "num_trades": len(closed),
+            "num_open_trades": len(self.open_positions),
+            "win_rate_pct": wins.mean() * 100 if len(closed) else 0,
+            "total_profit_loss": self.total_profit_loss,
+            "total_profit_loss_pct": self.total_profit_loss_pct,
+            "avg_profit_loss_pct": closed['profit_loss_pct'].mean() if len(closed) else 0,
+            "best_profit_loss_pct": closed['profit_loss_pct'].max() if len(closed) else 0,
+            "worst_profit_loss_pct": closed['profit_loss_pct'].min() if len(closed) else 0,
+            "open_investment_total": self.open_positions.investment_total.sum()
+        }
+
+    def close(self):
+        """ Releases the payloads of every trade held in the ledger.
+
+        :return: none
+        """
+        self.payload_store.close()
+        self._closed_figure_keys = {}
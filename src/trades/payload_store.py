@@ -0,0 +1,124 @@
+import contextlib
+import os
+import shelve
+import shutil
+import tempfile
+import threading
+
+
+class TradePayloadStore:
+    """ Holds the heavyweight per-trade payloads (historical data, figures) separately from the Trade records. Payloads
+        can be kept in memory when they are used every day, or spilled to a file on disk and only loaded when needed.
+    """
+
+    def __init__(self, on_disk=False):
+        """ Constructor that creates an empty store.
+
+        :param on_disk: Whether to keep the payloads in a temporary file on disk rather than in memory.
+        """
+        self.on_disk = on_disk
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # The payloads of trades held in memory by hold, keyed by payload key and then by name.
+        self._held = {}
+        if on_disk:
+            self._directory = tempfile.mkdtemp(prefix="trade_payloads_")
+            self._payloads = shelve.open(os.path.join(self._directory, "payloads"))
+        else:
+            self._directory = None
+            self._payloads = {}
+
+    def new_key(self):
+        """ Creates a new unique key for a trade's payloads.
+
+        :return: An integer key.
+        """
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+        return key
+
+    @property
+    def next_key(self):
+        """ The key that will be created next, read without creating it. """
+        return self._next_key
+
+    def continue_keys(self, next_key):
+        """ Continues the keys from a given key, when trades created by an earlier run are put back in the store.
+
+        :param next_key: The first key to be created.
+        :return: none
+        """
+        with self._lock:
+            self._next_key = next_key
+
+    def put(self, key, name, value):
+        """ Saves one of a trade's payloads.
+
+        :param key: The trade's payload key.
+        :param name: The name of the payload (e.g. 'figure').
+        :param value: The payload object.
+        :return: none
+        """
+        with self._lock:
+            if key in self._held:
+                self._held[key][name] = value
+            else:
+                self._payloads[f"{key}/{name}"] = value
+
+    def get(self, key, name):
+        """ Loads one of a trade's payloads.
+
+        :param key: The trade's payload key.
+        :param name: The name of the payload (e.g. 'figure').
+        :return: The payload object, or None if it has not been saved.
+        """
+        with self._lock:
+            if key not in self._held:
+                return self._payloads.get(f"{key}/{name}")
+            held = self._held[key]
+            if name not in held:
+                held[name] = self._payloads.get(f"{key}/{name}")
+            return held[name]
+
+    def delete(self, key, names):
+        """ Removes a trade's payloads from the store.
+
+        :param key: The trade's payload key.
+        :param names: The names of the payloads to remove.
+        :return: none
+        """
+        with self._lock:
+            for name in names:
+                self._payloads.pop(f"{key}/{name}", None)
+                self._held.get(key, {}).pop(name, None)
+
+    @contextlib.contextmanager
+    def hold(self, key):
+        """ Holds a trade's payloads in memory while they are read and updated many times, so that payloads kept on
+            disk are only loaded and saved once. They are saved back to the store when the block exits.
+
+        :param key: The trade's payload key.
+        :return: none
+        """
+        with self._lock:
+            self._held[key] = {}
+        try:
+            yield
+        finally:
+            with self._lock:
+                for name, value in self._held.pop(key).items():
+                    if value is not None:
+                        self._payloads[f"{key}/{name}"] = value
+
+    def close(self):
+        """ Removes every payload, deleting the file on disk if one was used.
+
+        :return: none
+        """
+        with self._lock:
+            if self.on_disk:
+                self._payloads.close()
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self.on_disk = False
+            self._payloads = {}
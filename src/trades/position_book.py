@@ -0,0 +1,175 @@
+import numpy as np
+
+
+def first_exit_index(closes, take_profit, stop_loss):
+    """ Finds the first close price that exceeds a trade's take profit/stop loss thresholds.
+
+    :param closes: An array holding the close prices following the trade being opened, oldest first.
+    :param take_profit: The take profit stock price threshold.
+    :param stop_loss: The stop loss stock price threshold.
+    :return: The index of the first crossing, or None if the thresholds are never exceeded.
+    """
+    crossings = (closes > take_profit) | (closes < stop_loss)
+    if not crossings.any():
+        return None
+    return int(np.argmax(crossings))
+
+
+class PositionBook:
+    """ Holds the numbers of every open trade in parallel NumPy arrays, so that the daily price refresh, profit/loss
+        update and take profit/stop loss check are done for all open trades in a single vectorised step. """
+
+    def __init__(self):
+        """ Constructor that creates an empty book. """
+        self.trades = []
+        self.buy_price = np.empty(0)
+        self.share_qty = np.empty(0)
+        self.investment_total = np.empty(0)
+        self.take_profit = np.empty(0)
+        self.stop_loss = np.empty(0)
+        self.current_price = np.empty(0)
+        self.profit_loss = np.empty(0)
+        self.profit_loss_pct = np.empty(0)
+
+    def __len__(self):
+        return len(self.trades)
+
+    @property
+    def tickers(self):
+        """ The tickers of the open trades, in the same order as the arrays. """
+        return [trade.ticker for trade in self.trades]
+
+    def add(self, trade):
+        """ Adds a newly opened trade to the end of the book.
+
+        :param trade: A Trade object holding all information on the opened trade.
+        :return: none
+        """
+        self.trades.append(trade)
+        self.buy_price = np.append(self.buy_price, trade.buy_price)
+        self.share_qty = np.append(self.share_qty, trade.share_qty)
+        self.investment_total = np.append(self.investment_total, trade.investment_total)
+        self.take_profit = np.append(self.take_profit, trade.take_profit)
+        self.stop_loss = np.append(self.stop_loss, trade.stop_loss)
+        self.current_price = np.append(self.current_price, trade.current_price)
+        self.profit_loss = np.append(self.profit_loss, trade.profit_loss)
+        self.profit_loss_pct = np.append(self.profit_loss_pct, trade.profit_loss_pct)
+
+    def remove(self, mask):
+        """ Removes trades from the book.
+
+        :param mask: A boolean array, True for each trade to be removed.
+        :return: A list of the removed Trade objects.
+        """
+        removed = [trade for trade, remove in zip(self.trades, mask) if remove]
+        self.trades = [trade for trade, remove in zip(self.trades, mask) if not remove]
+        keep = ~np.asarray(mask, dtype=bool)
+        self.buy_price = self.buy_price[keep]
+        self.share_qty = self.share_qty[keep]
+        self.investment_total = self.investment_total[keep]
+        self.take_profit = self.take_profit[keep]
+        self.stop_loss = self.stop_loss[keep]
+        self.current_price = self.current_price[keep]
+        self.profit_loss = self.profit_loss[keep]
+        self.profit_loss_pct = self.profit_loss_pct[keep]
+        return removed
+
+    def update_prices(self, prices):
+        """ Refreshes the price and profit/loss of every open trade, and checks them against their take profit/stop
+            loss thresholds.
+
+        :param prices: An array holding the latest close price of each trade, NaN if there is no new price.
+        :return: A boolean array, True for each trade that has exceeded its take profit/stop loss threshold.
+        """
+        self.current_price = np.where(np.isnan(prices), self.current_price, prices)
+        self.profit_loss = (self.current_price * self.share_qty) - self.investment_total
+        self.profit_loss_pct = (self.profit_loss / self.investment_total) * 100
+        return (self.current_price > self.take_profit) | (self.current_price < self.stop_loss)
+
+    def set_price(self, i, price):
+        """ Sets the price of a single open trade and refreshes its profit/loss.
+
+        :param i: The index of the trade in the book.
+        :param price: The new price of the trade.
+        :return: none
+        """
+        self.current_price[i] = price
+        self.profit_loss[i] = (price * self.share_qty[i]) - self.investment_total[i]
+        self.profit_loss_pct[i] = (self.profit_loss[i] / self.investment_total[i]) * 100
+
+    def sync_trade(self, i):
+        """ Copies the numbers held in the book back onto a Trade object, so it can be displayed or closed.
+
+        :param i: The index of the trade in the book.
+        :return: The Trade object.
+        """
+        trade = self.trades[i]
+        trade.current_price = self.current_price[i]
+        trade.profit_loss = self.profit_loss[i]
+        trade.profit_loss_pct = self.profit_loss_pct[i]
+        return trade
+
+
+class SimulatedPositionBook:
+    """ Holds the open positions of many simulations of a backtest in parallel NumPy arrays, each position recording
+        the simulation it belongs to, so that the positions of every simulation are refreshed and checked against their
+        take profit/stop loss thresholds in a single vectorised step. Positions only hold their numbers, as simulated
+        trades are not sent to the api. """
+
+    def __init__(self):
+        """ Constructor that creates an empty book. """
+        self.simulation = np.empty(0, dtype=int)
+        self.ticker = np.empty(0, dtype=int)
+        self.share_qty = np.empty(0)
+        self.investment_total = np.empty(0)
+        self.take_profit = np.empty(0)
+        self.stop_loss = np.empty(0)
+        self.current_price = np.empty(0)
+
+    def __len__(self):
+        return len(self.simulation)
+
+    def add(self, simulation, ticker, buy_price, share_qty, investment_total, take_profit, stop_loss):
+        """ Adds newly opened positions to the end of the book.
+
+        :param simulation: An array holding the index of the simulation each position belongs to.
+        :param ticker: An array holding the index of each position's ticker.
+        :param buy_price: An array holding the price each position was bought at.
+        :param share_qty: An array holding the number of shares of each position.
+        :param investment_total: An array holding the total cost of each position.
+        :param take_profit: An array holding the take profit price threshold of each position.
+        :param stop_loss: An array holding the stop loss price threshold of each position.
+        :return: none
+        """
+        self.simulation = np.concatenate([self.simulation, simulation])
+        self.ticker = np.concatenate([self.ticker, ticker])
+        self.share_qty = np.concatenate([self.share_qty, share_qty])
+        self.investment_total = np.concatenate([self.investment_total, investment_total])
+        self.take_profit = np.concatenate([self.take_profit, take_profit])
+        self.stop_loss = np.concatenate([self.stop_loss, stop_loss])
+        self.current_price = np.concatenate([self.current_price, buy_price])
+
+    def remove(self, mask):
+        """ Removes positions from the book.
+
+        :param mask: A boolean array, True for each position to be removed.
+        :return: none
+        """
+        keep = ~np.asarray(mask, dtype=bool)
+        self.simulation = self.simulation[keep]
+        self.ticker = self.ticker[keep]
+        self.share_qty = self.share_qty[keep]
+        self.investment_total = self.investment_total[keep]
+        self.take_profit = self.take_profit[keep]
+        self.stop_loss = self.stop_loss[keep]
+        self.current_price = self.current_price[keep]
+
+    def update_prices(self, prices):
+        """ Refreshes the price of every position, and checks them against their take profit/stop loss thresholds.
+
+        :param prices: An array holding the latest close price of each ticker index, NaN if there is no new price.
+        :return: A boolean array, True for each position that has exceeded its take profit/stop loss threshold.
+        """
+        prices = prices[self.ticker]
+        self.current_price = np.where(np.isnan(prices), self.current_price, prices)
+        return (self.current_price > self.take_profit) | (self.current_price < self.stop_loss)
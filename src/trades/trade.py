@@ -1,8 +1,52 @@
-import copy
+from src.data_handlers.historical_data_handler import PRICE_COLUMNS
+from src.trades.payload_store import TradePayloadStore
+from src.trades import graph_composer
+from src.data_handlers import serializer
+
+# The values shown in the UI that can change whilst a trade is open, tracked to build delta updates.
+TRACKED_FIELDS = ("current_price", "profit_loss", "profit_loss_pct", "figure_pct", "sell_date", "sell_price")
+# The data arrays of a figure trace that can be extended.
+TRACE_DATA_KEYS = ("x", "y", "open", "high", "low", "close")
 
 
 class Trade:
-    def __init__(self, backtest_id, ticker, historical_data, buy_date, buy_price, share_qty, investment_total, take_profit, stop_loss, triggered_indicators, figure):
+    """ A fixed-schema record of a single trade. The heavyweight payloads (historical data and figures) are not held on
+        the record itself, they are kept in a payload store and loaded when accessed. """
+
+    __slots__ = ("trade_id", "backtest_id", "ticker", "buy_date", "buy_price", "sell_date", "sell_price",
+                 "profit_loss", "profit_loss_pct", "current_price", "share_qty", "investment_total", "take_profit",
+                 "stop_loss", "triggered_indicators", "figure_pct", "_payload_store", "_payload_key", "_sent_values",
+                 "_sent_bar_date", "_sent_traces")
+
+    # The names of the payloads held in the payload store.
+    payload_names = ("historical_data", "simpleFigure", "figure")
+    # The fields sent to the api, and how each one is converted.
+    json_schema = (
+        ("trade_id", None),
+        ("backtest_id", None),
+        ("ticker", None),
+        # Only send the price data, not the materialised indicator columns.
+        ("historical_data", lambda df: serializer.price_data(df[PRICE_COLUMNS])),
+        ("buy_date", serializer.date_string),
+        ("buy_price", None),
+        ("sell_date", serializer.date_string),
+        ("sell_price", None),
+        ("profit_loss", None),
+        ("profit_loss_pct", None),
+        ("current_price", None),
+        ("share_qty", None),
+        ("investment_total", None),
+        ("take_profit", None),
+        ("stop_loss", None),
+        ("triggered_indicators", list),
+        ("simpleFigure", None),
+        ("figure", serializer.figure_json),
+        ("figure_pct", None)
+    )
+
+    def __init__(self, backtest_id, ticker, historical_data, buy_date, buy_price, share_qty, investment_total, take_profit, stop_loss, triggered_indicators, figure, payload_store=None):
+        self._payload_store = payload_store if payload_store is not None else TradePayloadStore()
+        self._payload_key = self._payload_store.new_key()
         self.trade_id = None
         self.backtest_id = backtest_id,
         self.ticker = ticker
@@ -19,16 +63,155 @@ class Trade:
         self.take_profit = take_profit
         self.stop_loss = stop_loss
         self.triggered_indicators = triggered_indicators
-        self.simpleFigure = {"graph": "placeholder"}
         self.figure = figure
         self.figure_pct = 0
+        # The state of the trade when it was last sent to the api, used to build delta updates.
+        self._sent_values = None
+        self._sent_bar_date = None
+        self._sent_traces = None
+
+    @property
+    def historical_data(self):
+        return self._payload_store.get(self._payload_key, "historical_data")
+
+    @historical_data.setter
+    def historical_data(self, value):
+        self._payload_store.put(self._payload_key, "historical_data", value)
+
+    @property
+    def simpleFigure(self):
+        simple_figure = self._payload_store.get(self._payload_key, "simpleFigure")
+        if simple_figure is None and self.sell_date is None:
+            # The open trade graph only shows figure_pct, so it is drawn when it is sent rather than being held.
+            return graph_composer.render_open_trade_graph(self.figure_pct)
+        return simple_figure
+
+    @simpleFigure.setter
+    def simpleFigure(self, value):
+        self._payload_store.put(self._payload_key, "simpleFigure", value)
+
+    @property
+    def figure(self):
+        return self._payload_store.get(self._payload_key, "figure")
+
+    @figure.setter
+    def figure(self, value):
+        self._payload_store.put(self._payload_key, "figure", value)
+
+    @property
+    def payload_key(self):
+        """ The key the trade's payloads are saved under in the payload store. """
+        return self._payload_key
+
+    def record(self):
+        """ Gets the fields of the trade record, without its payloads, so that it can be saved in a checkpoint.
+
+        :return: A dict holding the value of each field.
+        """
+        return {name: getattr(self, name) for name in self.__slots__ if name != "_payload_store"}
+
+    @classmethod
+    def from_record(cls, record, payload_store):
+        """ Recreates a trade from the fields saved by record. Its payloads must be put back in the payload store under
+            its payload key.
+
+        :param record: A dict holding the value of each field.
+        :param payload_store: The TradePayloadStore holding the trade's payloads.
+        :return: The Trade object.
+        """
+        trade = cls.__new__(cls)
+        for name, value in record.items():
+            setattr(trade, name, value)
+        trade._payload_store = payload_store
+        return trade
+
+    def release_payloads(self, keep=()):
+        """ Removes the trade's payloads from the payload store, once they are no longer needed.
+
+        :param keep: The names of payloads to be left in the store, e.g. the figure when it can still be requested.
+        :return: none
+        """
+        self._payload_store.delete(self._payload_key, [name for name in self.payload_names if name not in keep])
+
+    def mark_sent(self, include_figure=True):
+        """ Records the current state of the trade as the state known by the api, so that later updates only need to
+            carry what has changed since.
+
+        :param include_figure: Whether the figure is sent to the api, and so needs to be tracked.
+        :return: none
+        """
+        self._sent_values = {field: getattr(self, field) for field in TRACKED_FIELDS}
+        self._sent_bar_date = self.historical_data.index[-1]
+        if not include_figure:
+            self._sent_traces = None
+            return
+        # Only the length and last value of each trace array are kept, to tell whether it has since been extended.
+        self._sent_traces = [{key: (len(trace[key]), trace[key][-1]) for key in TRACE_DATA_KEYS
+                              if key in trace and trace[key] is not None and len(trace[key])}
+                             for trace in self.figure.traces.values()]
+
+    def build_patch(self, include_figure=True):
+        """ Builds a delta update holding only what has changed since the trade was last sent to the api: the changed
+            values, the new bar of the open trade graph, the new days of historical data, the points appended to each
+            figure trace and the axis ranges. Traces that have been changed rather than extended are sent in full.
+
+        :param include_figure: Whether to include the changes to the figure, which are left out when figures are
+            only rendered on request.
+        :return: A dict holding the patch, ready to be encoded by serializer.dumps. The arrays of values are left as
+            they are to be encoded with the rest of the update, the trace arrays are only ever appended to or replaced
+            so the views of them held by the patch do not change before it is sent.
+        """
+        patch = {"trade_id": self.trade_id}
+        historical_data = self.historical_data
+
+        # Changed values.
+        changes = {}
+        for field in TRACKED_FIELDS:
+            value = getattr(self, field)
+            if value != self._sent_values[field]:
+                changes[field] = str(value) if field == "sell_date" else value
+        patch['changes'] = changes
+        # The open trade graph only changes with the price, so send the new bar rather than the whole figure.
+        if "figure_pct" in changes:
+            patch['simple_figure'] = graph_composer.open_trade_graph_patch(self.figure_pct)
+
+        # New days of historical data.
+        new_bars = historical_data.loc[historical_data.index > self._sent_bar_date, PRICE_COLUMNS]
+        patch['new_bars'] = {"date": list(new_bars.index.strftime('%Y-%m-%d %H:%M:%S')),
+                             **{column: new_bars[column].to_numpy() for column in PRICE_COLUMNS}}
+
+        if not include_figure:
+            return patch
+
+        # New points in the figure traces.
+        figure = self.figure
+        trace_patches = []
+        for i, trace in enumerate(figure.traces.values()):
+            sent = self._sent_traces[i] if i < len(self._sent_traces) else {}
+            trace_patch = {}
+            for key in TRACE_DATA_KEYS:
+                values = trace[key] if key in trace else None
+                if values is None or not len(values):
+                    continue
+                sent_len, sent_last = sent.get(key, (0, None))
+                if sent_len and len(values) >= sent_len and values[sent_len - 1] == sent_last:
+                    if len(values) > sent_len:
+                        trace_patch.setdefault("extend", {})[key] = values[sent_len:]
+                else:
+                    trace_patch.setdefault("replace", {})[key] = values
+            if trace_patch:
+                trace_patch['trace'] = i
+                trace_patches.append(trace_patch)
+        patch['figure_traces'] = trace_patches
+        patch['figure_layout'] = {"xaxis.range": figure.layout.get('xaxis', {}).get('range') or [],
+                                  "yaxis.range": figure.layout.get('yaxis', {}).get('range') or []}
+        return patch
+
+    def to_JSON_serializable(self, include_figure=True):
+        """ Gets the fields of the trade that are sent to the api, ready to be encoded by serializer.dumps.
 
-    def to_JSON_serializable(self):
-        trade_dict = copy.deepcopy(self.__dict__)
-        trade_dict['buy_date'] = str(trade_dict["buy_date"])
-        trade_dict['sell_date'] = str(trade_dict["sell_date"])
-        trade_dict['historical_data'].index = trade_dict['historical_data'].index.strftime('%Y-%m-%d %H:%M:%S').copy()
-        trade_dict['historical_data'].reset_index(level="date", inplace=True)
-        trade_dict['historical_data'] = trade_dict['historical_data'].to_dict(orient="list")
-        trade_dict['figure'] = trade_dict['figure'].to_json()
-        return trade_dict
+        :param include_figure: Whether to render the figure, which is sent as None when figures are only rendered on
+            request.
+        :return: A dict holding the fields in the json_schema.
+        """
+        return serializer.to_serializable(self, omit=() if include_figure else ("figure",))
@@ -1,18 +1,17 @@
-from src.data_handlers.historical_data_handler import HistoricalDataHandler
 from src.data_validators import date_validator
 from src.trades import graph_composer
 from src.exceptions.custom_exceptions import TradeCreationError, TradeAnalysisError, InvalidHistoricalDataIndexError
-from src.data_handlers import request_handler
 from src.trades.trade import Trade
+from src.trades.figure_model import MARKERS_ROLE, TAKE_PROFIT_ROLE, STOP_LOSS_ROLE
+from src.trades.position_book import first_exit_index
 from src.strategy import strategy
 
 import datetime as dt
+import heapq
+import itertools
 import math
 import logging
-import random
 import time
-import threading
-import plotly.graph_objects as go
 import numpy as np
 
 logger = logging.getLogger("trade_handler")
@@ -23,11 +22,26 @@ class TradeHandler:
 
     def __init__(self, backtest, tickers):
         self.backtest = backtest
-        self.hist_data_handler = HistoricalDataHandler(start_date=backtest.start_date)
+        self.hist_data_handler = backtest.market_data
         self.tickers = tickers
-        self.open_trades = []
+        # The numbers of all open trades, held in arrays in the backtest's ledger to be processed together.
+        self.position_book = backtest.ledger.open_positions
+        # Priority queue of (exit date, sequence number, trade, exit price) events, used when open trades are not
+        # processed every day.
+        self.exit_queue = []
+        self._exit_sequence = itertools.count()
+        # The number of tickers screened out and analysed in full on the most recent day.
+        self.screening_stats = (0, 0)
+        # The trades whose POST request has been queued, with the future of its response holding the trade's id.
+        self._pending_trade_ids = []
         # The dynamically created strategy that will be used within the backtest.
         self.strategy = strategy.create_strategy(backtest)
+        self.strategy.materialise_indicators(tickers)
+
+    @property
+    def open_trades(self):
+        """ The Trade objects of all open trades. """
+        return self.position_book.trades
 
     def analyse_historical_data(self):
         """ Goes through the list of tickers and performs technical analysis on each one, as defined in the trading
@@ -36,22 +50,14 @@ class TradeHandler:
         :return: A dataframe containing all information on the stock that has the most confidence from the analysis.
         """
 
-        potential_trades = []
-        download_threads = []
         start_time = time.time()
-        logger.debug(f"Executing strategy on {len(self.tickers)} tickers")
 
-        # Create a number of threads to download data concurrently, to speed up the process.
-        for thread_id in range(0, self.max_strategy_threads):
-            download_thread = threading.Thread(target=self.strategy.execute,
-                                               args=(self.tickers, potential_trades,
-                                                     self.max_strategy_threads, thread_id))
-            download_threads.append(download_thread)
-            download_thread.start()
+        # Cheaply rule out the tickers that cannot trigger today before running the full analysis.
+        tickers = self.strategy.screen_tickers(self.tickers)
+        self.screening_stats = (len(self.tickers) - len(tickers), len(tickers))
+        logger.debug(f"Screened out {self.screening_stats[0]} tickers, executing strategy on {len(tickers)} tickers")
 
-        # Wait for all threads to finish downloading data before continuing.
-        for download_thread in download_threads:
-            download_thread.join()
+        potential_trades = self.strategy.find_potential_trades(tickers, self.max_strategy_threads)
 
         total_time = dt.timedelta(seconds=(time.time() - start_time))
         logger.debug(f"Strategy executed in {total_time}")
@@ -60,7 +66,9 @@ class TradeHandler:
             # No interesting stocks could be found for this date.
             raise TradeAnalysisError(self.backtest.backtest_date)
 
-        choice = random.choice(potential_trades)
+        # Sorted so that a seed picks the same trade whatever order the strategy's threads found them in.
+        potential_trades = sorted(potential_trades, key=lambda potential_trade: potential_trade[0].attrs['ticker'])
+        choice = self.backtest.rng.choice(potential_trades)
         return choice
 
     def calculate_num_shares_to_buy(self, interesting_df):
@@ -114,33 +122,28 @@ class TradeHandler:
         tp, sl = self.calculate_tp_sl(qty, investment_total)
 
         # Update yaxis range if tp/sl limits are higher or lower than the current.
-        yaxis_range = analysis_fig.layout.yaxis['range']
+        yaxis_range = analysis_fig.layout['yaxis']['range']
         if tp >= yaxis_range[1]:
-            analysis_fig.layout.yaxis['range'] = (yaxis_range[0], tp + (yaxis_range[1] - yaxis_range[0]) * 0.04)
+            analysis_fig.update_layout(
+                yaxis=dict(range=[yaxis_range[0], tp + (yaxis_range[1] - yaxis_range[0]) * 0.04]))
         if sl <= yaxis_range[0]:
-            analysis_fig.layout.yaxis['range'] = (sl - (yaxis_range[1] - yaxis_range[0]) * 0.04, yaxis_range[1])
+            analysis_fig.update_layout(
+                yaxis=dict(range=[sl - (yaxis_range[1] - yaxis_range[0]) * 0.04, yaxis_range[1]]))
 
         # Add the stop loss/take profit lines and the buy marker to the figure.
-        analysis_fig.add_traces([go.Scatter(x=[interesting_df.index[-1]], y=[buy_price], showlegend=False,
-                                            hoverinfo="skip", mode="markers", name="buysell",
-                                            marker=dict(color=["lawngreen", "orangered"],
-                                                        symbol=["triangle-up", "triangle-down"], size=10,
-                                                        line=dict(color=["darkgreen", "darkred"], width=1.5))),
-                                 go.Scatter(
-                                     x=[interesting_df.index[-2],
-                                        date_validator.validate_date(interesting_df.index[-2] + np.timedelta64(7, 'D'),
-                                                                     -1)],
-                                     y=[tp, tp], showlegend=True,
-                                     hoverinfo="skip", mode="lines", name="TP/SL", legendgroup="tp/sl",
-                                     line=dict(color="rgba(0, 100, 0, 0.5)", dash="dot", width=1.3)),
-                                 go.Scatter(
-                                     x=[interesting_df.index[-2],
-                                        date_validator.validate_date(interesting_df.index[-2] + np.timedelta64(7, 'D'),
-                                                                     -1)],
-                                     y=[sl, sl], showlegend=False,
-                                     hoverinfo="skip", mode="lines", name="TP/SL", legendgroup="tp/sl",
-                                     line=dict(color="rgba(1000, 0, 0, 0.5)", dash="dot", width=1.3)),
-                                 ])
+        tp_sl_x = [interesting_df.index[-2],
+                   date_validator.validate_date(interesting_df.index[-2] + np.timedelta64(7, 'D'), -1)]
+        analysis_fig.add_trace(MARKERS_ROLE, "scatter", dict(x=[interesting_df.index[-1]], y=[buy_price]),
+                               showlegend=False, hoverinfo="skip", mode="markers", name="buysell",
+                               marker=dict(color=["lawngreen", "orangered"],
+                                           symbol=["triangle-up", "triangle-down"], size=10,
+                                           line=dict(color=["darkgreen", "darkred"], width=1.5)))
+        analysis_fig.add_trace(TAKE_PROFIT_ROLE, "scatter", dict(x=tp_sl_x, y=[tp, tp]), showlegend=True,
+                               hoverinfo="skip", mode="lines", name="TP/SL", legendgroup="tp/sl",
+                               line=dict(color="rgba(0, 100, 0, 0.5)", dash="dot", width=1.3))
+        analysis_fig.add_trace(STOP_LOSS_ROLE, "scatter", dict(x=tp_sl_x, y=[sl, sl]), showlegend=False,
+                               hoverinfo="skip", mode="lines", name="TP/SL", legendgroup="tp/sl",
+                               line=dict(color="rgba(1000, 0, 0, 0.5)", dash="dot", width=1.3))
 
         trade = Trade(backtest_id=self.backtest.backtest_id,
                       ticker=interesting_df.attrs['ticker'],
@@ -152,9 +155,10 @@ class TradeHandler:
                       take_profit=tp,
                       stop_loss=sl,
                       triggered_indicators=interesting_df.attrs['triggered_indicators'],
-                      figure=analysis_fig)
-        # Draws the open trade graph using the new trade object.
-        trade.simpleFigure, trade.figure_pct = graph_composer.draw_open_trade_graph(trade)
+                      figure=analysis_fig,
+                      payload_store=self.backtest.ledger.payload_store)
+        # Works out the value shown in the open trade graph, which is drawn from it when the trade is sent.
+        trade.figure_pct = graph_composer.open_trade_graph_pct(trade)
         return trade
 
     def make_trade(self, trade):
@@ -166,15 +170,29 @@ class TradeHandler:
         """
         logger.info(f"Buying {trade.share_qty} shares of {trade.ticker} for "
                     f"{'£{:,.2f}'.format(trade.investment_total)} based off {', '.join(trade.triggered_indicators)}")
-        self.backtest.available_balance -= trade.investment_total
         # Convert the object to allow it to be serialized correctly for storage within the MySQL database.
-        json_trade = trade.to_JSON_serializable()
-        # POST requests to /trades return the unique trade_id generated by the database assign it to the trade
-        # object for easy future reference.
-        response = request_handler.post(f"/trades/{self.backtest.backtest_id}", json_trade)
-        trade.trade_id = response.json().get("trade_id")
-        request_handler.put(f"/backtests/{self.backtest.backtest_id}", self.backtest.to_JSON_serializable())
-        self.open_trades.append(trade)
+        json_trade = trade.to_JSON_serializable(include_figure=not self.backtest.deferred_figures)
+        # POST requests to /trades return the unique trade_id generated by the database, which is assigned to the
+        # trade object by resolve_trade_ids before the trade is next sent.
+        future = self.backtest.publisher.submit("POST", f"/trades/{self.backtest.backtest_id}",
+                                                self.backtest.publisher.encode(json_trade))
+        self._pending_trade_ids.append((trade, future))
+        if self.backtest.delta_updates:
+            trade.mark_sent(include_figure=not self.backtest.deferred_figures)
+        self.backtest.ledger.open_position(trade)
+        self.publish_backtest()
+        if self.backtest.fast_mode:
+            self.schedule_exit(trade)
+
+    def resolve_trade_ids(self):
+        """ Assigns the ids generated by the database to the trades opened since they were last resolved, waiting for
+            the responses to their POST requests if they have not yet arrived.
+
+        :return: none
+        """
+        for trade, future in self._pending_trade_ids:
+            trade.trade_id = future.result().json().get("trade_id")
+        self._pending_trade_ids = []
 
     def close_trade(self, trade):
         """ Performs all calculations that will affect the backtest properties when the trade has sold.
@@ -186,61 +204,222 @@ class TradeHandler:
                     f"of {round(trade.profit_loss, 2)}, which was triggered by {', '.join(trade.triggered_indicators)}")
         trade.sell_price = trade.current_price
         trade.sell_date = self.backtest.backtest_date
-        self.backtest.available_balance += trade.sell_price * trade.share_qty
-        trade.profit_loss = (trade.current_price * trade.share_qty) - trade.investment_total
-        trade.profit_loss_pct = (trade.profit_loss / trade.investment_total) * 100
-        self.backtest.total_balance += trade.profit_loss
-        self.backtest.total_profit_loss = self.backtest.total_balance - self.backtest.start_balance
-        self.backtest.total_profit_loss_pct = self.backtest.total_profit_loss / self.backtest.start_balance * 100
+        self.backtest.ledger.close_position(trade)
         trade.simpleFigure = graph_composer.draw_closed_trade_graph(trade)
         # Add the close trade marker to the figure.
-        for i, trace in enumerate(trade.figure.data):
-            if trace['name'] == "buysell":
-                trace['x'] = np.append(trace['x'], trade.sell_date)
-                trace['y'] = np.append(trace['y'], trade.sell_price)
+        fig = trade.figure
+        fig[MARKERS_ROLE].append(x=trade.sell_date, y=trade.sell_price)
+        trade.figure = fig
+
+    def release_payloads(self, trade):
+        """ Releases the payloads of a closed trade. When figures are rendered on request, the figure is kept so that it
+            can still be viewed in the UI.
+
+        :param trade: The closed Trade object, which has been sent to the api.
+        :return: none
+        """
+        if self.backtest.deferred_figures:
+            trade.release_payloads(keep=("figure",))
+            self.backtest.ledger.keep_figure(trade)
+        else:
+            trade.release_payloads()
+
+    def checkpoint_state(self):
+        """ Gets the state of the trade handler to be saved in a checkpoint, once the ids of its trades are known.
+
+        :return: A dict holding the exit queue, with trades referred to by their payload keys.
+        """
+        self.resolve_trade_ids()
+        return {"exit_queue": [(exit_date, sequence, trade.payload_key, exit_price)
+                               for exit_date, sequence, trade, exit_price in self.exit_queue]}
+
+    def restore_state(self, state, trades):
+        """ Restores the state of the trade handler of a backtest resumed from a checkpoint.
+
+        :param state: The dict returned by checkpoint_state.
+        :param trades: A dict holding the restored open Trade objects, keyed by their payload keys.
+        :return: none
+        """
+        # The queue was saved in heap order, so it is still a valid heap.
+        self.exit_queue = [(exit_date, sequence, trades[key], exit_price)
+                           for exit_date, sequence, key, exit_price in state["exit_queue"]]
+        self._exit_sequence = itertools.count(max((event[1] for event in self.exit_queue), default=-1) + 1)
+
+    def compute_exit(self, trade):
+        """ Works out when an open trade will be sold, by searching the ticker's future close prices for the first one
+            that exceeds the trade's take profit/stop loss thresholds.
+
+        :param trade: A Trade object holding all information on the open trade.
+        :return: The exit date and the price the trade will be sold for, or (None, None) if it is never sold.
+        """
+        dates, closes = self.hist_data_handler.get_future_closes(trade.ticker, trade.buy_date)
+        i = first_exit_index(closes, trade.take_profit, trade.stop_loss)
+        if i is None:
+            return None, None
+        return dates[i].astype(dt.datetime), closes[i]
+
+    def schedule_exit(self, trade):
+        """ Computes the exit date of a newly opened trade and adds it to the exit queue.
+
+        :param trade: A Trade object holding all information on the open trade.
+        :return: none
+        """
+        exit_date, exit_price = self.compute_exit(trade)
+        if exit_date is not None:
+            heapq.heappush(self.exit_queue, (exit_date, next(self._exit_sequence), trade, exit_price))
+
+    def process_scheduled_exits(self):
+        """ Closes the open trades that are scheduled to be sold on or before the current backtest date, in place of
+            analysing every open trade each day.
+
+        :return: none
+        """
+        json_closed_trades_array = []
+        include_figure = not self.backtest.deferred_figures
+        self.resolve_trade_ids()
+        while self.exit_queue and self.exit_queue[0][0] <= self.backtest.backtest_date:
+            exit_date, _, trade, exit_price = heapq.heappop(self.exit_queue)
+
+            # Update the trade's numbers to the exit price, closing it takes it out of the position book.
+            i = self.open_trades.index(trade)
+            self.position_book.set_price(i, exit_price)
+            self.position_book.sync_trade(i)
+
+            # The trade has not been updated since it was opened, so catch it up to the exit date before closing it.
+            # Its payloads are used many times while doing so, so they are held in memory rather than read from disk.
+            with self.backtest.ledger.payload_store.hold(trade.payload_key):
+                self.catch_up_trade(trade)
+                self.close_trade(trade)
+                json_closed_trades_array.append(trade.to_JSON_serializable(include_figure=include_figure))
+                self.release_payloads(trade)
+
+        # Add the day's balance to the profit/loss graph, every day as when the open trades are analysed.
+        self.backtest.record_balance()
+        if json_closed_trades_array:
+            self.publish_trades([], json_closed_trades_array)
+        self.publish_backtest()
+
+    def catch_up_trade(self, trade):
+        """ Adds the days since an open trade was last updated to its historical data and figure, one day at a time as
+            analyse_open_trades does, for trades that are only processed on their exit dates.
+
+        :param trade: A Trade object holding all information on the open trade.
+        :return: none
+        """
+        last_date = trade.historical_data.index[-1]
+        new_data = self.hist_data_handler.get_hist_dataframe(trade.ticker, self.backtest.backtest_date, num_weeks=0,
+                                                             num_days=(self.backtest.backtest_date - last_date).days,
+                                                             indicators=self.strategy.indicator_keys)
+        for day in range(len(new_data.index)):
+            trade.historical_data = trade.historical_data[1:].append(new_data[day:day + 1])
+            trade.figure = self.strategy.update_figure(trade)
+        trade.figure_pct = graph_composer.open_trade_graph_pct(trade)
 
     def analyse_open_trades(self):
-        """ Iterates through all trades in the open_trades array stored in the trade_handler's properties. Sells trades
-            who's prices have exceeded their take profit/stop loss limits and updates the price for trades that have
-            not yet hit them.
+        """ Refreshes the prices of all open trades and checks them against their take profit/stop loss limits in one
+            vectorised step, sells the trades that have exceeded them and updates the trades that have not yet hit them.
 
         :return: none
         """
+        self.resolve_trade_ids()
+        # Get the respective day's data for every open trade from the SQLite tables.
+        new_data = self.hist_data_handler.get_hist_dataframes(self.position_book.tickers, self.backtest.backtest_date,
+                                                              num_weeks=0, num_days=1,
+                                                              indicators=self.strategy.indicator_keys)
+
+        # Update the price and profit/loss of all open trades at once, and find the ones that need to be closed.
+        latest_prices = np.array([df['close'].iloc[-1] if len(df.index) else np.nan for df in new_data])
+        exits = self.position_book.update_prices(latest_prices)
 
         # All open and closed trades will be sent to the api for processing at once, so store their JSON serializable
         # objects in separate arrays.
         json_open_trades_array = []
         json_closed_trades_array = []
+        # The trades are processed last first, so that taking a closed trade out of the position book does not move the
+        # trades still to be processed.
         for i, trade in reversed(list(enumerate(self.open_trades))):
-            # Get the respective day's data for the targeted trade from the SQLite tables and append to historical
-            # data, trimming off the first column to keep the dataframe short.
-            new_data = self.hist_data_handler.get_hist_dataframe(trade.ticker, self.backtest.backtest_date, num_weeks=0,
-                                                                 num_days=1)
-            trade.historical_data = trade.historical_data[1:].append(new_data)
-            trade.current_price = trade.historical_data['close'].iloc[-1]
-            trade.profit_loss = (trade.current_price * trade.share_qty) - trade.investment_total
-            trade.profit_loss_pct = (trade.profit_loss / trade.investment_total) * 100
-            trade.simpleFigure, trade.figure_pct = graph_composer.draw_open_trade_graph(trade)
+            self.position_book.sync_trade(i)
+            # Append the new day's data to the trade's historical data, trimming off the first row to keep the
+            # dataframe short, and update the figures displayed in the UI. The value shown in the open trade graph is
+            # only updated on the days that are sent to the UI.
+            trade.historical_data = trade.historical_data[1:].append(new_data[i])
+            if self.backtest.ui_frame:
+                trade.figure_pct = graph_composer.open_trade_graph_pct(trade)
 
             # Get all analysis modules that triggered this trade to update their traces in the figure.
             trade.figure = self.strategy.update_figure(trade)
 
-            if trade.current_price > trade.take_profit or trade.current_price < trade.stop_loss:
-                # Close the trade
+            if exits[i]:
+                # Close the trade and add json object to closed trades array.
                 self.close_trade(trade)
-                del self.open_trades[i]
-                # Add json object to closed trades array.
-                json_trade = trade.to_JSON_serializable()
+                json_trade = trade.to_JSON_serializable(include_figure=not self.backtest.deferred_figures)
                 json_closed_trades_array.append(json_trade)
-            else:
-                # Add updated json object to open trades array.
-                json_trade = trade.to_JSON_serializable()
-                json_open_trades_array.append(json_trade)
+                self.release_payloads(trade)
+            elif self.backtest.ui_frame:
+                json_open_trades_array.append(self._open_trade_update(trade))
 
-        # Generate profit/loss graph.
-        self.backtest.total_profit_loss_graph = graph_composer.update_profit_loss_graph(self.backtest)
+        # Add the day's balance to the profit/loss graph.
+        self.backtest.record_balance()
         # Send open and closed trades to the database to be updated/removed in the database accordingly.
-        request_handler.put(f"/trades/{self.backtest.backtest_id}",
-                            {"open_trades": json_open_trades_array, "closed_trades": json_closed_trades_array})
-        # Update backtest properties.
-        request_handler.put(f"/backtests/{self.backtest.backtest_id}", self.backtest.to_JSON_serializable())
+        self.publish_trades(json_open_trades_array, json_closed_trades_array)
+        self.publish_backtest()
+
+    def publish_snapshot(self):
+        """ Sends the current state of the open trades and the backtest to the api, so that the UI shows the latest
+            state of the backtest when the most recent days were not sent to it.
+
+        :return: none
+        """
+        self.resolve_trade_ids()
+        json_open_trades_array = []
+        if not self.backtest.fast_mode:
+            for trade in self.open_trades:
+                trade.figure_pct = graph_composer.open_trade_graph_pct(trade)
+                json_open_trades_array.append(self._open_trade_update(trade))
+        self.publish_trades(json_open_trades_array, [])
+        self.publish_backtest()
+
+    def publish_trades(self, json_open_trades_array, json_closed_trades_array):
+        """ Sends the updates of open trades and the trades that have closed to the api. Closed trades are always sent,
+            and open trades are sent on the days that are sent to the UI.
+
+        :param json_open_trades_array: A list of the JSON serializable updates of open trades.
+        :param json_closed_trades_array: A list of the JSON serializable closed trades.
+        :return: none
+        """
+        if self.backtest.delta_updates:
+            if json_open_trades_array:
+                self.backtest.publisher.submit("PATCH", f"/trades/{self.backtest.backtest_id}",
+                                               self.backtest.publisher.encode({"open_trades": json_open_trades_array}))
+            if json_closed_trades_array:
+                self.backtest.publisher.submit("PUT", f"/trades/{self.backtest.backtest_id}",
+                                               self.backtest.publisher.encode({
+                                                   "open_trades": [], "closed_trades": json_closed_trades_array}))
+        elif json_open_trades_array or json_closed_trades_array or self.backtest.ui_frame:
+            self.backtest.publisher.submit("PUT", f"/trades/{self.backtest.backtest_id}",
+                                           self.backtest.publisher.encode({
+                                               "open_trades": json_open_trades_array,
+                                               "closed_trades": json_closed_trades_array}))
+
+    def publish_backtest(self):
+        """ Sends the backtest's properties to the api, on the days that are sent to the UI.
+
+        :return: none
+        """
+        if self.backtest.ui_frame:
+            self.backtest.publisher.submit("PUT", f"/backtests/{self.backtest.backtest_id}",
+                                           self.backtest.publisher.encode(self.backtest), coalesce=True)
+
+    def _open_trade_update(self, trade):
+        """ Gets the update of an open trade to be sent to the api.
+
+        :param trade: The open Trade object.
+        :return: A patch holding only what has changed since the trade was last sent if delta updates are enabled,
+            otherwise the JSON serializable trade.
+        """
+        include_figure = not self.backtest.deferred_figures
+        if self.backtest.delta_updates:
+            patch = trade.build_patch(include_figure=include_figure)
+            trade.mark_sent(include_figure=include_figure)
+            return patch
+        return trade.to_JSON_serializable(include_figure=include_figure)
@@ -0,0 +1,74 @@
+""" Runs a parameter sweep of headless backtests across a pool of processes, using the settings and strategy files read
+    by headless.py and a JSON file specifying the parameters to sweep (see src/backtest/sweep.py for its format). The
+    results of each run are written to their own directory in the output directory, along with summary.csv holding the
+    runs ranked by their return and drawdown.
+
+    py sweep.py settings.json strategy.json sweep.json --output results/sweep_1
+
+    With --queue, the runs are instead enqueued as jobs in an SQLite job queue, to be run by workers on any machine that
+    can reach the file (started with 'py main.py worker jobs.db'), and the summary is written once they have finished.
+    The results of each run are written by the worker that ran it, to its own output directory.
+
+    py sweep.py settings.json strategy.json sweep.json --queue jobs.db --output results/sweep_1
+
+    With --cache, runs with a seed in their settings that have been run before on the same data are copied from the
+    result cache directory rather than being run again.
+"""
+from src.data_handlers.historical_data_handler import HistoricalDataHandler
+from src.backtest import sweep
+from src.backtest.result_cache import ResultCache
+from src.jobs import coordinator
+from src.jobs.broker import SQLiteBroker
+from headless import load_settings
+import config
+import argparse
+import datetime as dt
+import json
+import logging as log
+import os
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of backtests without the data access API.")
+    parser.add_argument("settings", help="JSON file holding the backtest settings.")
+    parser.add_argument("strategy", help="JSON file holding the strategy configuration.")
+    parser.add_argument("spec", help="JSON file specifying the parameters to sweep.")
+    parser.add_argument("--output", default="results", help="Directory to write the results to.")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes (default: cores).")
+    parser.add_argument("--download", action="store_true", help="Download/update the historical data first.")
+    parser.add_argument("--queue", default=None, help="SQLite job queue file to enqueue the runs in for workers.")
+    parser.add_argument("--cache", default=None, help="Directory of the result cache to reuse earlier results from.")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level of the backtests.")
+    return parser.parse_args()
+
+
+# Main code
+if __name__ == '__main__':
+    args = parse_args()
+    config.logging_config()
+    log.getLogger("trade_handler").setLevel(args.log_level)
+
+    settings = load_settings(args.settings, args.strategy)
+    with open(args.spec) as f:
+        spec = json.load(f)
+    # The tickers can be listed in the settings, otherwise every ticker in the market index is used.
+    hist_data_mgr = HistoricalDataHandler(start_date=dt.datetime(2009, 1, 1), market_index=settings['marketIndex'],
+                                          max_threads=7)
+    tickers = settings.get('tickers') or hist_data_mgr.get_tickers()
+    if args.download:
+        hist_data_mgr.multithreaded_data_download(tickers)
+
+    if args.queue:
+        broker = SQLiteBroker(args.queue)
+        job_ids = coordinator.enqueue_sweep(broker, settings, spec, tickers)
+        log.info(f"Enqueued jobs {job_ids[0]} to {job_ids[-1]} in '{args.queue}', waiting for workers to run them")
+        summary = coordinator.sweep_summary(coordinator.wait_for_jobs(broker, job_ids))
+        os.makedirs(args.output, exist_ok=True)
+        summary.to_csv(os.path.join(args.output, "summary.csv"), index=False)
+    else:
+        cache = ResultCache(args.cache, hist_data_mgr) if args.cache else None
+        if cache is not None:
+            cache.evict_stale()
+        summary = sweep.run_sweep(settings, tickers, spec, args.output, processes=args.processes,
+                                  log_level=args.log_level, cache=cache)
+    log.info(f"Results written to '{args.output}', best runs:\n{summary.head(10).to_string(index=False)}")
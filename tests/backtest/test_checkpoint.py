@@ -0,0 +1,146 @@
+import pytest
+import os
+import random
+import datetime as dt
+import numpy as np
+import pandas as pd
+from src.backtest.checkpoint import Checkpointer, has_checkpoint
+from src.data_handlers.result_sink import ResultSink
+from src.trades.figure_model import FigureModel
+from src.trades.growable_array import GrowableArray
+from src.trades.ledger import PortfolioLedger
+from src.trades.trade import Trade
+
+
+class FakeTradeHandler:
+    """ Stands in for the trade handler, holding an exit queue of (date, sequence, payload key, price) events. """
+
+    def __init__(self):
+        self.exit_queue = []
+
+    def checkpoint_state(self):
+        return {"exit_queue": list(self.exit_queue)}
+
+    def restore_state(self, state, trades):
+        self.exit_queue = [(date, sequence, trades[key].payload_key, price)
+                           for date, sequence, key, price in state["exit_queue"]]
+
+
+class FakeBacktest:
+    """ Stands in for a headless backtest, holding the parts of it that are checkpointed. """
+
+    def __init__(self, directory, fast_mode=False, seed=None):
+        self.backtest_date = dt.datetime(2021, 1, 4)
+        self.rng = random.Random(seed)
+        self.ledger = PortfolioLedger(10000)
+        self.sink = ResultSink(str(directory / "results"))
+        self.fast_mode = fast_mode
+        self.equity_dates = GrowableArray("datetime64[s]")
+        self.equity_balances = GrowableArray(float)
+
+    @property
+    def total_balance(self):
+        return self.ledger.total_balance
+
+    @property
+    def available_balance(self):
+        return self.ledger.available_balance
+
+
+def run_day(backtest, open_ticker=None, close_ticker=None):
+    """ Moves the backtest on a day, opening and closing a trade. """
+    backtest.backtest_date += dt.timedelta(days=1)
+    ledger = backtest.ledger
+    if close_ticker is not None:
+        i = ledger.open_positions.tickers.index(close_ticker)
+        trade = ledger.open_positions.trades[i]
+        trade.sell_price, trade.sell_date = trade.buy_price * 1.1, backtest.backtest_date
+        ledger.close_position(trade)
+        trade.release_payloads()
+    if open_ticker is not None:
+        df = pd.DataFrame({"close": np.arange(20.)}, index=pd.bdate_range("2020-12-01", periods=20))
+        figure = FigureModel({"yaxis": {"range": [0, 20]}})
+        figure.add_trace("candles", "scatter", dict(x=df.index, y=df['close']))
+        trade = Trade(0, open_ticker, df, backtest.backtest_date, 19., 10, 190., 20., 18., ["sma"], figure,
+                      payload_store=ledger.payload_store)
+        ledger.open_position(trade)
+    backtest.equity_dates.append(backtest.backtest_date)
+    backtest.equity_balances.append(ledger.total_balance)
+    backtest.sink.record_day(backtest, (1, 2), 0.1)
+
+
+@pytest.mark.checkpoint
+def test_restored_backtest_matches_the_checkpoint(tmp_path):
+    backtest, handler = FakeBacktest(tmp_path, seed=1), FakeTradeHandler()
+    checkpointer = Checkpointer(str(tmp_path / "checkpoint"), every_days=2)
+    checkpointer.reset()
+    backtest.rng.random()
+    for open_ticker, close_ticker in (("A", None), ("B", None), (None, "A"), ("C", None)):
+        run_day(backtest, open_ticker, close_ticker)
+        checkpointer.day_finished(backtest, handler)
+    handler.exit_queue = [(dt.datetime(2021, 2, 1), 0, backtest.ledger.open_positions.trades[1].payload_key, 21.)]
+    checkpointer.checkpoint(backtest, handler)
+    checkpointer.close()
+    expected_draw = backtest.rng.random()
+
+    restored, restored_handler = FakeBacktest(tmp_path), FakeTradeHandler()
+    date = Checkpointer(str(tmp_path / "checkpoint")).restore(restored, restored_handler)
+    trades = restored.ledger.open_positions.trades
+
+    assert date == backtest.backtest_date == restored.backtest_date and restored.rng.random() == expected_draw \
+        and restored.ledger.total_balance == backtest.ledger.total_balance \
+        and restored.ledger.available_balance == backtest.ledger.available_balance \
+        and np.array_equal(restored.ledger.closed_positions, backtest.ledger.closed_positions) \
+        and [trade.ticker for trade in trades] == ["B", "C"] \
+        and np.array_equal(restored.ledger.open_positions.investment_total, [190., 190.]) \
+        and trades[0].historical_data.equals(backtest.ledger.open_positions.trades[0].historical_data) \
+        and np.array_equal(trades[1].figure["candles"]["y"], np.arange(20.)) \
+        and restored_handler.exit_queue[0][2] == trades[1].payload_key \
+        and np.array_equal(restored.equity_balances.values, backtest.equity_balances.values) \
+        and np.array_equal(restored.sink.days, backtest.sink.days) \
+        and restored.ledger.payload_store.next_key == backtest.ledger.payload_store.next_key
+
+
+@pytest.mark.checkpoint
+def test_checkpoints_only_write_what_has_changed(tmp_path):
+    backtest, handler = FakeBacktest(tmp_path, fast_mode=True), FakeTradeHandler()
+    directory = tmp_path / "checkpoint"
+    checkpointer = Checkpointer(str(directory), every_days=1)
+    checkpointer.reset()
+    run_day(backtest, "A")
+    checkpointer.day_finished(backtest, handler)
+    run_day(backtest, "B")
+    checkpointer.day_finished(backtest, handler)
+    run_day(backtest, None, "A")
+    checkpointer.day_finished(backtest, handler)
+    checkpointer.close()
+
+    payloads = sorted(os.listdir(directory / "payloads"))
+    with np.load(directory / "equity" / "part-00001.npz") as part:
+        second_part_rows = len(part['date'])
+
+    # A's payloads are removed once it has closed, and B's are only written on the day it was opened.
+    assert payloads == [f"{backtest.ledger.open_positions.trades[0].payload_key}-2.pkl"] \
+        and sorted(os.listdir(directory / "trades")) == ["part-00000.npz"] and second_part_rows == 1
+
+
+@pytest.mark.checkpoint
+def test_uncommitted_checkpoint_is_ignored(tmp_path):
+    backtest, handler = FakeBacktest(tmp_path), FakeTradeHandler()
+    directory = tmp_path / "checkpoint"
+    checkpointer = Checkpointer(str(directory), every_days=1)
+    assert not has_checkpoint(str(directory))
+    checkpointer.reset()
+    run_day(backtest, "A")
+    checkpointer.day_finished(backtest, handler)
+    checkpointer.close()
+    # A checkpoint that was interrupted before it was committed leaves its files behind.
+    np.savez(directory / "equity" / "part-00001.npz", date=np.array(["2021-02-01"], dtype="datetime64[s]"),
+             total_balance=np.array([1.]))
+    (directory / "payloads" / "99-2.pkl").write_bytes(b"partial")
+
+    restored = FakeBacktest(tmp_path)
+    Checkpointer(str(directory)).restore(restored, FakeTradeHandler())
+
+    assert has_checkpoint(str(directory)) and len(restored.equity_balances) == 1 \
+        and not (directory / "payloads" / "99-2.pkl").exists() and len(restored.ledger.open_positions) == 1
@@ -0,0 +1,161 @@
+import pytest
+import itertools
+import threading
+import time
+import types
+from src.backtest import backtest as backtest_module
+from src.backtest.control import BacktestControl, ACTIVE, STOPPING, INACTIVE
+
+
+def wait_for(condition, timeout=2):
+    """ Waits for a condition to become true, returning whether it did. """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+def in_thread(target):
+    """ Runs a function in a thread, returning the list its result is added to. """
+    result = []
+    threading.Thread(target=lambda: result.append(target()), daemon=True).start()
+    return result
+
+
+@pytest.mark.control
+def test_resuming_wakes_a_paused_backtest():
+    control = BacktestControl(paused=True)
+    woken = in_thread(control.wait_while_paused)
+    time.sleep(0.05)
+    asleep = not woken
+    resumed_at = time.monotonic()
+    control.set_paused(False)
+
+    assert asleep and wait_for(lambda: woken) and time.monotonic() - resumed_at < 0.05
+
+
+@pytest.mark.control
+@pytest.mark.parametrize("interrupt", ["stop", "pause"])
+def test_waits_between_days_are_cut_short(interrupt):
+    control = BacktestControl()
+    cut_short = in_thread(lambda: control.sleep(10))
+    time.sleep(0.05)
+    requested_at = time.monotonic()
+    control.stop() if interrupt == "stop" else control.set_paused(True)
+
+    assert wait_for(lambda: cut_short) and cut_short == [True] and time.monotonic() - requested_at < 0.05
+
+
+@pytest.mark.control
+def test_state_transitions():
+    control = BacktestControl()
+    states = [control.state]
+    control.stop()
+    states.append(control.state)
+    control.finish()
+    control.stop()
+    states.append(control.state)
+
+    assert states == [ACTIVE, STOPPING, INACTIVE] and control.wait_until_inactive(timeout=0) \
+        and not BacktestControl().wait_until_inactive(timeout=0.01)
+
+
+class FakeSocket:
+    """ Stands in for the socket.io client, holding the event handlers registered on it. """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event):
+        def register(handler):
+            self.handlers[event] = handler
+            return handler
+        return register
+
+
+class FakeBacktest:
+    """ Stands in for a backtest, running until it is stopped or reaches its end date. """
+    ids = itertools.count(1)
+
+    def __init__(self, settings, socket=None, market_data=None):
+        self.backtest_id = next(self.ids)
+        self.strategy_id = settings['strategyId']
+        self.market_data = market_data
+        self.control = BacktestControl()
+        self.end_date_reached = threading.Event()
+        self.ledger = types.SimpleNamespace(closed=False)
+        self.ledger.close = lambda: setattr(self.ledger, "closed", True)
+
+    def start_backtest(self, tickers):
+        while self.control.state == ACTIVE and not self.end_date_reached.is_set():
+            # As in the real loop, a paused backtest waits to be resumed rather than spinning on its sleep.
+            self.control.wait_while_paused()
+            self.control.sleep(0.05)
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    settings = {"startDate": "2021-01-04T00:00:00.000Z", "endDate": "2021-06-01T00:00:00.000Z", "strategyId": 1}
+    monkeypatch.setattr(backtest_module, "Backtest", FakeBacktest)
+    monkeypatch.setattr(backtest_module.request_handler, "get",
+                        lambda endpoint: types.SimpleNamespace(json=lambda: dict(settings)))
+    controller = backtest_module.BacktestController(FakeSocket(), [])
+    assert wait_for(lambda: controller.backtest is not None)
+    yield controller
+    controller.stop_backtest()
+
+
+@pytest.mark.control
+def test_restart_does_not_block_the_socket_thread(controller):
+    first = controller.backtest
+    started_at = time.monotonic()
+    controller.socket.handlers['restartBacktest']()
+    handler_seconds = time.monotonic() - started_at
+
+    # The old backtest is taken out of the controller as soon as it is asked to stop, before it has stopped running.
+    assert handler_seconds < 0.05 and wait_for(lambda: controller.backtest not in (None, first)) \
+        and wait_for(lambda: first.control.state == INACTIVE) and controller.backtest.control.state == ACTIVE
+
+
+@pytest.mark.control
+def test_stop_and_pause_from_socket_events(controller):
+    backtest = controller.backtest
+    controller.socket.handlers['playpause']({"isPaused": 1})
+    paused = backtest.control.paused
+    controller.socket.handlers['stopBacktest'](1, "Strategy deleted")
+
+    assert paused and wait_for(lambda: controller.backtest is None) \
+        and wait_for(lambda: backtest.control.state == INACTIVE)
+
+
+@pytest.mark.control
+def test_concurrent_backtests_are_routed_by_id(controller):
+    first = controller.backtest
+    controller.socket.handlers['startBacktest']({"strategyId": 2})
+    assert wait_for(lambda: len(controller.backtests) == 2)
+    second = controller.backtest
+    controller.socket.handlers['playpause']({"isPaused": 1, "backtestId": second.backtest_id})
+    paused = (first.control.paused, second.control.paused)
+    controller.socket.handlers['stopBacktest'](1, "Strategy deleted", second.backtest_id)
+    controller.socket.handlers['restartBacktest']({"backtestId": second.backtest_id})
+
+    assert paused == (False, True) and second.strategy_id == 2 and second.market_data is first.market_data \
+        and wait_for(lambda: len(controller.backtests) == 2 and second.control.state == INACTIVE) \
+        and first.control.state == ACTIVE and controller.backtest.strategy_id == 2
+
+
+@pytest.mark.control
+def test_finished_backtests_are_retired(controller):
+    first = controller.backtest
+    for strategy_id in range(2, backtest_module.MAX_FINISHED_BACKTESTS + 3):
+        controller.socket.handlers['startBacktest']({"strategyId": strategy_id})
+    assert wait_for(lambda: len(controller.backtests) == backtest_module.MAX_FINISHED_BACKTESTS + 2)
+    finished = [backtest for backtest in controller.backtests.values() if backtest is not first]
+    for backtest in finished:
+        backtest.end_date_reached.set()
+        assert wait_for(lambda: backtest.backtest_id in controller.finished_backtests)
+
+    assert list(controller.backtests.values()) == [first] and controller.backtest is first \
+        and list(controller.finished_backtests.values()) == finished[1:] \
+        and finished[0].ledger.closed and not any(backtest.ledger.closed for backtest in finished[1:]) \
+        and not first.ledger.closed
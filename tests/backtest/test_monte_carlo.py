@@ -0,0 +1,74 @@
+import pytest
+import datetime as dt
+import numpy as np
+import pandas as pd
+from src.backtest.monte_carlo import MonteCarloBacktest
+
+SETTINGS = {"startDate": dt.datetime(2021, 1, 4), "endDate": dt.datetime(2021, 2, 1), "startBalance": 10000,
+            "capPct": 0.25, "takeProfit": 1.02, "stopLoss": 0.99, "strategyId": 1}
+
+
+class FakeMarketData:
+    """ Stands in for the market data store, holding the close price of each ticker on the current day. """
+
+    def __init__(self):
+        self.closes = {}
+        self.requests = []
+
+    def get_hist_dataframes(self, tickers, backtest_date, num_weeks=12, num_days=0, indicators=None):
+        self.requests.append(list(tickers))
+        return [pd.DataFrame({"close": [self.closes[ticker]]}) for ticker in tickers]
+
+
+def potential_trade(ticker, close):
+    """ Creates a potential trade found by the strategy, as a (dataframe, figure) tuple. """
+    df = pd.DataFrame({"close": [close - 1, close]})
+    df.attrs['ticker'] = ticker
+    return df, None
+
+
+@pytest.fixture
+def simulations():
+    return MonteCarloBacktest(SETTINGS, 200, seed=1, market_data=FakeMarketData())
+
+
+@pytest.mark.monte_carlo
+def test_each_simulation_buys_one_of_the_trades(simulations):
+    simulations.open_positions([potential_trade("B", 40.), potential_trade("A", 100.), potential_trade("C", 5000.)])
+    book = simulations.positions
+    bought = dict(zip(book.simulation, book.current_price))
+    spent = simulations.start_balance - simulations.available_balance
+
+    # A simulation that chose C cannot afford a single share within its 25% cap, so it buys nothing that day.
+    assert set(bought.values()) == {40., 100.} and 0 < len(bought) < 200 \
+        and all(spent[i] == (2500 // price) * price for i, price in bought.items()) \
+        and np.allclose(book.take_profit, book.current_price * 1.02) \
+        and (spent[[i for i in range(200) if i not in bought]] == 0).all()
+
+
+@pytest.mark.monte_carlo
+def test_positions_are_sold_once_their_thresholds_are_crossed(simulations):
+    simulations.open_positions([potential_trade("A", 100.)])
+    simulations.open_positions([potential_trade("B", 50.)])
+    simulations.market_data.closes = {"A": 103., "B": 49.}
+    simulations.close_positions()
+    results = simulations.results()
+
+    # Every simulation sells both positions on the same day, A at a profit of 3% and B at a loss of 2%.
+    expected = 10000 + 25 * 3 - 50 * 1
+    assert simulations.market_data.requests == [["A", "B"]] and len(simulations.positions) == 0 \
+        and np.allclose(simulations.total_balance, expected) \
+        and np.allclose(simulations.available_balance, simulations.total_balance) \
+        and (results['num_trades'] == 2).all() and (results['win_rate_pct'] == 50).all()
+
+
+@pytest.mark.monte_carlo
+def test_seed_repeats_the_simulations():
+    def run(seed, trades):
+        simulations = MonteCarloBacktest(SETTINGS, 50, seed=seed, market_data=FakeMarketData())
+        simulations.open_positions(trades)
+        return simulations.positions.ticker[np.argsort(simulations.positions.simulation)]
+
+    trades = [potential_trade(ticker, 10.) for ticker in "ABCDE"]
+
+    assert np.array_equal(run(3, trades), run(3, trades[::-1])) and not np.array_equal(run(3, trades), run(4, trades))
@@ -0,0 +1,68 @@
+import pytest
+import types
+from src.backtest import pacing
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Replaces the time used by the pacing policies with a fake clock, which sleeping moves forward. """
+    clock = types.SimpleNamespace(now=100.0, slept=[])
+
+    def sleep(seconds):
+        clock.slept.append(round(seconds, 6))
+        clock.now += seconds
+
+    monkeypatch.setattr(pacing.time, "monotonic", lambda: clock.now)
+    monkeypatch.setattr(pacing.time, "sleep", sleep)
+    return clock
+
+
+def run_days(policy, clock, day_seconds):
+    """ Runs days taking the given numbers of seconds to process through a pacing policy. """
+    policy.reset()
+    for seconds in day_seconds:
+        start = clock.now
+        clock.now += seconds
+        policy.wait(start)
+
+
+@pytest.mark.pacing
+def test_real_time_days_take_at_least_the_set_time(clock):
+    run_days(pacing.RealTimePacing(1.5), clock, [0.5, 2.0, 1.0])
+
+    assert clock.slept == [1.0, 0.5]
+
+
+@pytest.mark.pacing
+def test_fixed_rate_makes_up_for_slow_days(clock):
+    run_days(pacing.FixedRatePacing(days_per_second=10), clock, [0.05, 0.15, 0.02, 0.02])
+
+    assert clock.slept == [0.05, 0.03, 0.08] and clock.now == pytest.approx(100.4)
+
+
+@pytest.mark.pacing
+def test_unthrottled_never_waits(clock):
+    run_days(pacing.create_pacing({"pacing": "unthrottled"}), clock, [0.01] * 5)
+
+    assert clock.slept == []
+
+
+@pytest.mark.pacing
+def test_pacing_is_created_from_settings():
+    assert isinstance(pacing.create_pacing({}), pacing.RealTimePacing) \
+        and pacing.create_pacing({"pacing": "fixedRate", "daysPerSecond": 4}).interval == 0.25 \
+        and isinstance(pacing.create_pacing({}, default=pacing.UNTHROTTLED), pacing.UnthrottledPacing)
+    with pytest.raises(ValueError):
+        pacing.create_pacing({"pacing": "warp"})
+
+
+@pytest.mark.pacing
+def test_ui_cadence_limits_frames(clock):
+    cadence = pacing.UICadence(frames_per_second=2)
+    frames = []
+    for _ in range(20):
+        frames.append(cadence.next_day())
+        clock.now += 0.125
+
+    assert frames == [True, False, False, False] * 5 \
+        and all(pacing.UICadence().next_day() for _ in range(3))
@@ -0,0 +1,78 @@
+import pytest
+import os
+import datetime as dt
+import numpy as np
+from src.backtest.result_cache import ResultCache, normalise_settings
+from src.backtest.sweep import summarise_results
+from src.data_handlers import serializer
+
+SETTINGS = {"startDate": dt.datetime(2021, 1, 4), "endDate": dt.datetime(2021, 6, 1), "startBalance": 10000,
+            "capPct": 0.25, "takeProfit": 1.02, "stopLoss": 0.98, "marketIndex": "S&P500", "strategyId": 1,
+            "seed": 1, "strategy": {"strategyName": "test", "technicalAnalysis": [
+                {"name": "Bollinger Bands", "config": {"dayPeriod": 20}}]}}
+
+
+class FakeDataHandler:
+    """ Stands in for the historical data handler, holding the version of each ticker's data. """
+
+    def __init__(self, versions):
+        self.versions = versions
+
+    def get_data_versions(self, tickers):
+        return {ticker: self.versions.get(ticker) for ticker in tickers}
+
+
+def write_results(directory, total_balance=11000.):
+    """ Writes the files of a finished headless backtest, as a ResultSink would. """
+    for table in ("trades", "equity", "days"):
+        os.makedirs(os.path.join(directory, table))
+    np.savez(os.path.join(directory, "equity", "part-00000.npz"),
+             total_balance=np.array([10000., 9000., total_balance]))
+    with open(os.path.join(directory, "summary.json"), "wb") as f:
+        f.write(serializer.dumps({"total_balance": total_balance, "num_trades": 4, "win_rate_pct": 50.}))
+
+
+@pytest.mark.result_cache
+def test_keys_ignore_settings_that_do_not_change_the_results(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), FakeDataHandler({"A": "v1", "B": "v1"}))
+    key = cache.key(SETTINGS, ["A", "B"])
+
+    assert key == cache.key({**SETTINGS, "backtestId": 7, "deltaUpdates": True, "checkpointDays": 5}, ["B", "A"]) \
+        and normalise_settings({**SETTINGS, "pacing": "unthrottled"}) == normalise_settings(SETTINGS) \
+        and key != cache.key({**SETTINGS, "seed": 2}, ["A", "B"]) \
+        and key != cache.key({**SETTINGS, "capPct": 0.1}, ["A", "B"]) \
+        and key != cache.key(SETTINGS, ["A"]) \
+        and cache.key({**SETTINGS, "seed": None}, ["A", "B"]) is None
+
+
+@pytest.mark.result_cache
+def test_cached_results_are_copied_to_the_output(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), FakeDataHandler({"A": "v1"}))
+    key = cache.key(SETTINGS, ["A"])
+    write_results(str(tmp_path / "run_1"))
+    os.makedirs(tmp_path / "run_1" / "checkpoint")
+
+    missed = cache.fetch(key, str(tmp_path / "run_2"))
+    cache.store(key, str(tmp_path / "run_1"))
+    hit = cache.fetch(cache.key(SETTINGS, ["A"]), str(tmp_path / "run_2"))
+
+    assert not missed and hit and not os.path.exists(tmp_path / "run_2" / "checkpoint") \
+        and summarise_results(str(tmp_path / "run_2"), 10000) == summarise_results(str(tmp_path / "run_1"), 10000) \
+        == {"total_balance": 11000., "return_pct": pytest.approx(10.), "max_drawdown_pct": pytest.approx(10.),
+            "num_trades": 4, "win_rate_pct": 50.}
+
+
+@pytest.mark.result_cache
+def test_entries_are_evicted_when_their_data_changes(tmp_path):
+    data_handler = FakeDataHandler({"A": "v1", "B": "v1"})
+    cache = ResultCache(str(tmp_path / "cache"), data_handler)
+    write_results(str(tmp_path / "run"))
+    key_a, key_b = cache.key(SETTINGS, ["A"]), cache.key(SETTINGS, ["B"])
+    cache.store(key_a, str(tmp_path / "run"))
+    cache.store(key_b, str(tmp_path / "run"))
+
+    data_handler.versions["B"] = "v2"
+    num_evicted = cache.evict_stale()
+
+    assert num_evicted == 1 and os.listdir(tmp_path / "cache") == [key_a] \
+        and cache.key(SETTINGS, ["B"]) != key_b
@@ -0,0 +1,46 @@
+import pytest
+import numpy as np
+from src.backtest import sweep
+
+SETTINGS = {"capPct": 0.25, "takeProfit": 1.02, "strategy": {"strategyName": "test", "technicalAnalysis": [
+    {"name": "Bollinger Bands", "config": {"dayPeriod": 20}}]}}
+
+
+@pytest.mark.sweep
+def test_grid_runs_every_combination():
+    sets = sweep.parameter_sets({"grid": {"capPct": [0.1, 0.25], "Bollinger Bands.dayPeriod": [10, 20, 30]}})
+
+    assert len(sets) == 6 and {(s["capPct"], s["Bollinger Bands.dayPeriod"]) for s in sets} \
+        == {(cap, period) for cap in (0.1, 0.25) for period in (10, 20, 30)}
+
+
+@pytest.mark.sweep
+def test_random_search_is_repeatable_and_in_range():
+    spec = {"random": {"takeProfit": {"min": 1.01, "max": 1.1}, "Bollinger Bands.dayPeriod": {"min": 10, "max": 12},
+                       "capPct": [0.1, 0.2]}, "samples": 50, "seed": 3}
+    sets = sweep.parameter_sets(spec)
+
+    assert sets == sweep.parameter_sets(spec) and len(sets) == 50 \
+        and all(1.01 <= s["takeProfit"] <= 1.1 and s["capPct"] in (0.1, 0.2) for s in sets) \
+        and {s["Bollinger Bands.dayPeriod"] for s in sets} == {10, 11, 12}
+
+
+@pytest.mark.sweep
+def test_parameters_are_applied_to_a_copy_of_the_settings():
+    settings = sweep.apply_parameters(SETTINGS, {"capPct": 0.1, "Bollinger Bands.dayPeriod": 10})
+
+    assert settings["capPct"] == 0.1 and settings["strategy"]["technicalAnalysis"][0]["config"]["dayPeriod"] == 10 \
+        and SETTINGS["capPct"] == 0.25 and SETTINGS["strategy"]["technicalAnalysis"][0]["config"]["dayPeriod"] == 20
+    with pytest.raises(ValueError):
+        sweep.apply_parameters(SETTINGS, {"Moving Averages.shortTermDayPeriod": 5})
+
+
+@pytest.mark.sweep
+def test_runs_are_ranked_by_return_then_drawdown():
+    rows = [{"run": 1, "return_pct": 2.0, "max_drawdown_pct": 3.0},
+            {"run": 2, "return_pct": 5.0, "max_drawdown_pct": 4.0},
+            {"run": 3, "return_pct": 2.0, "max_drawdown_pct": 1.0}]
+    summary = sweep.rank_runs(rows)
+
+    assert list(summary["run"]) == [2, 3, 1] and list(summary["rank"]) == [1, 2, 3] \
+        and sweep.max_drawdown_pct(np.array([100., 120., 90., 130., 117.])) == pytest.approx(25)
@@ -0,0 +1,111 @@
+""" A stand-in for the data access API that runs on a local port, for tests that send real HTTP requests. It records
+    the requests it receives, assigns ids to posted trades and, unless disabled, accepts batches of requests. """
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import itertools
+import json
+import threading
+
+
+class StandInAPI:
+
+    def __init__(self, batches=True):
+        """ Constructor that starts the server on a free local port.
+
+        :param batches: Whether the server accepts batches of requests at /batch.
+        """
+        self.batches = batches
+        # The (method, endpoint, body) of every request applied, including those sent within a batch.
+        self.requests = []
+        # The (method, endpoint) of every HTTP request received.
+        self.http_requests = []
+        self._trade_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def apply(self, method, endpoint, body):
+        """ Applies a request to the stand-in's state.
+
+        :param method: The HTTP method of the request.
+        :param endpoint: The endpoint the request was sent to.
+        :param body: The decoded body of the request.
+        :return: A tuple of the status code and the body of the response.
+        """
+        with self._lock:
+            self.requests.append((method, endpoint, body))
+            if method == "POST" and endpoint.startswith("/trades/"):
+                return 200, {"trade_id": next(self._trade_ids)}
+        return 200, {}
+
+
+def _handler(api):
+    """ Creates the request handler class of a stand-in API's server.
+
+    :param api: The StandInAPI object that the requests are applied to.
+    :return: A BaseHTTPRequestHandler subclass.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def log_message(self, *args):
+            pass
+
+        def _handle(self, method):
+            api.http_requests.append((method, self.path))
+            body = self._read_body()
+            if self.path == "/batch":
+                if not api.batches:
+                    self._respond(404, {"message": "Not found"})
+                elif method == "GET":
+                    self._respond(200, {"batches": True})
+                else:
+                    responses = [dict(zip(("status", "body"), api.apply(item["method"], item["endpoint"], item["body"])))
+                                 for item in body["requests"]]
+                    self._respond(200, {"responses": responses})
+            else:
+                self._respond(*api.apply(method, self.path, body))
+
+        def _read_body(self):
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+            if not data:
+                return None
+            if self.headers.get("Content-Type") == "application/json":
+                return json.loads(data)
+            return data.decode("utf-8")
+
+        def _respond(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
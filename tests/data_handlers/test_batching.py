@@ -0,0 +1,72 @@
+import pytest
+from src.data_handlers import request_handler, serializer
+from src.data_handlers.publisher import Publisher
+from tests.data_handlers.stand_in_api import StandInAPI
+
+
+@pytest.fixture(params=[True, False], ids=["batches", "no_batches"])
+def api(request, monkeypatch):
+    """ Points the request handler at a stand-in API, which accepts batches or not. """
+    api = StandInAPI(batches=request.param)
+    monkeypatch.setattr(request_handler, "URL", api.url)
+    monkeypatch.setattr(request_handler, "_batch_supported", None)
+    yield api
+    request_handler.close_session()
+    api.close()
+
+
+def send_day(publisher, day):
+    """ Submits the updates of a day like the backtest loop does, returning the future of the trade's POST request. """
+    publisher.begin_batch()
+    publisher.submit("PATCH", "/backtests/1/date", {"backtest_date": f"2021-01-0{day} 00:00:00"}, coalesce=True)
+    future = publisher.submit("POST", "/trades/1", serializer.dumps({"ticker": f"T{day}"}))
+    publisher.submit("PUT", "/backtests/1", serializer.dumps({"total_balance": day}), coalesce=True)
+    publisher.end_batch()
+    return future
+
+
+@pytest.mark.batching
+def test_batch_support_is_detected(api):
+    assert request_handler.check_batch_support() == api.batches and request_handler.batch_supported() == api.batches
+
+
+@pytest.mark.batching
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_days_are_sent_in_one_request_if_supported(api, asynchronous):
+    request_handler.check_batch_support()
+    publisher = Publisher(asynchronous=asynchronous)
+    futures = [send_day(publisher, day) for day in (1, 2)]
+    publisher.close()
+
+    http_requests = [request for request in api.http_requests if request != ("GET", "/batch")]
+    assert [future.result().json()["trade_id"] for future in futures] == [1, 2] \
+        and (len(http_requests) == 2) == api.batches \
+        and [body for method, _, body in api.requests if method == "POST"] == [{"ticker": "T1"}, {"ticker": "T2"}]
+
+
+@pytest.mark.batching
+def test_batch_falls_back_to_separate_requests(api):
+    # The API stops accepting batches after the startup check.
+    request_handler.check_batch_support()
+    api.batches = False
+    publisher = Publisher()
+    futures = [send_day(publisher, day) for day in (1, 2, 3)]
+    publisher.close()
+
+    assert [future.result().json()["trade_id"] for future in futures] == [1, 2, 3] \
+        and not request_handler.batch_supported() and api.requests[-1] == ("PUT", "/backtests/1", {"total_balance": 3})
+
+
+@pytest.mark.batching
+def test_queued_state_is_coalesced_across_batches(api):
+    request_handler.check_batch_support()
+    publisher = Publisher()
+    with api._lock:
+        # Hold the stand-in's state so that the later days are queued behind the first.
+        futures = [send_day(publisher, day) for day in (1, 2, 3)]
+        publisher.submit("PUT", "/backtests/1", serializer.dumps({"total_balance": 4}), coalesce=True)
+    publisher.close()
+
+    balances = [body["total_balance"] for method, endpoint, body in api.requests if endpoint == "/backtests/1"]
+    assert balances[-1] == 4 and len(balances) < 4 \
+        and [future.result().json()["trade_id"] for future in futures] == [1, 2, 3]
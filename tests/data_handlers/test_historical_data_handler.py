@@ -5,7 +5,8 @@ import pandas as pd
 import pickle
 import datetime as dt
 import os
-from src.data_handlers.historical_data_handler import HistoricalDataHandler
+import sqlite3
+from src.data_handlers.historical_data_handler import HistoricalDataHandler, record_data_version
 
 hist_data_mgr = HistoricalDataHandler(market_index="S&P500", end_date=dt.datetime(year=2021, month=2, day=25))
 hist_data_mgr.market_index_file_path = "data_handlers/test_data/historical_data/market_index_lists/"
@@ -64,6 +65,22 @@ def test_get_tickers_updates_ticker_list_cache_file(requests_mock):
 
     assert file_exists
 
+
+@pytest.mark.historical_data_handler
+def test_data_version_changes_when_data_is_updated():
+    conn = sqlite3.connect(":memory:")
+    df = pd.DataFrame({"date": pd.bdate_range("2021-01-04", periods=5).astype(str), "open": 1., "high": 1.,
+                       "low": 1., "close": [1., 2., 3., 4., 5.], "volume": 100, "adj_close": 1.})
+    df.to_sql("TEST1", conn, index=False)
+    version = record_data_version(conn, "TEST1")
+    same_version = record_data_version(conn, "TEST1")
+    df.iloc[4:].assign(date="2021-01-11").to_sql("TEST1", conn, if_exists="append", index=False)
+    appended_version = record_data_version(conn, "TEST1")
+    stored = conn.execute("""SELECT version FROM data_versions WHERE ticker='TEST1'""").fetchone()[0]
+    conn.close()
+
+    assert version == same_version and appended_version != version and stored == appended_version
+
 # TESTS DO NOT WORK AFTER SQLITE INTEGRATION :( WILL FIX WHEN HAVE TIME.
 
 # @pytest.mark.historical_data_handler
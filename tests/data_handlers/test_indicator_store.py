@@ -0,0 +1,76 @@
+import pytest
+import sqlite3
+import numpy as np
+import pandas as pd
+from src.data_handlers import indicator_store
+
+specs = [("sma", 20), ("ema", 12), ("std", 20)]
+
+
+def create_price_table(conn, num_days=300, seed=0):
+    """ Saves a table of random walk price data in the same format as the historical data handler. """
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, num_days)))
+    df = pd.DataFrame({"date": pd.bdate_range("2020-01-01", periods=num_days), "close": closes})
+    df.to_sql("TEST", conn, if_exists='replace', index=False)
+    return df
+
+
+def read_indicators(conn):
+    """ Reads the materialised indicators of the test ticker back into a DataFrame. """
+    return pd.read_sql_query("""SELECT * FROM 'TEST_indicators' ORDER BY `date`""", conn)
+
+
+def expected_indicators(df):
+    """ Calculates the indicators from scratch over the full price history. """
+    return {indicator_store.indicator_key(indicator, period):
+            indicator_store.calculate_indicator(df['close'], indicator, period).values for indicator, period in specs}
+
+
+@pytest.mark.indicator_store
+def test_materialise_indicators_matches_full_calculation():
+    conn = sqlite3.connect(":memory:")
+    df = create_price_table(conn)
+    indicator_store.materialise_indicators(conn, "TEST", specs)
+
+    result = read_indicators(conn)
+
+    assert all(np.allclose(result[key], values, equal_nan=True) for key, values in expected_indicators(df).items())
+
+
+@pytest.mark.indicator_store
+def test_materialise_indicators_extends_appended_days():
+    conn = sqlite3.connect(":memory:")
+    df = create_price_table(conn)
+    df[:250].to_sql("TEST", conn, if_exists='replace', index=False)
+    indicator_store.materialise_indicators(conn, "TEST", specs)
+    df[250:].to_sql("TEST", conn, if_exists='append', index=False)
+
+    # Materialising again without specs extends everything that has already been materialised.
+    indicator_store.materialise_indicators(conn, "TEST")
+    result = read_indicators(conn)
+
+    assert len(result) == len(df) and \
+        all(np.allclose(result[key], values, equal_nan=True) for key, values in expected_indicators(df).items())
+
+
+@pytest.mark.indicator_store
+def test_materialise_indicators_invalidates_changed_data():
+    conn = sqlite3.connect(":memory:")
+    create_price_table(conn)
+    indicator_store.materialise_indicators(conn, "TEST", specs)
+    df = create_price_table(conn, seed=1)
+
+    indicator_store.materialise_indicators(conn, "TEST", specs)
+    result = read_indicators(conn)
+
+    assert all(np.allclose(result[key], values, equal_nan=True) for key, values in expected_indicators(df).items())
+
+
+@pytest.mark.indicator_store
+def test_get_materialised_ignores_incomplete_columns():
+    df = pd.DataFrame({"close": np.arange(30.0), "sma_5": np.arange(30.0)})
+    df.loc[29, "sma_5"] = np.nan
+
+    assert indicator_store.get_materialised(df, "sma", 5) is None and \
+        indicator_store.get_materialised(df, "ema", 5) is None
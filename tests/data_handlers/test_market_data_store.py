@@ -0,0 +1,116 @@
+import pytest
+import multiprocessing
+import sqlite3
+import datetime as dt
+import numpy as np
+import pandas as pd
+from src.data_handlers.historical_data_handler import HistoricalDataHandler, PRICE_COLUMNS
+from src.data_handlers.market_data_store import MarketDataStore, SharedMarketDataStore, publish
+from src.exceptions.custom_exceptions import InvalidHistoricalDataError, InvalidHistoricalDataIndexError
+
+backtest_date = dt.datetime(2020, 9, 1)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """ Creates a historical data database in a temporary directory, holding two valid tickers and an invalid one. """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "historical_data").mkdir()
+    conn = sqlite3.connect("historical_data/historical_data.db")
+    conn.execute("""CREATE TABLE available_tickers
+                        ([ticker] text, [valid] boolean, [market_index] text, [first_date] datetime,
+                         [last_date] datetime)""")
+    rng = np.random.default_rng(0)
+    for ticker, valid in (("TEST1", True), ("TEST2", True), ("TEST3", False)):
+        dates = pd.bdate_range("2020-01-01", periods=250)
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        df = pd.DataFrame({"date": dates, "open": closes, "high": closes, "low": closes, "close": closes,
+                           "volume": rng.integers(1000, 2000, len(dates)), "adj_close": closes})
+        df.to_sql(ticker, conn, index=False)
+        conn.execute("""INSERT INTO available_tickers VALUES (?, ?, 'S&P500', ?, ?)""",
+                     [ticker, valid, str(dates[0].to_pydatetime()), str(dates[-1].to_pydatetime())])
+    conn.commit()
+    conn.close()
+    return HistoricalDataHandler()
+
+
+@pytest.mark.market_data_store
+def test_store_matches_database_queries(database):
+    store = MarketDataStore(database)
+    store.materialise_indicators(["TEST1", "TEST2"], [("sma", 20)])
+    keys = ["sma_20", "ema_50"]
+
+    expected = database.get_hist_dataframes(["TEST1", "TEST2"], backtest_date, num_weeks=4, indicators=keys)
+    actual = store.get_hist_dataframes(["TEST1", "TEST2"], backtest_date, num_weeks=4, indicators=keys)
+
+    assert all(df.equals(expected_df) and df.attrs['ticker'] == expected_df.attrs['ticker']
+               for df, expected_df in zip(actual, expected)) \
+        and list(actual[0].columns) == PRICE_COLUMNS + ["sma_20"] \
+        and all(np.array_equal(a, b) for a, b in zip(store.get_future_closes("TEST1", backtest_date),
+                                                     database.get_future_closes("TEST1", backtest_date))) \
+        and store.get_latest_closes(["TEST1", "TEST3", "TEST4"], backtest_date, 5)[0] == ["TEST1"] \
+        and np.array_equal(store.get_latest_closes(["TEST1"], backtest_date, 5)[1],
+                           database.get_latest_closes(["TEST1"], backtest_date, 5)[1])
+
+
+@pytest.mark.market_data_store
+def test_store_reads_each_ticker_once(database, monkeypatch):
+    store = MarketDataStore(database)
+    first = store.get_hist_dataframe("TEST1", backtest_date)
+    first['close'] = 0
+    monkeypatch.setattr(sqlite3, "connect", None)
+    second = store.get_hist_dataframe("TEST1", backtest_date - dt.timedelta(days=7))
+
+    assert (second['close'] > 0).all() and second.index[-1] < first.index[-1]
+
+
+@pytest.mark.market_data_store
+def test_store_reloads_tickers_with_new_indicators(database):
+    store = MarketDataStore(database)
+    before = store.get_hist_dataframe("TEST1", backtest_date, indicators=["sma_20"])
+    store.materialise_indicators(["TEST1"], [("sma", 20)])
+    after = store.get_hist_dataframe("TEST1", backtest_date, indicators=["sma_20"])
+
+    assert "sma_20" not in before.columns and not after["sma_20"].isna().any()
+
+
+@pytest.mark.market_data_store
+def test_store_raises_like_the_database(database):
+    store = MarketDataStore(database)
+
+    with pytest.raises(InvalidHistoricalDataError):
+        store.get_hist_dataframe("TEST3", backtest_date)
+    with pytest.raises(InvalidHistoricalDataIndexError):
+        store.get_hist_dataframe("TEST1", dt.datetime(2020, 2, 1), num_weeks=8)
+
+
+def read_latest_closes(name, layout):
+    """ Attaches to published market data in a worker process, and reads from it. """
+    store = SharedMarketDataStore(name, layout)
+    try:
+        return store.get_latest_closes(["TEST1", "TEST2", "TEST3"], backtest_date, 5)
+    finally:
+        store.close()
+
+
+@pytest.mark.market_data_store
+def test_published_data_is_shared_without_copies(database):
+    store = MarketDataStore(database)
+    store.materialise_indicators(["TEST1", "TEST2"], [("sma", 20)])
+    memory, layout = publish(store, ["TEST1", "TEST2", "TEST3"])
+    try:
+        shared = SharedMarketDataStore(memory.name, layout)
+        expected = store.get_hist_dataframe("TEST1", backtest_date, indicators=["sma_20"])
+        actual = shared.get_hist_dataframe("TEST1", backtest_date, indicators=["sma_20"])
+        zero_copy = np.shares_memory(shared._tickers["TEST1"].data.values,
+                                     np.frombuffer(shared._memory.buf, dtype=np.uint8))
+        with multiprocessing.Pool(1) as pool:
+            tickers, closes = pool.apply(read_latest_closes, (memory.name, layout))
+        shared.close()
+    finally:
+        memory.close()
+        memory.unlink()
+
+    assert zero_copy and actual.equals(expected.astype(float)) and list(actual.columns) == PRICE_COLUMNS + ["sma_20"] \
+        and tickers == ["TEST1", "TEST2"] \
+        and np.array_equal(closes, store.get_latest_closes(["TEST1", "TEST2"], backtest_date, 5)[1])
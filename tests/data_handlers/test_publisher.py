@@ -0,0 +1,106 @@
+import pytest
+import threading
+import types
+from src.data_handlers import request_handler
+from src.data_handlers.publisher import Publisher, LocalPublisher
+from src.exceptions.custom_exceptions import APIConnectionError
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """ Replaces the request handler's PUT and POST with fakes that record the requests sent, blocking until the
+        'release' event is set so that requests can be queued up behind them. """
+    api = types.SimpleNamespace(requests=[], compressed={}, release=threading.Event())
+
+    def fake(method):
+        def send(endpoint, data, compress=False):
+            api.release.wait(5)
+            if data == "fail":
+                raise APIConnectionError(method, endpoint, 5)
+            api.requests.append((method, endpoint, data))
+            api.compressed[endpoint] = compress
+            return method, endpoint, data
+        return send
+
+    monkeypatch.setattr(request_handler, "put", fake("PUT"))
+    monkeypatch.setattr(request_handler, "post", fake("POST"))
+    return api
+
+
+@pytest.mark.publisher
+def test_requests_are_sent_in_order(api):
+    publisher = Publisher()
+    for i in range(5):
+        publisher.submit("PUT", "/trades/1", i)
+    api.release.set()
+    publisher.close()
+
+    assert api.requests == [("PUT", "/trades/1", i) for i in range(5)]
+
+
+@pytest.mark.publisher
+def test_superseded_state_is_dropped(api):
+    publisher = Publisher()
+    publisher.submit("PUT", "/trades/1", "first")
+    old = publisher.submit("PUT", "/backtests/1", "old", coalesce=True)
+    publisher.submit("PUT", "/trades/1", "second")
+    publisher.submit("PUT", "/backtests/1", "new", coalesce=True)
+    api.release.set()
+    publisher.close()
+
+    assert old.result() is None and [data for _, _, data in api.requests] == ["first", "second", "new"]
+
+
+@pytest.mark.publisher
+def test_responses_arrive_after_the_queued_requests(api):
+    publisher = Publisher()
+    publisher.submit("PUT", "/trades/1", "update")
+    api.release.set()
+    response = publisher.submit("POST", "/trades/1", "trade").result(5)
+
+    assert response == ("POST", "/trades/1", "trade") and len(api.requests) == 2
+    publisher.close()
+
+
+@pytest.mark.publisher
+def test_failure_is_raised_in_the_submitting_thread(api):
+    publisher = Publisher()
+    publisher.submit("PUT", "/trades/1", "fail")
+    queued = publisher.submit("PUT", "/trades/1", "update")
+    api.release.set()
+
+    with pytest.raises(APIConnectionError):
+        publisher.flush()
+    with pytest.raises(APIConnectionError):
+        queued.result()
+    with pytest.raises(APIConnectionError):
+        publisher.submit("PUT", "/trades/1", "later")
+
+
+@pytest.mark.publisher
+def test_synchronous_publisher_sends_straight_away(api):
+    api.release.set()
+    publisher = Publisher(asynchronous=False)
+    future = publisher.submit("PUT", "/backtests/1", "state", coalesce=True)
+
+    assert future.done() and api.requests == [("PUT", "/backtests/1", "state")]
+
+
+@pytest.mark.publisher
+def test_compression_is_set_per_publisher(api):
+    api.release.set()
+    compressed, uncompressed = Publisher(asynchronous=False, compress=True), Publisher(asynchronous=False)
+    compressed.submit("PUT", "/backtests/1", "state")
+    uncompressed.submit("PUT", "/backtests/2", "state")
+
+    assert api.compressed == {"/backtests/1": True, "/backtests/2": False}
+
+
+@pytest.mark.publisher
+def test_local_publisher_assigns_trade_ids(api):
+    publisher = LocalPublisher()
+    ids = [publisher.submit("POST", "/trades/0", publisher.encode({"ticker": "AAPL"})).result().json()["trade_id"]
+           for _ in range(3)]
+    publisher.close()
+
+    assert ids == [1, 2, 3] and publisher.submit("PUT", "/backtests/0", {}).result().json() == {} and not api.requests
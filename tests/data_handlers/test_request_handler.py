@@ -0,0 +1,65 @@
+import pytest
+import gzip
+import json
+import requests
+from src.data_handlers import request_handler
+from src.exceptions.custom_exceptions import APIConnectionError
+
+URL = "http://api.test"
+
+
+@pytest.fixture(autouse=True)
+def api(monkeypatch):
+    """ Points the request handler at a test URL without waiting between retries. """
+    monkeypatch.setattr(request_handler, "URL", URL)
+    monkeypatch.setattr(request_handler.time, "sleep", lambda seconds: None)
+    yield
+    request_handler.close_session()
+
+
+@pytest.mark.request_handler
+def test_requests_share_one_session(requests_mock):
+    requests_mock.get(URL + "/backtest_settings", json={})
+    session = request_handler.get_session()
+    request_handler.get("/backtest_settings")
+
+    assert request_handler.get_session() is session and requests_mock.call_count == 1 \
+        and requests_mock.last_request.timeout == request_handler.ENDPOINT_TIMEOUTS["/backtest_settings"]
+
+
+@pytest.mark.request_handler
+def test_connection_errors_are_retried(requests_mock):
+    requests_mock.put(URL + "/trades/1", [{"exc": requests.exceptions.ConnectionError}, {"json": {}}])
+    response = request_handler.put("/trades/1", b"{}")
+
+    assert response.status_code == 200 and requests_mock.call_count == 2
+
+
+@pytest.mark.request_handler
+def test_error_raised_rather_than_exiting_after_max_attempts(requests_mock):
+    requests_mock.get(URL + "/backtest_settings", exc=requests.exceptions.ConnectionError)
+
+    with pytest.raises(APIConnectionError):
+        request_handler.get("/backtest_settings")
+    assert requests_mock.call_count == request_handler.max_attempts
+
+
+@pytest.mark.request_handler
+def test_timed_out_posts_are_not_sent_again(requests_mock):
+    requests_mock.post(URL + "/trades/1", exc=requests.exceptions.ReadTimeout)
+
+    with pytest.raises(APIConnectionError):
+        request_handler.post("/trades/1", b"{}")
+    assert requests_mock.call_count == 1
+
+
+@pytest.mark.request_handler
+def test_large_bodies_are_compressed(requests_mock):
+    requests_mock.put(URL + "/trades/1", json={})
+    body = json.dumps({"closes": list(range(1000))}).encode('utf-8')
+    request_handler.put("/trades/1", body, compress=True)
+    compressed = requests_mock.last_request
+    request_handler.put("/trades/1", body)
+
+    assert compressed.headers["Content-Encoding"] == "gzip" and gzip.decompress(compressed.body) == body \
+        and "Content-Encoding" not in requests_mock.last_request.headers and requests_mock.last_request.body == body
@@ -0,0 +1,60 @@
+import pytest
+import json
+import os
+import types
+import numpy as np
+import pandas as pd
+from src.data_handlers.result_sink import ResultSink, read_table
+from src.trades.growable_array import GrowableArray
+from src.trades.ledger import CLOSED_POSITION_DTYPE
+
+
+def create_backtest():
+    """ Creates a stand-in for a backtest, with the fields that are written to the results. """
+    ledger = types.SimpleNamespace(closed_positions=np.empty(0, dtype=CLOSED_POSITION_DTYPE), open_positions=[],
+                                   summary=lambda: {"num_trades": len(ledger.closed_positions)})
+    return types.SimpleNamespace(ledger=ledger, start_date=pd.Timestamp("2021-01-04"),
+                                 backtest_date=pd.Timestamp("2021-01-04"), total_balance=10000.0,
+                                 available_balance=10000.0, equity_dates=GrowableArray("datetime64[s]"),
+                                 equity_balances=GrowableArray(float))
+
+
+def run_days(sink, backtest, num_days):
+    """ Records days of a backtest that closes a trade every other day. """
+    for day in range(num_days):
+        backtest.backtest_date += pd.Timedelta(days=1)
+        if day % 2:
+            buy_date = backtest.backtest_date - pd.Timedelta(days=1)
+            trade = ("AAPL", buy_date, backtest.backtest_date, 10, 11, 5, 50, 5, 10)
+            backtest.ledger.closed_positions = np.append(backtest.ledger.closed_positions,
+                                                         np.array([trade], dtype=CLOSED_POSITION_DTYPE))
+        backtest.equity_dates.append(backtest.backtest_date)
+        backtest.equity_balances.append(backtest.total_balance)
+        sink.record_day(backtest, (3, 1), 0.01)
+
+
+@pytest.mark.result_sink
+def test_results_are_written_in_parts(tmp_path):
+    backtest = create_backtest()
+    sink = ResultSink(str(tmp_path), flush_days=4)
+    run_days(sink, backtest, 10)
+    num_parts = len(os.listdir(tmp_path / "days"))
+    sink.close(backtest, 2.0)
+    with open(tmp_path / "summary.json") as f:
+        summary = json.load(f)
+
+    trades = read_table(str(tmp_path), "trades")
+    days = read_table(str(tmp_path), "days")
+    assert num_parts == 2 and len(os.listdir(tmp_path / "days")) == 3 and len(days) == 10 \
+        and list(days["num_analysed"]) == [1] * 10 and len(trades) == 5 and list(trades["ticker"]) == ["AAPL"] * 5 \
+        and len(read_table(str(tmp_path), "equity")) == 10 and summary["num_days"] == 10 \
+        and summary["days_per_second"] == 5 and summary["num_trades"] == 5
+
+
+@pytest.mark.result_sink
+def test_empty_table_reads_as_empty_dataframe(tmp_path):
+    backtest = create_backtest()
+    sink = ResultSink(str(tmp_path))
+    sink.close(backtest, 0)
+
+    assert read_table(str(tmp_path), "trades").empty
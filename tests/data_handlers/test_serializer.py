@@ -0,0 +1,55 @@
+import pytest
+import json
+import datetime as dt
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from src.data_handlers import serializer
+
+
+class Record:
+    json_schema = (("name", None), ("date", serializer.date_string), ("values", None))
+
+    def __init__(self):
+        self.name = "TEST"
+        self.date = dt.datetime(2021, 1, 4)
+        self.values = np.array([1.5, np.nan, 2.5])
+        self.ignored = "not sent"
+
+
+@pytest.mark.serializer
+def test_schema_fields_are_sent_in_order():
+    encoded = json.loads(serializer.dumps({"records": [Record()]}))
+
+    assert encoded == {"records": [{"name": "TEST", "date": "2021-01-04 00:00:00", "values": [1.5, None, 2.5]}]}
+
+
+@pytest.mark.serializer
+def test_numpy_and_dates_are_encoded_natively():
+    data = {"int": np.int64(3), "float": np.float64(0.5), "dates": np.array(["2021-01-04", "NaT"], dtype="datetime64[s]"),
+            "timestamp": pd.Timestamp("2021-01-04 09:30")}
+    encoded = serializer.dumps(data)
+
+    assert isinstance(encoded, bytes) and json.loads(encoded) == {"int": 3, "float": 0.5,
+                                                                   "dates": ["2021-01-04T00:00:00", None],
+                                                                   "timestamp": "2021-01-04T09:30:00"}
+
+
+@pytest.mark.serializer
+def test_figure_json_matches_plotly():
+    dates = pd.bdate_range(end="2021-03-01", periods=30)
+    closes = np.linspace(10, 12, 30)
+    ma = pd.Series(closes).rolling(5).mean().to_numpy()
+    fig = go.Figure(data=[go.Candlestick(x=dates, open=closes, high=closes, low=closes, close=closes),
+                          go.Scatter(x=dates, y=ma), go.Scatter(x=[dates[-1]], y=[closes[-1]], mode="markers")])
+    fig.update_layout(height=250, width=460, template="simple_white", xaxis=dict(range=[dates[5], dates[-1]]))
+
+    assert json.loads(serializer.figure_json(fig)) == json.loads(fig.to_json())
+
+
+@pytest.mark.serializer
+def test_price_data_puts_dates_in_a_column():
+    df = pd.DataFrame({"close": [1.0, 2.0]}, index=pd.DatetimeIndex(["2021-01-04", "2021-01-05"], name="date"))
+
+    assert json.loads(serializer.dumps(serializer.price_data(df))) == {
+        "date": ["2021-01-04 00:00:00", "2021-01-05 00:00:00"], "close": [1.0, 2.0]}
@@ -0,0 +1,157 @@
+import pytest
+import itertools
+import json
+import time
+import numpy as np
+import pandas as pd
+import socketio
+from src.data_handlers import request_handler, serializer, socket_stream
+from src.data_handlers.publisher import Publisher
+from src.data_handlers.socket_stream import SocketStream
+from src.exceptions.custom_exceptions import StreamAcknowledgementError
+
+pytest.importorskip("msgpack")
+
+
+class FakeSocket:
+    """ Stands in for the socket.io client, answering streamed messages like the data access API. """
+
+    def __init__(self, supported=True, acknowledge=True):
+        self.connected = True
+        self.supported = supported
+        self.auto_acknowledge = acknowledge
+        self.messages = []
+        self._unacknowledged = []
+        self._trade_ids = itertools.count(1)
+
+    def call(self, event, data=None, namespace=None, timeout=60):
+        if not self.supported:
+            raise socketio.exceptions.TimeoutError()
+        return True
+
+    def emit(self, event, data=None, namespace=None, callback=None):
+        if not self.connected:
+            raise socketio.exceptions.BadNamespaceError("/ is not a connected namespace.")
+        self.messages.append(socket_stream.unpack(data))
+        self._unacknowledged.append((self.messages[-1], callback))
+        if self.auto_acknowledge:
+            self.acknowledge()
+
+    def acknowledge(self):
+        while self._unacknowledged:
+            message, callback = self._unacknowledged.pop(0)
+            responses = [{"status": 200, "body": {"trade_id": next(self._trade_ids)} if item["method"] == "POST" else {}}
+                         for item in message["requests"]]
+            callback(socket_stream.pack({"responses": responses}))
+
+
+@pytest.fixture
+def rest(monkeypatch):
+    """ Replaces the request handler's REST requests with fakes that record them. """
+    sent = []
+
+    def fake(method):
+        def send(endpoint, data, compress=False):
+            sent.append((method, endpoint, data))
+        return send
+
+    for method in ("put", "patch", "post"):
+        monkeypatch.setattr(request_handler, method, fake(method.upper()))
+    return sent
+
+
+def trade_body(num_days=500):
+    dates = pd.date_range("2019-01-01", periods=num_days).to_numpy().astype("datetime64[s]")
+    return {"ticker": "AAPL", "buy_date": pd.Timestamp("2020-05-01"), "share_qty": np.int64(12),
+            "figure": {"x": dates, "y": np.linspace(10, 20, num_days), "name": "Stock Price"}}
+
+
+@pytest.mark.socket_stream
+def test_arrays_are_packed_as_raw_bytes():
+    body = trade_body()
+    packed = socket_stream.pack(body)
+    unpacked = socket_stream.unpack(packed)
+
+    assert np.array_equal(unpacked["figure"]["x"], body["figure"]["x"]) \
+        and np.array_equal(unpacked["figure"]["y"], body["figure"]["y"]) \
+        and unpacked["buy_date"] == "2020-05-01T00:00:00" and unpacked["share_qty"] == 12 \
+        and json.loads(serializer.dumps(unpacked)) == json.loads(serializer.dumps(body)) \
+        and len(packed) < len(serializer.dumps(body)) / 2
+
+
+@pytest.mark.socket_stream
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_day_is_streamed_as_one_message(rest, asynchronous):
+    socket = FakeSocket()
+    publisher = Publisher(asynchronous=asynchronous, stream=SocketStream(socket))
+    publisher.begin_batch()
+    publisher.submit("PATCH", "/backtests/1/date", {"backtest_date": "2020-05-01 00:00:00"}, coalesce=True)
+    future = publisher.submit("POST", "/trades/1", publisher.encode(trade_body()))
+    publisher.submit("PUT", "/backtests/1", publisher.encode({"total_balance": 10000}), coalesce=True)
+    publisher.end_batch()
+    publisher.close()
+
+    requests = socket.messages[0]["requests"]
+    assert len(socket.messages) == 1 and not rest and future.result().json() == {"trade_id": 1} \
+        and [request["method"] for request in requests] == ["PATCH", "POST", "PUT"] \
+        and isinstance(requests[1]["body"]["figure"]["y"], np.ndarray)
+
+
+@pytest.mark.socket_stream
+def test_unacknowledged_messages_are_limited(rest):
+    socket = FakeSocket(acknowledge=False)
+    publisher = Publisher(stream=SocketStream(socket, max_unacked=2))
+    futures = [publisher.submit("PUT", "/trades/1", publisher.encode({"day": day})) for day in range(4)]
+    while len(socket.messages) < 2:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    held_back = len(socket.messages)
+    socket.auto_acknowledge = True
+    socket.acknowledge()
+    publisher.close()
+
+    assert held_back == 2 and [message["requests"][0]["body"] for message in socket.messages] \
+        == [{"day": day} for day in range(4)] and all(future.done() for future in futures)
+
+
+@pytest.mark.socket_stream
+def test_unacknowledged_messages_stop_the_publisher(rest):
+    publisher = Publisher(stream=SocketStream(FakeSocket(acknowledge=False), ack_timeout=0.2))
+    publisher.submit("PUT", "/trades/1", publisher.encode({"day": 1}))
+
+    with pytest.raises(StreamAcknowledgementError):
+        publisher.close()
+
+
+@pytest.mark.socket_stream
+def test_unsupported_stream_uses_rest(rest):
+    publisher = Publisher(asynchronous=False, stream=SocketStream(FakeSocket(supported=False)))
+    publisher.submit("PUT", "/trades/1", publisher.encode({"day": 1}))
+
+    assert rest == [("PUT", "/trades/1", b'{"day":1}')]
+
+
+@pytest.mark.socket_stream
+def test_disconnected_stream_falls_back_to_rest(rest):
+    socket = FakeSocket()
+    publisher = Publisher(asynchronous=False, stream=SocketStream(socket))
+    body = trade_body(5)
+    publisher.submit("POST", "/trades/1", publisher.encode(body))
+    packed = publisher.encode(body)
+    socket.connected = False
+    publisher.submit("POST", "/trades/1", packed)
+
+    assert len(socket.messages) == 1 and rest == [("POST", "/trades/1", serializer.dumps(body))]
+
+
+@pytest.mark.socket_stream
+def test_bodies_encoded_whilst_disconnected_are_packed(rest):
+    socket = FakeSocket()
+    publisher = Publisher(asynchronous=False, stream=SocketStream(socket))
+    socket.connected = False
+    body = publisher.encode({"day": 1})
+    socket.connected = True
+    publisher.submit("PUT", "/trades/1", body)
+
+    assert isinstance(body, socket_stream.Packed) and socket.messages[0]["requests"][0]["body"] == {"day": 1} \
+        and not rest
@@ -0,0 +1,79 @@
+import pytest
+import multiprocessing
+import datetime as dt
+import numpy as np
+from src.jobs.broker import SQLiteBroker, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteBroker(str(tmp_path / "jobs.db"))
+
+
+@pytest.mark.jobs
+def test_jobs_are_claimed_in_order_and_completed(broker):
+    first = broker.enqueue({"settings": {"startDate": dt.datetime(2020, 1, 1)}})
+    second = broker.enqueue({"settings": {}})
+    job = broker.claim("worker-1")
+    completed = broker.complete(first, "worker-1", {"return_pct": np.float64(1.5)})
+
+    assert job.job_id == first and job.state == RUNNING and job.attempts == 1 \
+        and job.payload == {"settings": {"startDate": "2020-01-01T00:00:00"}} \
+        and completed and broker.get(first).state == SUCCEEDED and broker.get(first).result == {"return_pct": 1.5} \
+        and broker.claim("worker-2").job_id == second and broker.claim("worker-3") is None
+
+
+@pytest.mark.jobs
+def test_only_the_owning_worker_can_update_a_job(broker):
+    job_id = broker.enqueue({})
+    broker.claim("worker-1")
+
+    assert not broker.heartbeat(job_id, "worker-2") and not broker.complete(job_id, "worker-2", {}) \
+        and broker.heartbeat(job_id, "worker-1") and broker.fail(job_id, "worker-1", "error") \
+        and broker.get(job_id).state == FAILED and not broker.heartbeat(job_id, "worker-1")
+
+
+@pytest.mark.jobs
+def test_jobs_of_dead_workers_are_requeued_until_out_of_attempts(broker):
+    job_id = broker.enqueue({}, max_attempts=2)
+    broker.claim("worker-1")
+    not_expired = broker.requeue_expired(60)
+    # A negative timeout treats every running job as expired.
+    requeued = broker.requeue_expired(-1)
+    state_after_first = broker.get(job_id).state
+    rejected = broker.heartbeat(job_id, "worker-1")
+    broker.claim("worker-2")
+    broker.requeue_expired(-1)
+    job = broker.get(job_id)
+
+    assert not_expired == [] and requeued == [job_id] and state_after_first == QUEUED and not rejected \
+        and job.state == FAILED and job.attempts == 2 and "2 attempts" in job.error
+
+
+@pytest.mark.jobs
+def test_released_jobs_do_not_use_an_attempt(broker):
+    job_id = broker.enqueue({})
+    broker.claim("worker-1")
+    released = broker.release(job_id, "worker-1")
+    job = broker.get(job_id)
+
+    assert released and job.state == QUEUED and job.attempts == 0 and job.worker_id is None \
+        and broker.claim("worker-2").job_id == job_id
+
+
+def claim_all(path, worker_id):
+    """ Claims jobs from a broker in a worker process until the queue is empty. """
+    broker = SQLiteBroker(path)
+    claimed = []
+    while (job := broker.claim(worker_id)) is not None:
+        claimed.append(job.job_id)
+    return claimed
+
+
+@pytest.mark.jobs
+def test_each_job_is_claimed_by_one_worker(broker):
+    job_ids = [broker.enqueue({"n": n}) for n in range(40)]
+    with multiprocessing.Pool(3) as pool:
+        claimed = pool.starmap(claim_all, [(broker.path, f"worker-{n}") for n in range(3)])
+
+    assert sorted(job_id for worker_claims in claimed for job_id in worker_claims) == job_ids
@@ -0,0 +1,85 @@
+import pytest
+import threading
+from src.backtest.control import BacktestControl
+from src.jobs import coordinator
+from src.jobs.broker import SQLiteBroker, QUEUED, RUNNING, SUCCEEDED, FAILED
+from src.jobs.worker import JobWorker, parse_settings
+
+SETTINGS = {"startDate": "2020-01-01T00:00:00", "endDate": "2020-06-01T00:00:00", "capPct": 0.25,
+            "strategy": {"strategyName": "test", "technicalAnalysis": [
+                {"name": "Bollinger Bands", "config": {"dayPeriod": 20}}]}}
+
+
+class FakeBacktest:
+    def __init__(self):
+        self.control = BacktestControl()
+
+
+class FakeWorker(JobWorker):
+    """ A worker that runs fake backtests, which return their settings or wait until they are stopped. """
+
+    def __init__(self, broker, worker_id, block=False):
+        super().__init__(broker, [], heartbeat_interval=0.01, poll_interval=0.01, worker_id=worker_id)
+        self.block = block
+        self.started = threading.Event()
+
+    def execute(self, payload, job_id):
+        settings = parse_settings(payload['settings'])
+        if settings['capPct'] < 0:
+            raise ValueError("Invalid capPct")
+        self._backtest = FakeBacktest()
+        if self._stopping.is_set():
+            self._backtest.control.stop()
+        self.started.set()
+        if self.block:
+            self._backtest.control.sleep(10)
+            return None
+        return {**payload['parameters'], "return_pct": settings['capPct'] * 10, "max_drawdown_pct": 1.0,
+                "days": (settings['endDate'] - settings['startDate']).days}
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteBroker(str(tmp_path / "jobs.db"))
+
+
+@pytest.mark.jobs
+def test_worker_runs_a_sweep_and_reports_failures(broker):
+    job_ids = coordinator.enqueue_sweep(broker, SETTINGS, {"grid": {"capPct": [0.1, 0.3, -1]}})
+    num_jobs = FakeWorker(broker, "worker-1").run(max_jobs=3)
+    jobs = coordinator.wait_for_jobs(broker, job_ids, poll_interval=0.01, timeout=1)
+    summary = coordinator.sweep_summary(jobs)
+
+    assert num_jobs == 3 and [job.state for job in jobs] == [SUCCEEDED, SUCCEEDED, FAILED] \
+        and "Invalid capPct" in jobs[2].error and list(summary["capPct"]) == [0.3, 0.1] \
+        and list(summary["job"]) == [job_ids[1], job_ids[0]] and summary["days"].iloc[0] == 152
+
+
+@pytest.mark.jobs
+def test_worker_stops_a_job_that_was_requeued(broker):
+    job_id = coordinator.enqueue_backtest(broker, SETTINGS)
+    worker = FakeWorker(broker, "worker-1", block=True)
+    thread = threading.Thread(target=worker.run, args=(1,))
+    thread.start()
+    worker.started.wait(1)
+    # Another worker presumes the first one is dead and takes over its job.
+    broker.requeue_expired(-1)
+    broker.claim("worker-2")
+    thread.join(1)
+    job = broker.get(job_id)
+
+    assert not thread.is_alive() and job.state == RUNNING and job.worker_id == "worker-2" and job.attempts == 2
+
+
+@pytest.mark.jobs
+def test_stopped_worker_returns_its_job_to_the_queue(broker):
+    job_id = coordinator.enqueue_backtest(broker, SETTINGS)
+    worker = FakeWorker(broker, "worker-1", block=True)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    worker.started.wait(1)
+    worker.stop()
+    thread.join(1)
+    job = broker.get(job_id)
+
+    assert not thread.is_alive() and job.state == QUEUED and job.attempts == 0
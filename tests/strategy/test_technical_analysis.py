@@ -0,0 +1,94 @@
+import pytest
+import importlib
+import numpy as np
+import pandas as pd
+from src.data_handlers import indicator_store
+from src.strategy.technical_analysis import BaseTechnicalAnalysisModule, FIGURE_MAX_CANDLES, FIGURE_MAX_LINE_POINTS, \
+    FIGURE_RANGE_DAYS
+
+
+def create_module(name, config):
+    """ Wraps the blank analysis in the named analysis module, in the same way the strategy does. """
+    module = importlib.import_module(f"src.strategy.technical_analysis_modules.{name}.wrapper")
+    return getattr(module, name.replace(" ", ""))(BaseTechnicalAnalysisModule(), config)
+
+
+def random_walks(num_tickers=300, num_days=80, seed=0):
+    """ Creates a 2D array of random walk close prices, one row per ticker. """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.02, size=(num_tickers, num_days))
+    return 100 * np.exp(np.cumsum(returns, axis=1))
+
+
+def sudden_drops(num_tickers=300, num_days=80, seed=0):
+    """ Creates a 2D array of close prices that stay flat and then drop on the last day, one row per ticker. """
+    rng = np.random.default_rng(seed)
+    closes = rng.normal(100, 2, size=(num_tickers, num_days))
+    closes[:, -21] = rng.uniform(80, 100, size=num_tickers)
+    closes[:, -1] = rng.uniform(85, 100, size=num_tickers)
+    return closes
+
+
+def to_historical_df(closes):
+    """ Converts a row of close prices into a DataFrame that looks like one from the historical data handler. """
+    dates = pd.bdate_range(end="2021-03-01", periods=len(closes))
+    df = pd.DataFrame({"open": closes, "high": closes * 1.01, "low": closes * 0.99, "close": closes},
+                      index=pd.DatetimeIndex(dates, name="date"))
+    df.attrs['triggered_indicators'] = []
+    return df
+
+
+@pytest.mark.technical_analysis
+@pytest.mark.parametrize("name, config, closes", [
+    ("Moving Averages", {"shortTermType": "SMA", "shortTermDayPeriod": 5, "longTermType": "SMA", "longTermDayPeriod": 20},
+     random_walks()),
+    ("Bollinger Bands", {"dayPeriod": 20}, sudden_drops())
+], ids=["Moving Averages", "Bollinger Bands"])
+def test_screen_never_rules_out_triggered_tickers(name, config, closes):
+    analysis = create_module(name, config)
+
+    survivors = analysis.screen_data(closes[:, -analysis.screen_lookback():])
+    triggered = np.array([bool(analysis.analyse_data(to_historical_df(row))[0].attrs['triggered_indicators'])
+                          for row in closes])
+
+    assert triggered.any() and not (triggered & ~survivors).any() and survivors.sum() < len(closes)
+
+
+@pytest.mark.technical_analysis
+def test_screen_lets_every_ticker_through_for_ema():
+    analysis = create_module("Moving Averages", {"shortTermType": "EMA", "shortTermDayPeriod": 5,
+                                                 "longTermType": "SMA", "longTermDayPeriod": 20})
+
+    assert analysis.screen_lookback() == 0 and analysis.screen_data(random_walks()).all()
+
+
+@pytest.mark.technical_analysis
+def test_figure_traces_stay_bounded_for_long_running_trades():
+    analysis = create_module("Bollinger Bands", {"dayPeriod": 20})
+    closes = sudden_drops(num_tickers=1, num_days=1500)[0]
+    df, fig = analysis.analyse_data(to_historical_df(closes))
+
+    candles, *lines = fig.traces.values()
+    assert len(candles['x']) <= FIGURE_MAX_CANDLES and max(candles['high']) == df['high'][50:].max() \
+        and list(candles['close'][-FIGURE_RANGE_DAYS:]) == list(df['close'][-FIGURE_RANGE_DAYS:]) \
+        and all(len(trace['x']) <= FIGURE_MAX_LINE_POINTS and list(trace['x']) == list(lines[0]['x'])
+                for trace in lines)
+
+
+@pytest.mark.technical_analysis
+def test_materialised_indicators_match_the_fallback_calculation():
+    # The window of a ticker's history read by a backtest, with and without the indicators materialised over the full
+    # history joined onto it.
+    closes = random_walks(num_tickers=1, num_days=300)[0]
+    materialised = {indicator_store.indicator_key(indicator, period):
+                    indicator_store.calculate_indicator(pd.Series(closes), indicator, period).values[-60:]
+                    for indicator, period in (("sma", 20), ("std", 20), ("ema", 12))}
+    window = to_historical_df(closes[-60:])
+    materialised_window = window.assign(**materialised)
+    moving_averages = importlib.import_module("src.strategy.technical_analysis_modules.Moving Averages.wrapper")
+    bollinger_bands = importlib.import_module("src.strategy.technical_analysis_modules.Bollinger Bands.wrapper")
+
+    assert all(np.allclose(function(materialised_window, period), function(window, period), equal_nan=True)
+               for function, period in ((moving_averages.simple_moving_avg, 20),
+                                        (moving_averages.exponential_moving_avg, 12),
+                                        (bollinger_bands.rolling_stdev, 20)))
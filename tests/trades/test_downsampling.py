@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+from src.trades import downsampling
+
+
+def random_walk(num_points=5000, seed=0):
+    """ Creates a random walk series. """
+    rng = np.random.default_rng(seed)
+    return 100 + np.cumsum(rng.normal(0, 1, num_points))
+
+
+@pytest.mark.downsampling
+def test_lttb_keeps_extrema_end_points_and_kept_points():
+    y = random_walk()
+    selected = downsampling.lttb(y, 120, keep=[1234, 4321])
+
+    assert len(selected) <= 120 and selected[0] == 0 and selected[-1] == len(y) - 1 \
+        and {np.argmin(y), np.argmax(y), 1234, 4321} <= set(selected) and np.all(np.diff(selected) > 0)
+
+
+@pytest.mark.downsampling
+def test_lttb_leaves_short_series():
+    assert np.array_equal(downsampling.lttb(np.arange(10.0), 120), np.arange(10))
+
+
+@pytest.mark.downsampling
+def test_lttb_ignores_missing_values():
+    y = random_walk(1000)
+    y[:20] = np.nan
+    selected = downsampling.lttb(y, 100)
+
+    assert len(selected) <= 100 and np.nanargmax(y) in selected
+
+
+@pytest.mark.downsampling
+def test_ohlc_buckets_keep_prices_of_the_days_they_cover():
+    closes = random_walk(1000)
+    opens, highs, lows = closes - 0.5, closes + 1, closes - 1
+    starts, m_opens, m_highs, m_lows, m_closes = downsampling.ohlc(opens, highs, lows, closes, 115, keep=[500])
+    ends = np.append(starts[1:], len(closes)) - 1
+
+    assert len(starts) <= 115 and m_highs.max() == highs.max() and m_lows.min() == lows.min() \
+        and np.array_equal(m_opens, opens[starts]) and np.array_equal(m_closes, closes[ends]) \
+        and 500 in starts and 501 in starts
+
+
+@pytest.mark.downsampling
+def test_split_recent_halves_the_series():
+    assert downsampling.split_recent(400, 460, 30) is None and downsampling.split_recent(461, 460, 30) == (431, 200)
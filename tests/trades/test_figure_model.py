@@ -0,0 +1,65 @@
+import pytest
+import json
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from src.trades.figure_model import FigureModel
+from src.data_handlers import serializer
+
+
+def create_figures(num_days=10):
+    """ Draws the same figure as a FigureModel and as a Plotly figure. """
+    dates = pd.date_range("2021-01-04", periods=num_days, name="date")
+    closes = np.linspace(10, 11, num_days)
+    layout = dict(height=250, width=460, template="simple_white", xaxis=dict(range=[dates[0], dates[-1]]))
+
+    model = FigureModel(dict(layout))
+    model.add_trace("candles", "candlestick", dict(x=dates, open=closes, high=closes, low=closes, close=closes),
+                    name="Stock Price")
+    model.add_trace("line", "scatter", dict(x=dates, y=closes), name="Line", line=dict(width=1.3))
+
+    fig = go.Figure(data=[go.Candlestick(x=dates, open=closes, high=closes, low=closes, close=closes,
+                                         name="Stock Price"),
+                          go.Scatter(x=dates, y=closes, name="Line", line=dict(width=1.3))])
+    fig.update_layout(**layout)
+    return model, fig
+
+
+@pytest.mark.figure_model
+def test_figure_model_encodes_as_plotly_figure():
+    model, fig = create_figures()
+
+    assert json.loads(serializer.figure_json(model)) == json.loads(fig.to_json())
+
+
+@pytest.mark.figure_model
+def test_appended_points_and_layout_changes_match_plotly():
+    model, fig = create_figures()
+    date = pd.Timestamp("2021-01-14")
+    model["line"].append(x=date, y=12.0)
+    model.update_layout(yaxis=dict(range=[9, 13]))
+    fig.data[1].x = np.append(fig.data[1].x, date)
+    fig.data[1].y = np.append(fig.data[1].y, 12.0)
+    fig.update_layout(yaxis=dict(range=[9, 13]))
+
+    assert json.loads(serializer.figure_json(model)) == json.loads(fig.to_json()) and len(model["line"]) == 11 \
+        and model.index("line") == 1
+
+
+@pytest.mark.figure_model
+def test_copies_do_not_see_later_updates():
+    model, fig = create_figures()
+    copied = model.copy()
+    model["line"].append(x=pd.Timestamp("2021-01-14"), y=12.0)
+    model["line"].properties["line"]["width"] = 2
+    model.update_layout(xaxis=dict(range=[0, 1]))
+
+    assert json.loads(serializer.figure_json(copied)) == json.loads(fig.to_json())
+
+
+@pytest.mark.figure_model
+def test_traces_must_have_unique_roles():
+    model, _ = create_figures()
+
+    with pytest.raises(ValueError):
+        model.add_trace("line", "scatter", dict(x=[], y=[]))
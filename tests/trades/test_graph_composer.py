@@ -0,0 +1,32 @@
+import pytest
+import types
+import numpy as np
+import pandas as pd
+from src.trades import graph_composer
+
+
+@pytest.mark.graph_composer
+@pytest.mark.parametrize("current_price", [100.0, 101.37, 98.2, np.float64(100.55), 103.0])
+def test_open_trade_graph_matches_plotly(current_price):
+    trade = types.SimpleNamespace(buy_price=100.0, current_price=current_price, take_profit=102.0, stop_loss=99.0)
+    fig, cp_percent = graph_composer.draw_open_trade_graph(trade)
+
+    assert fig == graph_composer._draw_open_trade_figure(cp_percent,
+                                                         graph_composer._open_trade_graph_colour(cp_percent))
+
+
+@pytest.mark.graph_composer
+@pytest.mark.parametrize("sell_offset", [5.0, -5.0])
+def test_closed_trade_graph_matches_plotly(sell_offset):
+    dates = pd.DatetimeIndex(pd.bdate_range("2021-01-04", periods=60), name="date")
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, 60))
+    closes[5] = np.nan
+    trade = types.SimpleNamespace(buy_date=dates[30].to_pydatetime(), sell_date=dates[-1], buy_price=closes[30],
+                                  sell_price=closes[30] + sell_offset,
+                                  historical_data=pd.DataFrame({"close": closes}, index=dates))
+    line_colour = "mediumseagreen" if sell_offset > 0 else "rgb(211,63,73)"
+    trimmed_data = trade.historical_data[dates[20]:]
+
+    assert graph_composer.draw_closed_trade_graph(trade) == graph_composer._draw_closed_trade_figure(
+        trimmed_data.index, trimmed_data['close'].values, [trade.buy_date, trade.sell_date],
+        [trade.buy_price, trade.sell_price], line_colour)
@@ -0,0 +1,30 @@
+import pytest
+import numpy as np
+from src.trades.growable_array import GrowableArray
+
+
+@pytest.mark.growable_array
+def test_append_and_extend_keep_values_in_order():
+    arr = GrowableArray(float, capacity=2)
+    for i in range(5):
+        arr.append(i)
+    arr.extend([5, 6, 7])
+
+    assert len(arr) == 8 and np.array_equal(arr.values, np.arange(8))
+
+
+@pytest.mark.growable_array
+def test_capacity_doubles_when_full():
+    arr = GrowableArray("datetime64[s]", capacity=4)
+    arr.extend(np.arange("2021-01-01", "2021-01-06", dtype="datetime64[D]"))
+
+    assert len(arr._buffer) == 8 and arr.values[-1] == np.datetime64("2021-01-05")
+
+
+@pytest.mark.growable_array
+def test_rows_of_a_fixed_shape_can_be_appended():
+    arr = GrowableArray((float, (3,)), capacity=1)
+    for i in range(3):
+        arr.append(np.full(3, i))
+
+    assert arr.values.shape == (3, 3) and np.array_equal(arr.values[:, 0], [0, 1, 2])
@@ -0,0 +1,100 @@
+import pytest
+import datetime as dt
+from src.trades.trade import Trade
+from src.trades.ledger import PortfolioLedger
+
+
+def open_trade(ledger, ticker, buy_price, share_qty=10):
+    """ Opens a trade in the ledger. """
+    trade = Trade(backtest_id=1, ticker=ticker, historical_data=None, buy_date=dt.datetime(2021, 1, 4),
+                  buy_price=buy_price, share_qty=share_qty, investment_total=buy_price * share_qty,
+                  take_profit=buy_price * 1.02, stop_loss=buy_price * 0.99, triggered_indicators=[], figure=None,
+                  payload_store=ledger.payload_store)
+    ledger.open_position(trade)
+    return trade
+
+
+def open_and_close(ledger, ticker, buy_price, sell_price, share_qty=10):
+    """ Opens a trade in the ledger and then closes it at the sell price. """
+    trade = open_trade(ledger, ticker, buy_price, share_qty)
+    trade.sell_price = sell_price
+    trade.sell_date = dt.datetime(2021, 1, 8)
+    ledger.close_position(trade)
+    return trade
+
+
+@pytest.mark.ledger
+def test_ledger_tracks_balances():
+    ledger = PortfolioLedger(1000)
+    open_and_close(ledger, "TEST1", 10, 12)
+    open_and_close(ledger, "TEST2", 20, 19)
+
+    assert ledger.total_balance == 1010 and ledger.available_balance == 1010 and ledger.total_profit_loss == 10 \
+        and ledger.total_profit_loss_pct == 1
+
+
+@pytest.mark.ledger
+def test_closing_a_position_takes_it_out_of_the_open_positions():
+    ledger = PortfolioLedger(1000)
+    kept = open_trade(ledger, "TEST1", 20)
+    trade = open_and_close(ledger, "TEST2", 10, 12)
+
+    assert ledger.open_positions.trades == [kept] and list(ledger.open_positions.buy_price) == [20] \
+        and ledger.available_balance == 1000 - 200 - 100 + 120
+    with pytest.raises(ValueError):
+        ledger.close_position(trade)
+
+
+@pytest.mark.ledger
+def test_ledger_summary_comes_from_closed_positions():
+    ledger = PortfolioLedger(1000)
+    for i in range(40):
+        open_and_close(ledger, f"TEST{i}", 10, 11 if i % 4 else 9, share_qty=1)
+    summary = ledger.summary()
+
+    assert len(ledger.closed_positions) == 40 and summary['num_trades'] == 40 and summary['win_rate_pct'] == 75 \
+        and summary['worst_profit_loss_pct'] == pytest.approx(-10)
+
+
+@pytest.mark.ledger
+def test_trade_payloads_are_kept_out_of_the_record():
+    ledger = PortfolioLedger(1000, payloads_on_disk=True)
+    trade = open_and_close(ledger, "TEST1", 10, 12)
+    trade.figure = {"data": [1, 2, 3]}
+
+    assert not hasattr(trade, "__dict__") and trade.figure == {"data": [1, 2, 3]}
+    trade.release_payloads()
+    assert trade.figure is None
+    ledger.close()
+
+
+@pytest.mark.ledger
+def test_kept_figures_of_closed_trades_can_be_found():
+    ledger = PortfolioLedger(1000, payloads_on_disk=True)
+    trade = open_and_close(ledger, "TEST1", 10, 12)
+    trade.trade_id = 7
+    trade.figure = {"data": [1, 2, 3]}
+    trade.release_payloads(keep=("figure",))
+    ledger.keep_figure(trade)
+
+    assert ledger.find_figure(7) == {"data": [1, 2, 3]} and ledger.find_figure(8) is None \
+        and trade.historical_data is None
+    ledger.close()
+    assert ledger.find_figure(7) is None
+
+
+@pytest.mark.ledger
+def test_held_payloads_are_saved_back_to_disk():
+    ledger = PortfolioLedger(1000, payloads_on_disk=True)
+    trade, released = open_trade(ledger, "TEST1", 10), open_trade(ledger, "TEST2", 20)
+    trade.figure = {"data": [1]}
+
+    with ledger.payload_store.hold(trade.payload_key), ledger.payload_store.hold(released.payload_key):
+        trade.figure["data"].append(2)
+        trade.simpleFigure = "closed"
+        released.figure = {"data": [3]}
+        released.release_payloads()
+        assert trade.figure is trade.figure and released.figure is None
+
+    assert trade.figure == {"data": [1, 2]} and trade.simpleFigure == "closed" and released.figure is None
+    ledger.close()
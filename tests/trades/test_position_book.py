@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+import datetime as dt
+from src.trades.trade import Trade
+from src.trades.position_book import PositionBook, first_exit_index, SimulatedPositionBook
+
+
+def create_trade(ticker, buy_price, share_qty, take_profit, stop_loss):
+    """ Creates a trade with only the values used by the position book. """
+    return Trade(backtest_id=1, ticker=ticker, historical_data=None, buy_date=dt.datetime(2021, 1, 4),
+                 buy_price=buy_price, share_qty=share_qty, investment_total=buy_price * share_qty,
+                 take_profit=take_profit, stop_loss=stop_loss, triggered_indicators=[], figure=None)
+
+
+@pytest.fixture
+def book():
+    book = PositionBook()
+    book.add(create_trade("TEST1", 100, 10, 102, 99))
+    book.add(create_trade("TEST2", 50, 20, 51, 49.5))
+    book.add(create_trade("TEST3", 10, 100, 10.2, 9.9))
+    return book
+
+
+@pytest.mark.position_book
+def test_update_prices_detects_take_profit_and_stop_loss(book):
+    exits = book.update_prices(np.array([103, 50.5, 9.8]))
+
+    assert exits.tolist() == [True, False, True]
+
+
+@pytest.mark.position_book
+def test_update_prices_keeps_previous_price_when_missing(book):
+    book.update_prices(np.array([101, 50.5, 10.1]))
+    book.update_prices(np.array([np.nan, 50.8, 10.1]))
+
+    assert book.current_price.tolist() == [101, 50.8, 10.1] and np.allclose(book.profit_loss, [10, 16, 10])
+
+
+@pytest.mark.position_book
+def test_remove_keeps_arrays_aligned_with_trades(book):
+    exits = book.update_prices(np.array([103, 50.5, 9.8]))
+    removed = book.remove(exits)
+    trade = book.sync_trade(0)
+
+    assert [trade.ticker for trade in removed] == ["TEST1", "TEST3"] and book.tickers == ["TEST2"] \
+        and trade.current_price == 50.5 and trade.profit_loss == 10
+
+
+@pytest.mark.position_book
+def test_first_exit_index_finds_first_crossing():
+    closes = np.array([100, 101, 99.5, 98, 103])
+
+    assert first_exit_index(closes, 102, 99) == 3 and first_exit_index(closes, 110, 90) is None
+
+
+@pytest.mark.position_book
+def test_simulated_positions_are_refreshed_by_ticker():
+    book = SimulatedPositionBook()
+    book.add(np.array([0, 1, 1]), np.array([0, 0, 1]), np.array([100., 100., 10.]), np.array([1., 2., 5.]),
+             np.array([100., 200., 50.]), np.array([102., 102., 10.2]), np.array([99., 99., 9.9]))
+    exits = book.update_prices(np.array([103, np.nan]))
+    book.remove(exits)
+
+    assert exits.tolist() == [True, True, False] and book.simulation.tolist() == [1] \
+        and book.current_price.tolist() == [10.]
@@ -0,0 +1,93 @@
+import pytest
+import datetime as dt
+import json
+import numpy as np
+import pandas as pd
+from src.trades.trade import Trade
+from src.trades.figure_model import FigureModel
+from src.trades import graph_composer
+from src.data_handlers.historical_data_handler import PRICE_COLUMNS
+from src.data_handlers import serializer
+
+
+def create_trade(num_days=5):
+    """ Creates an open trade holding a few days of historical data and a figure drawn from it. """
+    dates = pd.date_range("2021-01-04", periods=num_days, name="date")
+    closes = np.linspace(10, 11, num_days)
+    historical_data = pd.DataFrame({column: closes for column in PRICE_COLUMNS}, index=dates)
+    figure = FigureModel({})
+    figure.add_trace("line", "scatter", dict(x=dates, y=closes))
+    return Trade(backtest_id=1, ticker="TEST", historical_data=historical_data, buy_date=dates[-1],
+                 buy_price=closes[-1], share_qty=10, investment_total=closes[-1] * 10, take_profit=closes[-1] * 1.02,
+                 stop_loss=closes[-1] * 0.99, triggered_indicators=[], figure=figure)
+
+
+def encoded_patch(trade, include_figure=True):
+    """ Builds a patch of the trade, as it is encoded in the request sent to the api. """
+    return json.loads(serializer.dumps(trade.build_patch(include_figure=include_figure)))
+
+
+def add_day(trade, close):
+    """ Appends a new day to the trade's historical data and figure, as is done each day by the trade handler. """
+    historical_data = trade.historical_data
+    date = historical_data.index[-1] + dt.timedelta(days=1)
+    new_row = pd.DataFrame({column: close for column in PRICE_COLUMNS}, index=pd.DatetimeIndex([date], name="date"))
+    trade.historical_data = pd.concat([historical_data, new_row])
+    fig = trade.figure
+    fig["line"].append(x=date, y=close)
+    trade.figure = fig
+    trade.current_price = close
+
+
+@pytest.mark.trade
+def test_patch_only_holds_what_changed():
+    trade = create_trade()
+    trade.mark_sent()
+    add_day(trade, 11.1)
+    patch = encoded_patch(trade)
+
+    assert patch['changes'] == {"current_price": 11.1} and patch['new_bars']['close'] == [11.1] \
+        and patch['figure_traces'] == [{"trace": 0, "extend": {"x": ["2021-01-09T00:00:00"], "y": [11.1]}}]
+
+
+@pytest.mark.trade
+def test_patch_is_empty_once_marked_sent():
+    trade = create_trade()
+    add_day(trade, 11.1)
+    trade.mark_sent()
+    patch = encoded_patch(trade)
+
+    assert patch['changes'] == {} and patch['new_bars']['date'] == [] and patch['figure_traces'] == []
+
+
+@pytest.mark.trade
+def test_patch_replaces_changed_traces():
+    trade = create_trade()
+    trade.mark_sent()
+    fig = trade.figure
+    fig["line"].set(y=fig["line"]['y'] * 2)
+    trade.figure = fig
+    patch = encoded_patch(trade)
+
+    assert list(patch['figure_traces'][0]['replace']) == ["y"] and "extend" not in patch['figure_traces'][0]
+
+
+@pytest.mark.trade
+def test_figure_is_left_out_when_rendered_on_request():
+    trade = create_trade()
+    trade.mark_sent(include_figure=False)
+    add_day(trade, 11.1)
+    patch = encoded_patch(trade, include_figure=False)
+
+    assert trade.to_JSON_serializable(include_figure=False)['figure'] is None and "figure_traces" not in patch \
+        and patch['changes'] == {"current_price": 11.1}
+
+
+@pytest.mark.trade
+def test_open_trade_graph_is_drawn_when_sent():
+    trade = create_trade()
+    trade.current_price = trade.take_profit
+    trade.figure_pct = graph_composer.open_trade_graph_pct(trade)
+
+    assert trade.to_JSON_serializable()['simpleFigure'] == graph_composer.draw_open_trade_graph(trade)[0] \
+        and trade.figure_pct == pytest.approx(1) and trade._payload_store.get(trade.payload_key, "simpleFigure") is None